@@ -5,7 +5,8 @@ __copyright__ = "Copyright 2020-2021, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
 import argparse
-from caliper.analysis import CaliperAnalyzer
+from caliper_analysis import GridAnalyzer
+from caliper_analysis.queue import run_workers
 import sys
 import os
 
@@ -18,6 +19,103 @@ def get_parser():
         dest="config",
         help="caliper.yaml with a Dockerfile template, and functions to run",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        help="number of grid cells to build and test at once (defaults to 1)",
+        default=1,
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        help="skip cells with a result that matches the current config, and only rerun stale tests",
+        default=False,
+    )
+    parser.add_argument(
+        "--keep-images",
+        dest="keep_images",
+        action="store_true",
+        help="keep built images so a resumed run can rerun tests without a build",
+        default=False,
+    )
+    parser.add_argument(
+        "--wheelhouse",
+        dest="wheelhouse",
+        help="directory to cache release files in (defaults to .caliper/wheelhouse)",
+    )
+    parser.add_argument(
+        "--wheel-index",
+        dest="wheel_index",
+        help="local directory with release files to use instead of downloading them",
+    )
+    parser.add_argument(
+        "--schedule",
+        dest="schedule",
+        choices=["grid", "bisect", "priority"],
+        help="run every cell (grid), only those needed to find where outcomes change (bisect), or every cell with the most informative first (priority)",
+        default="grid",
+    )
+    parser.add_argument(
+        "--budget",
+        dest="budget",
+        type=float,
+        help="seconds to run for, stopping before a round of cells expected to go over (only for bisect or priority)",
+    )
+    parser.add_argument(
+        "--test-mode",
+        dest="test_mode",
+        choices=["batch", "container", "exec"],
+        help="run all tests of a cell in one container (batch), a container per test, or exec each test in a warm container",
+        default="batch",
+    )
+    parser.add_argument(
+        "--capture-lines",
+        dest="capture_lines",
+        type=int,
+        help="lines from the start and end of test output and error to keep in results, 0 to keep all (defaults to 100)",
+        default=100,
+    )
+    parser.add_argument(
+        "--database",
+        dest="database",
+        help="SQLite database to also save results to (defaults to .caliper/results.db, or none with --publish)",
+    )
+    parser.add_argument(
+        "--no-database",
+        dest="no_database",
+        action="store_true",
+        help="only save results to json files",
+        default=False,
+    )
+    parser.add_argument(
+        "--queue",
+        dest="queue",
+        help="work queue directory (on shared storage) to --publish the grid to, or run a --worker on",
+    )
+    parser.add_argument(
+        "--publish",
+        dest="publish",
+        action="store_true",
+        help="publish the grid to the --queue for workers, instead of running it",
+        default=False,
+    )
+    parser.add_argument(
+        "--worker",
+        dest="worker",
+        action="store_true",
+        help="run cells from the --queue (with --jobs workers) until it is empty",
+        default=False,
+    )
+    parser.add_argument(
+        "--lease",
+        dest="lease",
+        type=int,
+        help="seconds before a cell claimed by a worker that stopped is requeued (defaults to 600)",
+        default=600,
+    )
     return parser
 
 
@@ -28,12 +126,51 @@ def main():
     # If an error occurs while parsing the arguments, the interpreter will exit with value 2
     args, extra = parser.parse_known_args()
 
+    if args.jobs < 1:
+        sys.exit("--jobs must be at least 1.")
+
+    if args.capture_lines < 0:
+        sys.exit("--capture-lines cannot be negative.")
+
+    if (args.publish or args.worker) and not args.queue:
+        sys.exit("A --queue directory is required to --publish or run a --worker.")
+
+    # A worker only needs the queue, each task has what is needed to run it
+    if args.worker:
+        run_workers(args.queue, nproc=args.jobs, lease=args.lease)
+        return
+
     if not args.config or not os.path.exists(args.config):
         sys.exit("A --config yaml file that exists on the filesystem is required.")
 
-    client = CaliperAnalyzer(args.config)
-    analyzer = client.get_analyzer()
-    analyzer.run_analysis()
+    analyzer = GridAnalyzer(args.config)
+    if args.publish:
+        analyzer.publish(
+            args.queue,
+            resume=args.resume,
+            keep_images=args.keep_images,
+            wheelhouse=args.wheelhouse,
+            wheel_index=args.wheel_index,
+            test_mode=args.test_mode,
+            database=False if args.no_database else args.database,
+            lease=args.lease,
+            capture_lines=args.capture_lines,
+        )
+        return
+
+    analyzer.run_analysis(
+        parallel=args.jobs > 1,
+        nproc=args.jobs,
+        resume=args.resume,
+        keep_images=args.keep_images,
+        wheelhouse=args.wheelhouse,
+        wheel_index=args.wheel_index,
+        schedule=args.schedule,
+        test_mode=args.test_mode,
+        database=False if args.no_database else args.database,
+        budget=args.budget,
+        capture_lines=args.capture_lines,
+    )
 
 
 if __name__ == "__main__":
@@ -9,6 +9,25 @@ from glob import glob
 from caliper.utils.file import read_json, write_json
 from caliper.metrics import MetricsExtractor
 from caliper.managers import PypiManager
+from caliper_analysis.apidiff import ApiTable
+from caliper_analysis.minhash import LSHIndex, MinHash, estimate_dice
+from caliper_analysis.store import parse_requirement
+from caliper_analysis.signatures import (
+    SignatureTable,
+    iter_functiondb,
+    levels,
+    load_signatures,
+)
+from caliper_analysis.similarity import (
+    SymbolTable,
+    dice_matrix,
+    get_incidence,
+    get_sims,
+    load_matrices,
+    save_matrices,
+    update_matrices,
+)
+import numpy
 import sys
 import os
 import re
@@ -35,6 +54,53 @@ def get_parser():
         help="package to extract changes for (defaults to tensorflow)",
         default="tensorflow",
     )
+    parser.add_argument(
+        "--approximate",
+        dest="approximate",
+        action="store_true",
+        help="estimate function similarity from a MinHash sketch of each version",
+        default=False,
+    )
+    parser.add_argument(
+        "--error",
+        dest="error",
+        type=float,
+        help="standard error of an estimated score with --approximate (defaults to 0.02)",
+        default=0.02,
+    )
+    parser.add_argument(
+        "--similar-to",
+        dest="similar_to",
+        help="only list versions with functions similar to this one (found with LSH)",
+    )
+    parser.add_argument(
+        "--threshold",
+        dest="threshold",
+        type=float,
+        help="function similarity for a version to be listed with --similar-to (defaults to 0.8)",
+        default=0.8,
+    )
+    parser.add_argument(
+        "--diff",
+        dest="diff",
+        action="store_true",
+        help="only compare adjacent versions, listing added, removed and changed functions",
+        default=False,
+    )
+    parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        help="only score pairs with a version that is new or changed since the last run",
+        default=False,
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="don't use (or save) the cache of encoded signatures for a --funcdb file",
+        default=False,
+    )
     return parser
 
 
@@ -71,130 +137,232 @@ def main():
     # If an error occurs while parsing the arguments, the interpreter will exit with value 2
     args, extra = parser.parse_known_args()
 
+    if args.error <= 0 or args.error >= 1:
+        sys.exit("--error must be between 0 and 1.")
+
+    # Signatures for a functiondb file are cached in the caliper directory
     dirname = os.path.abspath(args.dirname) if args.dirname else args.dirname
+    cache = None
+    if dirname and os.path.exists(dirname) and not args.no_cache:
+        cache = os.path.join(dirname, "cache")
+
+    # A query for similar versions only needs the function database
+    if args.similar_to:
+        find_similar(
+            args.funcdb,
+            args.package,
+            args.similar_to,
+            args.threshold,
+            args.error,
+            cache,
+        )
+        return
+
     if not dirname or not os.path.exists(dirname):
         sys.exit("A --dir directory folder with results is required.")
 
-    # Ensure input data directory exists
-    datadir = os.path.join(dirname, "data")
-    if not os.path.exists(datadir):
-        sys.exit("The data directory is missing from the caliper root folder.")
-
     # Create output directory
     outdir = os.path.join(dirname, "sims")
     if not os.path.exists(outdir):
         os.mkdir(outdir)
 
+    # A diff of adjacent versions only needs the function database
+    if args.diff:
+        extract_api_changes(outdir, args.funcdb, args.package)
+        return
+
+    # Ensure input data directory exists
+    datadir = os.path.join(dirname, "data")
+    if not os.path.exists(datadir):
+        sys.exit("The data directory is missing from the caliper root folder.")
+
     ## Step 1: extract requirements to assses change
     extract_requirements(datadir, outdir, args.package)
 
     ## Step 2: load in the function signatures to assess version changes
-    extract_function_changes(outdir, args.funcdb, args.package)
+    extract_function_changes(
+        outdir,
+        args.funcdb,
+        args.package,
+        args.approximate,
+        args.error,
+        cache,
+        args.incremental,
+    )
 
 
-def information_coefficient(total1, total2, intersect):
-    """a simple jacaard (information coefficient) to compare two lists of overlaps/diffs"""
-    total = total1 + total2
-    return 2.0 * intersect / total
+def iter_lookups(extractor, funcdb=None):
+    """Yield (version, lookup) for each version of the functiondb. A functiondb
+    file is read one version at a time, so we never hold the lookups for all
+    versions.
+    """
+    if funcdb:
+        if not os.path.exists(funcdb):
+            sys.exit("Function database file %s does not exist." % funcdb)
+        return iter_functiondb(os.path.abspath(funcdb))
+    return extractor.load_metric("functiondb").items()
 
 
-def get_functions(lookup, include_args=False):
-    """Given a dictionary with listings of functions and classes, return a
-    flattened list of functions, meaning when we encounter a dictionary (class)
-    we flatten out it's functions. We assume that there is only up to two
-    levels of nesting - from the top we have a class, and then a class can
-    have functions. If include args is True, a sorted list of arguments is
-    included in the signature.
+def get_signature_table(extractor, funcdb=None, cache=None):
+    """Get the encoded signatures for each version of the functiondb. For a
+    functiondb file and a cache directory, they are loaded from the cache
+    (keyed by the hash of the file) if there, and otherwise saved to it.
     """
-    # Yes, this code is horrific with ifs and fors, be strong and read it lol
-    funcs = []
-    for name, items in lookup.items():
-        for func, args in items.items():
-            # List indicates arguments for a function
-            if isinstance(args, list) and include_args:
-                funcs.append("%s.%s:%s" % (name, func, "-".join(sorted(args))))
-            elif isinstance(args, list) and not include_args:
-                funcs.append("%s.%s" % (name, func))
-            elif isinstance(args, dict):
-                for classfunc, classargs in args.items():
-                    if isinstance(classargs, list) and include_args:
-                        funcs.append(
-                            "%s.%s:%s" % (name, func, "-".join(sorted(classargs)))
-                        )
-                    elif isinstance(classargs, list) and not include_args:
-                        funcs.append("%s.%s.%s" % (name, func, classfunc))
-
-    return funcs
-
-
-def extract_function_changes(outdir, funcdb, package):
+    load = lambda: iter_lookups(extractor, funcdb)
+    if funcdb and cache:
+        if not os.path.exists(funcdb):
+            sys.exit("Function database file %s does not exist." % funcdb)
+        return load_signatures(funcdb, load, cache)
+    return SignatureTable.from_lookups(load())
+
+
+def extract_function_changes(
+    outdir,
+    funcdb,
+    package,
+    approximate=False,
+    error=0.02,
+    cache=None,
+    incremental=False,
+):
     """Given a functiondb file (a metric called functiondb served by caliper,
     with an extracted result for tensorflow) iterate over all combinations
-    and calculate the change score.
+    and calculate the change score. If approximate is True, the scores are
+    estimated from a MinHash sketch of each version, with a standard error
+    of at most error, and saved to a separate file. With a cache directory,
+    the encoded signatures for a functiondb file are cached there. A digest
+    of each version is saved with the scores, and if incremental is True,
+    we only score pairs with a version that is new or changed since, and
+    merge them into the scores from before (kept at full precision in a
+    state file, next to the float32 matrices for plotting).
     """
     # We don't need a manager since we aren't extracting from a repository
     extractor = MetricsExtractor("pypi:%s" % package)
-
-    if funcdb:
-        filename = os.path.abspath(funcdb)
-        if not os.path.exists(funcdb):
-            sys.exit("Function database file %s does not exist." % funcdb)
-        db = extractor.load_metric("functiondb", filename=filename)
-    else:
-        db = extractor.load_metric("functiondb")
+    table = get_signature_table(extractor, funcdb, cache)
+
+    name = extractor.manager.replace(":", "-")
+    if approximate:
+        name += "-approximate"
+    outfile = os.path.join(outdir, "%s-sims.json" % name)
+    digests_file = os.path.join(outdir, "%s-sims-versions.json" % name)
+    matrices_file = os.path.join(outdir, "%s-sims.npz" % name)
+    state_file = os.path.join(outdir, "%s-sims-state.npz" % name)
+
+    # Rows are the indices of versions to score (None for all of them), and
+    # the scores for other pairs are kept from the state of the last run
+    rows = None
+    if incremental and os.path.exists(digests_file) and os.path.exists(state_file):
+        digests = read_json(digests_file)
+        rows = table.get_changed(digests)
+        removed = set(digests) - set(table.versions)
+        print(
+            "%s new or changed and %s removed of %s versions"
+            % (len(rows), len(removed), len(table.versions))
+        )
+        if not rows and not removed and os.path.exists(outfile):
+            return outfile
 
     # Level 1 similarity: overall modules
     # Level 2 similarity: functions
     # Level 3 similarity: function arguments too
-    sims = {}
-
-    # First just compare functions that exist
-    for version1, db1 in db.items():
-        for version2, db2 in db.items():
-
-            # Dont' calculate it twice
-            scores = {}
-            key = "..".join(sorted([version1, version2]))
-
-            # Keep the user updated
-            if key in sims:
-                continue
-
-            # Diagonal is perfectly similar
-            if version1 == version2:
-                scores = {"module_sim": 1, "func_args_sim": 1, "func_sim": 1}
-                sims[key] = scores
-                continue
-
-            # Level 1: Overall module similarity
-            modules1 = set(db1.keys())
-            modules2 = set(db2.keys())
-            scores["module_sim"] = information_coefficient(
-                len(modules1), len(modules2), len(modules1.intersection(modules2))
-            )
+    # Each level is a version by signature incidence matrix, and the scores
+    # for all pairs come from one sparse product
+    matrices = get_function_matrices(table, approximate, error, rows)
+    if rows is not None:
+        updated = update_matrices(
+            table.versions, matrices, rows, *load_matrices(state_file)
+        )
+        if updated is None:
+            print("Scores from the last run are incomplete, scoring all pairs.")
+            matrices = get_function_matrices(table, approximate, error)
+        matrices = updated or matrices
+
+    write_json(get_sims(table.versions, matrices), outfile)
+    write_json(dict(zip(table.versions, table.digests)), digests_file)
+
+    # The same scores as a matrix for each level, to load without parsing
+    save_matrices(matrices_file, table.versions, matrices)
+
+    # And at full precision, so the next incremental run can update them (a
+    # state from before a full run would not match the digests)
+    if incremental:
+        save_matrices(state_file, table.versions, matrices, dtype=numpy.float64)
+    elif os.path.exists(state_file):
+        os.remove(state_file)
+    return outfile
 
-            # Level 2 and 3: Function and with args similarity
-            funcs1 = get_functions(db1, include_args=True)
-            funcs2 = get_functions(db2, include_args=True)
-            scores["func_args_sim"] = information_coefficient(
-                len(set(funcs1)),
-                len(set(funcs2)),
-                len(set(funcs1).intersection(set(funcs2))),
-            )
 
-            # Remove arguments and recalculate
-            funcs1 = [x.split(":")[0] for x in funcs1]
-            funcs2 = [x.split(":")[0] for x in funcs2]
-            scores["func_sim"] = information_coefficient(
-                len(set(funcs1)),
-                len(set(funcs2)),
-                len(set(funcs1).intersection(set(funcs2))),
-            )
-            sims[key] = scores
+def get_function_matrices(table, approximate=False, error=0.02, rows=None):
+    """Get the scores for each level of similarity, for rows (indices of
+    versions) against all versions, or for all pairs if rows is None. Scores
+    are estimated from MinHash sketches if approximate is True.
+    """
+    matrices = {}
+    minhash = MinHash(error)
+    for level in levels:
+        if approximate:
+            sketches = minhash.sketch_all(table.get_rows(level))
+            matrices[level] = estimate_dice(sketches, table.get_sizes(level), rows)
+            continue
+        matrices[level] = dice_matrix(table.get_incidence(level), rows)
+    return matrices
 
-    outfile = os.path.join(outdir, "%s-sims.json" % extractor.manager.replace(":", "-"))
-    write_json(sims, outfile)
-    return outfile
+
+def extract_api_changes(outdir, funcdb, package):
+    """Compare each pair of adjacent (sorted) versions of the functiondb, and
+    write the functions that were added, removed, or had their arguments
+    changed (by module) for each step to a json-lines file. This is one
+    comparison for each version, instead of all pairs.
+    """
+    extractor = MetricsExtractor("pypi:%s" % package)
+    table = ApiTable()
+    for version, lookup in iter_lookups(extractor, funcdb):
+        table.add(version, lookup)
+    name = extractor.manager.replace(":", "-")
+    return table.save(os.path.join(outdir, "%s-api-diff.jsonl" % name))
+
+
+def find_similar(funcdb, package, version, threshold=0.8, error=0.02, cache=None):
+    """Find the versions with functions similar to a version, without
+    comparing it to all of them. Versions that share an LSH bucket (for
+    their function sketches) with it are candidates, and those with an
+    estimated function similarity of at least threshold are printed, with
+    the estimate for each level.
+    """
+    extractor = MetricsExtractor("pypi:%s" % package)
+    table = get_signature_table(extractor, funcdb, cache)
+    if version not in table.versions:
+        sys.exit("%s is not a version in the function database." % version)
+
+    versions = table.versions
+    minhash = MinHash(error)
+    sketches = {level: minhash.sketch_all(table.get_rows(level)) for level in levels}
+    lsh = LSHIndex(versions, sketches["func_sim"], threshold)
+    i = versions.index(version)
+
+    rows = []
+    for candidate in lsh.candidates(version):
+        j = versions.index(candidate)
+        scores = {
+            level: float(estimate_dice(sketch[[i, j]])[0, 1])
+            for level, sketch in sketches.items()
+        }
+        if scores["func_sim"] >= threshold:
+            rows.append((candidate, scores))
+
+    rows.sort(key=lambda x: x[1]["func_sim"], reverse=True)
+    print("version\tfunc_sim\tfunc_args_sim\tmodule_sim")
+    for candidate, scores in rows:
+        print(
+            "%s\t%.3f\t%.3f\t%.3f"
+            % (
+                candidate,
+                scores["func_sim"],
+                scores["func_args_sim"],
+                scores["module_sim"],
+            )
+        )
+    return rows
 
 
 def extract_requirements(datadir, outdir, package):
@@ -203,7 +371,7 @@ def extract_requirements(datadir, outdir, package):
     requirements (to see change between version) for a package and have this
     say something about the parent package, but this seems more complicated.
     """
-    # Keep a lookup of requirements.txt to compare across
+    # Keep a lookup of requirements.txt to compare across, by uid
     requirements = {}
 
     # Read in input files, organize by python version, tensorflow version
@@ -214,54 +382,37 @@ def extract_requirements(datadir, outdir, package):
             continue
 
         # Only include those we have requirements for (meaning success install)
+        # Each is parsed once into a (name, version) pair, ignoring casing
         result = read_json(filename)
         if "requirements.txt" in result:
-            requirements[filename] = [
-                x.strip().lower() for x in result["requirements.txt"]
-            ]
+            uid = os.path.basename(filename).rstrip(".json")
+            requirements[uid] = set(
+                parse_requirement(x.strip().lower()) for x in result["requirements.txt"]
+            )
 
     # Level 1 similarity: overall modules
     # Level 2 similarity: modules and version string
-    sims = {}
-
-    # First just compare functions that exist
-    for filename1, modules1 in requirements.items():
-        for filename2, modules2 in requirements.items():
-
-            uid1 = os.path.basename(filename1).rstrip(".json")
-            uid2 = os.path.basename(filename2).rstrip(".json")
-
-            # Dont' calculate it twice
-            scores = {}
-            key = "..".join(sorted([uid1, uid2]))
-            if key in sims:
-                continue
-
-            # Diagonal is perfectly similar
-            if uid1 == uid2:
-                scores = {"module_sim": 1, "module_version_sim": 1}
-                sims[key] = scores
-                continue
-
-            # Level 1: Module and version similarity
-            modules1 = set(modules1)
-            modules2 = set(modules2)
-            scores["module_version_sim"] = information_coefficient(
-                len(modules1), len(modules2), len(modules1.intersection(modules2))
-            )
-
-            # Level 2: Don't include versions, ignore casing
-            funcs1 = [re.split("(==|@)", x)[0].strip().lower() for x in modules1]
-            funcs2 = [re.split("(==|@)", x)[0].strip().lower() for x in modules2]
-            scores["module_sim"] = information_coefficient(
-                len(set(funcs1)),
-                len(set(funcs2)),
-                len(set(funcs1).intersection(set(funcs2))),
-            )
-            sims[key] = scores
+    labels = list(requirements)
+    pairs = SymbolTable()
+    names = SymbolTable()
+    matrices = {
+        "module_version_sim": get_incidence(
+            [pairs.encode(x) for x in requirements.values()]
+        ),
+        "module_sim": get_incidence(
+            [names.encode(name for name, _ in x) for x in requirements.values()]
+        ),
+    }
+    matrices = {level: dice_matrix(x) for level, x in matrices.items()}
+    sims = get_sims(labels, matrices)
 
     outfile = os.path.join(outdir, "pypi-%s-requirements-sims.json" % package)
     write_json(sims, outfile)
+    save_matrices(
+        os.path.join(outdir, "pypi-%s-requirements-sims.npz" % package),
+        labels,
+        matrices,
+    )
     return outfile
 
 
@@ -7,9 +7,11 @@ __license__ = "MPL 2.0"
 import argparse
 from distutils.version import StrictVersion
 from caliper.utils.file import read_json
+from caliper_analysis.similarity import load_matrices
 
 import sys
 import matplotlib.pyplot as plt
+import numpy
 import os
 import re
 import pandas
@@ -20,7 +22,7 @@ def get_parser():
     parser.add_argument(
         "--filename",
         dest="filename",
-        help="path to the file with similarity scores to plot.",
+        help="path to the file with similarity scores to plot (json, or npz matrices).",
     )
     parser.add_argument(
         "--package",
@@ -61,40 +63,10 @@ def main():
     if not args.outdir or not os.path.exists(args.outdir):
         sys.exit("The output directory %s does not exist" % args.outdir)
 
-    sims = read_json(filename)
-
-    # First derive list of labels for rows and columns
-    labels = set()
-    for key in sims:
-        label1, label2 = key.split(
-            ".."
-        )  # important, other libraries should use .. in case - is part of the version
-        if re.search("(rc|a|b)", label1) or re.search("(rc|a|b)", label2):
-            continue
-        labels.add(label1)
-        labels.add(label1)
-
-    # Versions need to be sorted by version, not string
-    # For now we will remove the release candidtes
-
-    labels = list(labels)
-    try:
-        labels.sort(key=StrictVersion)
-    except:
-        labels.sort()
-
-    # Next create a data frame for each
-    dfs = {
-        x: pandas.DataFrame(index=labels, columns=labels)
-        for x in sims[list(sims.keys())[0]].keys()
-    }
-    for pair, values in sims.items():
-        label1, label2 = pair.split("..")
-        if re.search("(rc|a|b)", label1) or re.search("(rc|a|b)", label2):
-            continue
-        for key, value in values.items():
-            dfs[key].loc[label1, label2] = value
-            dfs[key].loc[label2, label1] = value
+    if filename.endswith(".npz"):
+        labels, dfs = load_frames(filename)
+    else:
+        labels, dfs = read_frames(filename)
 
     # Create output directory
     outdir = os.path.join(args.outdir, "plots")
@@ -144,6 +116,72 @@ def main():
             plt.savefig(outfile, dpi=300)
 
 
+def read_frames(filename):
+    """Read similarity scores from json, and return the sorted labels and a
+    data frame for each metric.
+    """
+    sims = read_json(filename)
+
+    # First derive list of labels for rows and columns
+    labels = set()
+    for key in sims:
+        label1, label2 = key.split(
+            ".."
+        )  # important, other libraries should use .. in case - is part of the version
+        if re.search("(rc|a|b)", label1) or re.search("(rc|a|b)", label2):
+            continue
+        labels.add(label1)
+        labels.add(label1)
+
+    # Versions need to be sorted by version, not string
+    # For now we will remove the release candidtes
+
+    labels = list(labels)
+    try:
+        labels.sort(key=StrictVersion)
+    except:
+        labels.sort()
+
+    # Next create a data frame for each
+    dfs = {
+        x: pandas.DataFrame(index=labels, columns=labels)
+        for x in sims[list(sims.keys())[0]].keys()
+    }
+    for pair, values in sims.items():
+        label1, label2 = pair.split("..")
+        if re.search("(rc|a|b)", label1) or re.search("(rc|a|b)", label2):
+            continue
+        for key, value in values.items():
+            dfs[key].loc[label1, label2] = value
+            dfs[key].loc[label2, label1] = value
+
+    return labels, dfs
+
+
+def load_frames(filename):
+    """Load the matrix for each metric from an npz file, and return the sorted
+    labels and a data frame for each metric.
+    """
+    names, matrices = load_matrices(filename)
+
+    # Release candidates (and a/b) are removed, as for json
+    labels = [x for x in names if not re.search("(rc|a|b)", x)]
+    try:
+        labels.sort(key=StrictVersion)
+    except:
+        labels.sort()
+
+    lookup = {x: i for i, x in enumerate(names)}
+    index = numpy.array([lookup[x] for x in labels], dtype=int)
+    dfs = {
+        name: pandas.DataFrame(
+            matrix[numpy.ix_(index, index)], index=labels, columns=labels
+        )
+        for name, matrix in matrices.items()
+    }
+    return labels, dfs
+
+
 ## TODO: subtract matrices to see difference
 
 if __name__ == "__main__":
@@ -99,6 +99,25 @@ def main():
     results = parse_tests(dirname, outdir, args.package)
 
 
+def get_entry(entry, build):
+    """Tag an entry for a test with a status: passed or failed if it ran, or
+    skipped (with a cause) if it did not, so a test that was skipped because
+    of a failed build (or a shared layer) can be told from one that ran and
+    failed. Results from before there was a status are tagged by return value,
+    and a test that did not run has a return value of -1.
+    """
+    if entry is None:
+        cause = build.get("cause")
+        if not cause:
+            cause = "not-run" if str(build.get("retval")) == "0" else "build"
+        return {"retval": -1, "status": "skipped", "cause": cause}
+    if entry.get("status") == "skipped":
+        entry["retval"] = -1
+    elif "status" not in entry:
+        entry["status"] = "passed" if str(entry.get("retval")) == "0" else "failed"
+    return entry
+
+
 def parse_tests(dirname, outdir, package):
     """Assemble all tests results into one large data structure. This will
     be too large to load into the browser at once, but should be okay for Flask.
@@ -156,12 +175,10 @@ def parse_tests(dirname, outdir, package):
 
             # Make sure we have all tests, ordered the same, -1 indicates not run
             result_tests = result.get("tests", [])
+            build = result_tests.get("build", {})
             test_list = []
             for test in tests:
-                if test in result_tests:
-                    entry = result_tests[test]
-                else:
-                    entry = {"retval": -1}
+                entry = get_entry(result_tests.get(test), build)
 
                 # y axis will be tensorflow version, x axis will be test name
                 entry["x_name"] = test
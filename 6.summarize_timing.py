@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import argparse
+from caliper.utils.file import read_json, write_json, mkdir_p
+
+import sys
+from glob import glob
+import os
+import re
+
+# Phases in the order they happen for a grid cell, after the base image is
+# pulled and the shared layers for its Python version are built
+phases = [
+    "shared_pull",
+    "shared_build",
+    "fetch",
+    "pull",
+    "build",
+    "pip_install",
+    "container_start",
+    "freeze",
+    "tests",
+    "other",
+    "total",
+]
+
+# Phases that are part of another (the pip install is part of the build), and
+# the total of a cell has all of its phases (but not the shared ones)
+nested = {"pip_install": "build"}
+cell_phases = ["fetch", "pull", "build", "container_start", "freeze", "tests"]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Caliper Timing Summary")
+    parser.add_argument(
+        "--package",
+        dest="package",
+        help="package on pypi to summarize (should correspond to result files)",
+        default="tensorflow",
+    )
+    parser.add_argument(
+        "-n",
+        "--top",
+        dest="top",
+        type=int,
+        help="number of slowest tests and cells to show (defaults to 10)",
+        default=10,
+    )
+    parser.add_argument(
+        "-d",
+        "--dir",
+        dest="dirname",
+        help="path to root caliper directory with results (defaults to .caliper)",
+        default=".caliper",
+    )
+    return parser
+
+
+def iter_files(dirname, package):
+    """A helper function to iterate over result files (and skip others)"""
+    # regular expression to identify raw result files
+    result_regex = (
+        "pypi-%s-(?P<tfversion>.+)-python-cp(?P<pversion>[0-9]+)[.]json" % package
+    )
+
+    for filename in glob("%s/*" % dirname):
+        # Skip over non result files
+        if not re.search(result_regex, filename):
+            continue
+        yield filename
+
+
+def main():
+    """main entrypoint for the timing summary"""
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+
+    dirname = os.path.abspath(args.dirname) if args.dirname else args.dirname
+    if not dirname or not os.path.exists(dirname):
+        sys.exit("A --dir directory folder with results is required.")
+
+    summary = summarize_timing(dirname, args.package, args.top)
+    print_summary(summary)
+
+    outdir = os.path.join(dirname, "compiled")
+    mkdir_p(outdir)
+    outfile = os.path.join(outdir, "timing-summary.json")
+    write_json(summary, outfile)
+    print("Summary written to %s" % outfile)
+
+
+def summarize_timing(dirname, package, top=10):
+    """Summarize the timing saved in each result, including the total, mean
+    and max seconds for each phase, and the slowest cells and tests (with
+    the cpu seconds and peak memory for each test).
+    """
+    seconds = {phase: [] for phase in phases}
+    cells = []
+    tests = []
+    missing = 0
+
+    for filename in iter_files(os.path.join(dirname, "data"), package):
+        result = read_json(filename)
+        name = os.path.basename(filename).replace(".json", "")
+
+        # Older results (or cells without a build) don't have timing
+        timing = result.get("timing")
+        if not timing:
+            missing += 1
+            continue
+        for phase in phases:
+            if timing.get(phase) is not None:
+                seconds[phase].append(timing[phase])
+
+        # The rest of the total (e.g., saving the result and removing the image)
+        if timing.get("total") is not None:
+            phase_seconds = sum(timing.get(phase) or 0 for phase in cell_phases)
+            seconds["other"].append(round(max(timing["total"] - phase_seconds, 0), 2))
+        cells.append({"name": name, "seconds": timing.get("total") or 0})
+
+        for test, entry in result.get("tests", {}).items():
+            if test == "build" or entry.get("seconds") is None:
+                continue
+            tests.append(
+                {
+                    "name": name,
+                    "test": test,
+                    "seconds": entry["seconds"],
+                    "cpu_seconds": entry.get("cpu_seconds"),
+                    "max_rss_kb": entry.get("max_rss_kb"),
+                    "retval": entry.get("retval"),
+                }
+            )
+
+    summary = {"cells": len(cells), "missing": missing, "phases": {}}
+    for phase, values in seconds.items():
+        if not values:
+            continue
+        summary["phases"][phase] = {
+            "count": len(values),
+            "total": round(sum(values), 2),
+            "mean": round(sum(values) / len(values), 2),
+            "max": max(values),
+        }
+    summary["slowest_cells"] = sorted(cells, key=lambda x: -x["seconds"])[:top]
+    summary["slowest_tests"] = sorted(tests, key=lambda x: -x["seconds"])[:top]
+    summary["largest_tests"] = sorted(
+        [x for x in tests if x["max_rss_kb"] is not None],
+        key=lambda x: -x["max_rss_kb"],
+    )[:top]
+    return summary
+
+
+def print_summary(summary):
+    """Print a summary of timing to the terminal. The percent is only for the
+    phases that don't overlap (shared, the phases of a cell, and the rest of
+    its total), so they add up to 100. A nested phase is indented under the
+    phase it is part of, and it and the total have no percent.
+    """
+    print("%s cells with timing, %s without" % (summary["cells"], summary["missing"]))
+    total = sum(
+        values["total"]
+        for phase, values in summary["phases"].items()
+        if phase not in nested and phase != "total"
+    )
+
+    print(
+        "\n%-18s %8s %12s %10s %10s %7s"
+        % ("phase", "count", "total", "mean", "max", "%")
+    )
+    for phase, values in summary["phases"].items():
+        percent = round(100 * values["total"] / total, 1) if total else 0
+        if phase in nested or phase == "total":
+            percent = ""
+        print(
+            "%-18s %8s %12s %10s %10s %7s"
+            % (
+                "  " + phase if phase in nested else phase,
+                values["count"],
+                values["total"],
+                values["mean"],
+                values["max"],
+                percent,
+            )
+        )
+
+    print("\nSlowest cells")
+    for cell in summary["slowest_cells"]:
+        print("%10s  %s" % (cell["seconds"], cell["name"]))
+
+    print("\nSlowest tests (seconds, cpu seconds, peak memory in MB)")
+    for test in summary["slowest_tests"]:
+        rss = test["max_rss_kb"]
+        print(
+            "%10s %10s %10s  %s %s"
+            % (
+                test["seconds"],
+                test["cpu_seconds"],
+                round(rss / 1024, 1) if rss is not None else None,
+                test["name"],
+                test["test"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import argparse
+from caliper.utils.file import read_json
+from caliper_analysis.store import ResultStore, result_regex
+
+import sys
+from glob import glob
+import os
+import re
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Caliper Results Import")
+    parser.add_argument(
+        "--package",
+        dest="package",
+        help="only import results for this package on pypi (defaults to all)",
+    )
+    parser.add_argument(
+        "-d",
+        "--dir",
+        dest="dirname",
+        help="path to root caliper directory with results (defaults to .caliper)",
+        default=".caliper",
+    )
+    parser.add_argument(
+        "--database",
+        dest="database",
+        help="SQLite database to import results into (defaults to results.db in --dir)",
+    )
+    return parser
+
+
+def main():
+    """main entrypoint for importing results"""
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+
+    dirname = os.path.abspath(args.dirname) if args.dirname else args.dirname
+    if not dirname or not os.path.exists(dirname):
+        sys.exit("A --dir directory folder with results is required.")
+
+    datadir = os.path.join(dirname, "data")
+    if not os.path.exists(datadir):
+        sys.exit("The data directory is missing from the caliper root folder.")
+
+    database = args.database or os.path.join(dirname, "results.db")
+    store = ResultStore(database)
+    count = 0
+    for filename in sorted(glob(os.path.join(datadir, "*.json"))):
+        match = re.search(result_regex, os.path.basename(filename))
+        if not match or (args.package and match["package"] != args.package):
+            continue
+        store.add_result(read_json(filename), filename)
+        count += 1
+    store.close()
+    print("Imported %s results into %s" % (count, database))
+
+
+if __name__ == "__main__":
+    main()
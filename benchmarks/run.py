@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import argparse
+import importlib.util
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+sys.path.insert(0, root)
+
+from caliper.utils.file import mkdir_p, read_json, write_json
+from caliper_analysis.testrunner import get_retval
+from synthetic import generate_tree
+
+# Stages of the analysis, in the order they are run (a stage can use the
+# output of a stage before it)
+stages = ["requirements", "functions", "ground-truth", "plot"]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Caliper Analysis Benchmarks")
+    parser.add_argument(
+        "--sizes",
+        dest="sizes",
+        help="comma separated number of versions to benchmark (defaults to 50,500,2000)",
+        default="50,500,2000",
+    )
+    parser.add_argument(
+        "--pythons",
+        dest="pythons",
+        type=int,
+        help="number of Python versions for each version (defaults to 7)",
+        default=7,
+    )
+    parser.add_argument(
+        "--tests",
+        dest="tests",
+        type=int,
+        help="number of tests for each grid cell (defaults to 50)",
+        default=50,
+    )
+    parser.add_argument(
+        "--modules",
+        dest="modules",
+        type=int,
+        help="number of modules in the functiondb for each version (defaults to 20)",
+        default=20,
+    )
+    parser.add_argument(
+        "--functions",
+        dest="functions",
+        type=int,
+        help="number of functions in each module of the functiondb (defaults to 40)",
+        default=40,
+    )
+    parser.add_argument(
+        "--stages",
+        dest="stages",
+        help="comma separated stages to run (defaults to %s)" % ",".join(stages),
+        default=",".join(stages),
+    )
+    parser.add_argument(
+        "--timeout",
+        dest="timeout",
+        type=int,
+        help="seconds to allow for each stage (defaults to 1800)",
+        default=1800,
+    )
+    parser.add_argument(
+        "--workdir",
+        dest="workdir",
+        help="directory to generate synthetic trees in (kept, and reused if present)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        help="json file to write benchmark results to",
+    )
+    parser.add_argument(
+        "--baseline",
+        dest="baseline",
+        help="json file with earlier benchmark results to compare to",
+    )
+    parser.add_argument(
+        "--tolerance",
+        dest="tolerance",
+        type=float,
+        help="fraction that seconds or memory can grow over the baseline (defaults to 0.25)",
+        default=0.25,
+    )
+    parser.add_argument("--seed", dest="seed", type=int, default=0)
+    parser.add_argument("--stage", dest="stage", help=argparse.SUPPRESS)
+    parser.add_argument("--root", dest="root", help=argparse.SUPPRESS)
+    return parser
+
+
+def load_script(filename):
+    """Load one of the numbered analysis scripts as a module"""
+    name = os.path.basename(filename).split(".", 1)[-1].replace(".py", "")
+    spec = importlib.util.spec_from_file_location(name, os.path.join(root, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_stage(stage, dirname, package="tensorflow"):
+    """Run a stage of the analysis on a synthetic tree, in this process"""
+    datadir = os.path.join(dirname, "data")
+    outdir = os.path.join(dirname, "sims")
+    mkdir_p(outdir)
+
+    if stage == "requirements":
+        assess = load_script("2.assess_change.py")
+        assess.extract_requirements(datadir, outdir, package)
+
+    elif stage == "functions":
+        assess = load_script("2.assess_change.py")
+        funcdb = os.path.join(dirname, "functiondb", "functiondb-results.zip")
+        assess.extract_function_changes(outdir, funcdb, package)
+
+    elif stage == "ground-truth":
+        generate = load_script("5.generate_analysis_data.py")
+        mkdir_p(os.path.join(dirname, "compiled"))
+        generate.parse_tests(dirname, os.path.join(dirname, "plots"), package)
+
+    elif stage == "plot":
+        filename = os.path.join(outdir, "pypi-%s-sims.json" % package)
+        if not os.path.exists(filename):
+            sys.exit("%s is missing, run the functions stage first." % filename)
+        plot = load_script("3.plot_sims.py")
+        sys.argv = [
+            "3.plot_sims.py",
+            "--filename",
+            filename,
+            "--package",
+            package,
+            "--outdir",
+            dirname,
+        ]
+        plot.main()
+
+
+def time_stage(stage, dirname, timeout):
+    """Run a stage in a child process, so that we get the peak memory of the
+    stage alone, and return the seconds, cpu seconds and peak memory. A stage
+    that takes longer than the timeout is killed.
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), "--stage", stage]
+    env = os.environ.copy()
+    env["MPLBACKEND"] = "Agg"
+    error = tempfile.TemporaryFile()
+    start = time.time()
+    process = subprocess.Popen(
+        cmd + ["--root", dirname],
+        stdout=subprocess.DEVNULL,
+        stderr=error,
+        env=env,
+    )
+
+    # Poll so we can enforce the timeout and still get the resource usage
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.time() - start > timeout:
+            process.send_signal(signal.SIGKILL)
+            _, status, usage = os.wait4(process.pid, 0)
+            break
+        time.sleep(0.05)
+    process.returncode = retval = get_retval(status)
+    end = time.time()
+
+    error.seek(0)
+    result = {
+        "stage": stage,
+        "retval": retval,
+        "seconds": round(end - start, 2),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 2),
+        "max_rss_kb": usage.ru_maxrss,
+        "timeout": retval == -signal.SIGKILL,
+    }
+    if retval != 0:
+        result["error"] = error.read().decode("utf-8", "replace").splitlines()[-5:]
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Compare results to a baseline, returning a list of regressions for
+    stages that are slower (or use more memory) than allowed by the tolerance.
+    """
+    key = lambda x: (x["size"], x["pythons"], x["tests"], x["stage"])
+    previous = {key(x): x for x in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if not before or before["retval"] != 0:
+            continue
+        if result["retval"] != 0:
+            regressions.append(
+                "%s versions, %s: failed" % (result["size"], result["stage"])
+            )
+            continue
+        for metric in ["seconds", "max_rss_kb"]:
+            if result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(
+                    "%s versions, %s: %s went from %s to %s"
+                    % (
+                        result["size"],
+                        result["stage"],
+                        metric,
+                        before[metric],
+                        result[metric],
+                    )
+                )
+    return regressions
+
+
+def main():
+    """main entrypoint for caliper analysis benchmarks"""
+    parser = get_parser()
+
+    # If an error occurs while parsing the arguments, the interpreter will exit with value 2
+    args, extra = parser.parse_known_args()
+
+    # Internal: run a single stage (in the child process)
+    if args.stage:
+        return run_stage(args.stage, args.root)
+
+    selected = args.stages.split(",")
+    for stage in selected:
+        if stage not in stages:
+            sys.exit("%s is not a known stage, choose from %s" % (stage, stages))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="caliper-benchmarks-")
+    results = []
+    try:
+        for size in [int(x) for x in args.sizes.split(",")]:
+            dirname = os.path.join(
+                workdir,
+                "versions-%s-pythons-%s-tests-%s" % (size, args.pythons, args.tests),
+            )
+            if not os.path.exists(os.path.join(dirname, "data")):
+                print("Generating %s versions in %s" % (size, dirname))
+                generate_tree(
+                    dirname,
+                    "tensorflow",
+                    size,
+                    pythons=args.pythons,
+                    tests=args.tests,
+                    seed=args.seed,
+                    modules=args.modules,
+                    functions=args.functions,
+                )
+
+            for stage in selected:
+                result = time_stage(stage, dirname, args.timeout)
+                result.update(
+                    {"size": size, "pythons": args.pythons, "tests": args.tests}
+                )
+                results.append(result)
+                print(
+                    "%6s versions %-14s %10ss %10ss cpu %8s MB%s"
+                    % (
+                        size,
+                        stage,
+                        result["seconds"],
+                        result["cpu_seconds"],
+                        round(result["max_rss_kb"] / 1024, 1),
+                        (
+                            " (timeout)"
+                            if result["timeout"]
+                            else " (failed)" if result["retval"] else ""
+                        ),
+                    )
+                )
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        write_json({"results": results}, args.output)
+        print("Results written to %s" % args.output)
+
+    if args.baseline:
+        regressions = compare(results, read_json(args.baseline), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION %s" % regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+# Generate synthetic caliper trees (result files under .caliper/data and a
+# functiondb zip) that look like the output of 1.run_analysis.py and caliper,
+# so the analysis scripts can be benchmarked at a known size.
+
+from caliper.utils.file import mkdir_p
+
+import copy
+import json
+import os
+import random
+import zipfile
+
+python_versions = ["cp27", "cp35", "cp36", "cp37", "cp38", "cp39", "cp310"]
+
+
+def get_versions(count):
+    """Get a list of count versions that StrictVersion can sort"""
+    return ["1.%s.%s" % (i // 20, i % 20) for i in range(count)]
+
+
+def get_requirements(rand, version_index, count=40, drift=25):
+    """Get a pip freeze for a version. Packages are pinned to a version that
+    changes every drift versions, and a few come and go.
+    """
+    requirements = []
+    for i in range(count):
+        if (version_index // drift + i) % 7 == 0:
+            continue
+        release = (version_index + i * 3) // drift
+        requirements.append("package-%s==%s.%s.0\n" % (i, release // 10, release % 10))
+    if rand.random() < 0.1:
+        requirements.append("git+https://github.com/example/extra@main\n")
+    return requirements
+
+
+def get_result(rand, package, version, version_index, python_version, tests):
+    """Get a result for a cell of the grid, with a failed build for about one
+    in ten, and otherwise a result for each test.
+    """
+    name = "pypi-%s-%s-python-%s" % (package, version, python_version)
+    inputs = {
+        "dependency": package,
+        "version": version,
+        "python_version": python_version,
+        "name": name,
+        "tests": "\n".join(tests),
+    }
+    result = {"inputs": inputs}
+    if rand.random() < 0.1:
+        result["build_retval"] = 1
+        result["tests"] = {
+            "build": {"retval": 1, "error": ["ERROR: No matching distribution\n"]}
+        }
+        return result
+
+    result["tests"] = {"build": {"retval": 0}}
+    for i, test in enumerate(tests):
+        retval = 0 if (version_index + i) % 11 else 1
+        result["tests"][test] = {
+            "retval": retval,
+            "output": ["line %s of output\n" % x for x in range(rand.randint(0, 20))],
+            "error": ["Traceback (most recent call last):\n"] if retval else [],
+            "seconds": round(rand.random() * 10, 2),
+            "cpu_seconds": round(rand.random() * 8, 2),
+            "max_rss_kb": rand.randint(20000, 400000),
+        }
+    result["requirements.txt"] = get_requirements(rand, version_index)
+    result["timing"] = {
+        "pull": 0,
+        "build": round(rand.random() * 120, 2),
+        "pip_install": round(rand.random() * 60, 2),
+        "container_start": round(rand.random(), 2),
+        "freeze": round(rand.random(), 2),
+        "tests": round(
+            sum(
+                x.get("seconds", 0) for k, x in result["tests"].items() if k != "build"
+            ),
+            2,
+        ),
+    }
+    result["timing"]["total"] = round(sum(result["timing"].values()), 2)
+    return result
+
+
+def generate_results(root, package, versions, pythons=7, tests=50, seed=0):
+    """Write result files for each version and Python version to root/data,
+    returning the number of files written.
+    """
+    rand = random.Random(seed)
+    datadir = os.path.join(root, "data")
+    mkdir_p(datadir)
+    test_names = ["tensorflow_v1/test_%s.py" % i for i in range(tests)]
+    count = 0
+    for version_index, version in enumerate(versions):
+        for python_version in python_versions[:pythons]:
+            result = get_result(
+                rand, package, version, version_index, python_version, test_names
+            )
+            filename = os.path.join(datadir, "%s.json" % result["inputs"]["name"])
+            with open(filename, "w") as fd:
+                fd.write(json.dumps(result))
+            count += 1
+    return count
+
+
+def mutate_functions(rand, lookup, rate=0.02):
+    """Mutate a version of a functiondb lookup to derive the next version,
+    changing arguments for, adding and removing a fraction of functions.
+    """
+    lookup = copy.deepcopy(lookup)
+    for module, items in lookup.items():
+        for name in list(items):
+            if rand.random() > rate:
+                continue
+            choice = rand.random()
+            if isinstance(items[name], dict):
+                items[name]["method_%s" % rand.randint(0, 10**6)] = ["self"]
+            elif choice < 0.5:
+                items[name] = items[name] + ["arg%s" % rand.randint(0, 99)]
+            elif choice < 0.75:
+                del items[name]
+            else:
+                items["func_%s" % rand.randint(0, 10**6)] = ["x", "y"]
+    return lookup
+
+
+def generate_functiondb(filename, versions, modules=20, functions=40, seed=0):
+    """Write a functiondb zip (as caliper would extract it, with a single
+    functiondb-results.json) where each version is derived from the last.
+    """
+    rand = random.Random(seed)
+    lookup = {}
+    for m in range(modules):
+        module = "package.module%s" % m
+        lookup[module] = {}
+        for f in range(functions):
+            if f % 10 == 0:
+                lookup[module]["Class%s" % f] = {
+                    "method%s" % x: ["self", "a", "b"] for x in range(5)
+                }
+            else:
+                lookup[module]["func%s" % f] = ["arg%s" % x for x in range(f % 5)]
+
+    db = {}
+    for version in versions:
+        db[version] = lookup
+        lookup = mutate_functions(rand, lookup)
+
+    mkdir_p(os.path.dirname(os.path.abspath(filename)))
+    with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("functiondb-results.json", json.dumps(db))
+    return filename
+
+
+def generate_tree(root, package, count, pythons=7, tests=50, seed=0, **kwargs):
+    """Generate a synthetic caliper tree with count versions under root,
+    returning the path to the functiondb zip.
+    """
+    versions = get_versions(count)
+    generate_results(root, package, versions, pythons, tests, seed)
+    return generate_functiondb(
+        os.path.join(root, "functiondb", "functiondb-results.zip"),
+        versions,
+        seed=seed,
+        **kwargs
+    )
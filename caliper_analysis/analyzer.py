@@ -0,0 +1,488 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.analysis import CaliperPypiAnalyzer
+from caliper.analysis.workers import init_worker
+from caliper.managers import PypiManager
+from caliper.utils.file import read_file
+from caliper.utils.command import CommandRunner
+from caliper.logger import logger
+from jinja2 import Template
+from glob import glob
+from queue import Queue
+from .context import sweep_contexts
+from .fingerprint import get_fingerprint
+from .queue import WorkQueue
+from .schedule import BisectScheduler, PriorityScheduler, will_run
+from .tasks import (
+    analysis_task,
+    build_shared_layers,
+    get_shared_layers,
+    prune_images,
+    remove_container,
+)
+from .wheels import find_release
+
+import multiprocessing
+import os
+import re
+import time
+
+
+class GridAnalyzer(CaliperPypiAnalyzer):
+    """A Grid Analyzer is a Pypi analyzer that separates preparing the grid of
+    tasks (one per dependency version and Python version) from running them,
+    so the grid can be run serially or on a bounded pool of workers.
+    """
+
+    def _load_config(self, config_file):
+        """Load the config, and ensure we are given a pypi package."""
+        super()._load_config(config_file)
+        if not re.search("pypi", self.config["packagemanager"], re.IGNORECASE):
+            logger.exit(
+                "%s is not a supported package manager at this time."
+                % self.config["packagemanager"]
+            )
+
+    def get_helpers(self):
+        """Get the list of helper files (relative to the config) to add to
+        the build context with the tests, from patterns under helpers.
+        """
+        helpers = set()
+        for pattern in self.config.get("helpers") or []:
+            for filename in glob(os.path.join(self.config_dir, pattern)):
+                if os.path.isfile(filename):
+                    helpers.add(os.path.relpath(filename, self.config_dir))
+        return sorted(helpers)
+
+    def get_tasks(
+        self,
+        release_filter=None,
+        func=None,
+        force=False,
+        cleanup=False,
+        prune=True,
+        resume=False,
+        keep_images=False,
+        wheelhouse=None,
+        wheel_index=None,
+        test_mode="batch",
+        database=None,
+        capture_lines=100,
+    ):
+        """Prepare a task (function and params) for each cell of the grid,
+        keyed by the name of the result file. Each task carries a fingerprint
+        of the cell, so a resumed run can tell which results are current, and
+        the release file to install, fetched once into the wheelhouse, and
+        the result database (defaults to results.db in the output directory).
+        Only capture_lines lines from the start and end of the output and
+        error of a test are kept in a result (0 keeps all of them), and the
+        full logs are written to the logs folder of the output directory.
+        Build contexts are prepared in the wheelhouse, so the release file can
+        be hard linked into them (it is on the same filesystem), and removed
+        at the end of run_analysis.
+        """
+        # The release filter is a regular expression we use to find the correct
+        # platform / architecture. We select linux wheels and source
+        release_filter = release_filter or "(.*manylinux.*x86_64.*|[.]tar[.]gz)"
+        func = func or analysis_task
+
+        manager = PypiManager(self.dependency)
+        all_releases = manager.filter_releases(release_filter)
+        python_versions = sorted(manager.get_python_versions())
+        python_version_regex = "(%s)" % "|".join(self.python_versions)
+
+        # Read in the template, populate with each deps version
+        template = Template(read_file(self.dockerfile, readlines=False))
+        tests = self.config.get("tests") or []
+        helpers = self.get_helpers()
+        wheelhouse = os.path.abspath(
+            wheelhouse or os.path.join(self.outdir, "wheelhouse")
+        )
+
+        # Results are also saved to a database, unless it is disabled (False)
+        if database is None:
+            database = os.path.join(self.outdir, "results.db")
+        database = os.path.abspath(database) if database else None
+
+        tasks = {}
+        for version, releases in all_releases.items():
+
+            # Check if the user has defined a set of versions
+            if self.test_versions and version not in self.test_versions:
+                continue
+
+            for python_version in python_versions:
+
+                # If the user has requested a subset of Python versions
+                if self.python_versions and not re.search(
+                    python_version_regex, python_version, re.IGNORECASE
+                ):
+                    continue
+
+                name = "%s-%s-%s-python-%s" % (
+                    self.name,
+                    self.dependency,
+                    version,
+                    python_version,
+                )
+                # Only schedule a build if there is a release file to install
+                release, reasons = find_release(releases, python_version)
+                if not release and not reasons:
+                    reasons = ["There is no release file for %s" % python_version]
+                spec = release or {}
+                wheel = None
+                if spec:
+                    wheel = {
+                        "url": spec["url"],
+                        "filename": spec["filename"],
+                        "sha256": spec.get("digests", {}).get("sha256"),
+                    }
+
+                # It's easier to pass the rendered template than all arguments for it
+                container_base = "python:%s" % ".".join(
+                    [x for x in python_version.lstrip("cp")]
+                )
+                result = template.render(
+                    base=container_base,
+                    filename=spec.get("url", ""),
+                    basename=spec.get("filename", ""),
+                    wheel=wheel is not None,
+                    **self.args
+                )
+                params = {
+                    "dependency": self.dependency,
+                    "version": version,
+                    "python_version": python_version,
+                    "outfile": os.path.join(self.data_dir, "%s.json" % name),
+                    "dockerfile": result,
+                    "base": container_base,
+                    "force": force,
+                    "exists": release is not None,
+                    "reasons": reasons,
+                    "name": name,
+                    "tests": "\n".join(tests),
+                    "helpers": helpers,
+                    "cleanup": cleanup,
+                    "prune": prune,
+                    "resume": resume,
+                    "test_mode": test_mode,
+                    "keep_image": keep_images,
+                    "fingerprint": get_fingerprint(
+                        version,
+                        python_version,
+                        result,
+                        tests,
+                        self.config_dir,
+                        helpers,
+                    ),
+                    "wheel": wheel,
+                    "wheelhouse": wheelhouse,
+                    "wheel_index": wheel_index,
+                    "database": database,
+                    "capture_lines": capture_lines,
+                    "logs_dir": os.path.join(self.outdir, "logs"),
+                    "context_dir": os.path.join(wheelhouse, "contexts"),
+                    "outdir": self.config_dir,
+                }
+                tasks[name] = (func, params)
+        return tasks
+
+    def run_analysis(
+        self,
+        release_filter=None,
+        nproc=None,
+        parallel=False,
+        show_progress=True,
+        func=None,
+        force=False,
+        cleanup=False,
+        resume=False,
+        keep_images=False,
+        wheelhouse=None,
+        wheel_index=None,
+        schedule="grid",
+        test_mode="batch",
+        database=None,
+        budget=None,
+        capture_lines=100,
+    ):
+        """Once the config is loaded, run the analysis. When parallel is True,
+        nproc workers each build and test one cell at a time. Pruning of
+        dangling images is deferred until all workers are done. With resume,
+        cells with a current result are skipped, and only stale tests rerun.
+        The schedule is "grid" to run every cell, or "bisect" to only run the
+        cells needed to find where outcomes change across versions, or
+        "priority" to run every cell in order of the information we expect
+        from it, where a worker that is free is given the cell with the
+        highest priority given the results so far. With a budget (in seconds)
+        we stop starting cells (or for bisect, rounds of cells) when the next
+        is expected to go over it. The grid schedule is a single round, so the
+        budget only applies to bisect and priority. The test mode is "batch"
+        to run all tests of a cell in one container, "container" to start a
+        container for each test, or "exec" to run each test with exec in a
+        warm container. Results are also saved to the database, unless it is
+        False. The output and error of a test are capped to
+        capture_lines from the start and end in the result.
+        """
+        if schedule not in ["grid", "bisect", "priority"]:
+            logger.exit("%s is not a known schedule." % schedule)
+        if test_mode not in ["batch", "container", "exec"]:
+            logger.exit("%s is not a known test mode." % test_mode)
+        if budget and schedule == "grid":
+            logger.warning("The grid schedule is one round, the budget is ignored.")
+
+        # prepare a command runner, check that docker is installed
+        runner = CommandRunner()
+        runner.run_command(["which", "docker"])
+        if runner.retval != 0:
+            logger.exit("Docker must be installed to build containers.")
+
+        tasks = self.get_tasks(
+            release_filter,
+            func=func,
+            force=force,
+            cleanup=cleanup,
+            prune=not parallel,
+            resume=resume,
+            keep_images=keep_images,
+            wheelhouse=wheelhouse,
+            wheel_index=wheel_index,
+            test_mode=test_mode,
+            database=database,
+            capture_lines=capture_lines,
+        )
+        # Cells without a release file to install (or that depend on shared
+        # layers that failed) are recorded right away
+        shared = self.check_shared_layers(tasks, force=force, resume=resume)
+        grid = dict(tasks)
+        pruned = [
+            name
+            for name, task in tasks.items()
+            if not task[1]["exists"] or task[1].get("failure")
+        ]
+        logger.info(
+            "%s cells have no compatible release file."
+            % len([name for name in pruned if not tasks[name][1]["exists"]])
+        )
+        for name in pruned:
+            func, params = tasks.pop(name)
+            func(**params)
+
+        if schedule == "priority":
+            scheduler = PriorityScheduler(grid, force=force, resume=resume)
+            results = self.run_priority(
+                tasks, scheduler, nproc, parallel, budget, show_progress
+            )
+        else:
+            rounds = BisectScheduler(tasks) if schedule == "bisect" else [list(tasks)]
+            results = self.run_rounds(
+                tasks, rounds, nproc, parallel, budget, show_progress
+            )
+
+        for container_name in shared:
+            remove_container(container_name, keep_images, prune=False)
+        if parallel:
+            prune_images(cleanup)
+
+        # Builds can share a context, so they are only removed once all are done
+        for context_dir in set(task[1]["context_dir"] for task in grid.values()):
+            sweep_contexts(context_dir)
+        return results
+
+    def check_shared_layers(self, tasks, force=False, resume=False):
+        """For each Python version, pull the base image and build the layers
+        shared by all of its cells (before the release is installed). If that
+        fails, every cell for the Python version is given the failure, so it
+        is recorded with the shared cause instead of failing the same way for
+        each version. Only cells that will run are checked. The seconds to
+        pull and build are split across the cells (as shared_timing), since
+        the build of each cell then finds them in the cache. Returns the names
+        of the shared images, to remove when we are done.
+        """
+        groups = {}
+        for name, task in tasks.items():
+            params = task[1]
+            if params["exists"] and will_run(params, force, resume):
+                groups.setdefault(params["python_version"], []).append(name)
+
+        images = []
+        for python_version, names in groups.items():
+            params = tasks[names[0]][1]
+
+            # A single cell doesn't share its install with another
+            dockerfiles = [tasks[name][1]["dockerfile"] for name in names]
+            if len(dockerfiles) == 1:
+                dockerfiles.append(dockerfiles[0].split("\n")[0])
+            container_name = "%s-shared:%s" % (self.dependency, python_version)
+            timing = {}
+            failure = build_shared_layers(
+                params["base"], get_shared_layers(dockerfiles), container_name, timing
+            )
+            images.append(container_name)
+            for name in names:
+                tasks[name][1]["shared_timing"] = {
+                    phase: round(seconds / len(names), 2)
+                    for phase, seconds in timing.items()
+                }
+            if not failure:
+                continue
+            logger.warning(
+                "%s failed for %s, %s cells will be recorded as failed."
+                % (failure["cause"], python_version, len(names))
+            )
+            for name in names:
+                tasks[name][1]["failure"] = failure
+        return images
+
+    def publish(
+        self,
+        queue,
+        release_filter=None,
+        force=False,
+        resume=False,
+        keep_images=False,
+        wheelhouse=None,
+        wheel_index=None,
+        test_mode="batch",
+        database=None,
+        lease=600,
+        capture_lines=100,
+    ):
+        """Publish the grid to a work queue (a directory on shared storage)
+        for workers to run, instead of running it here. Cells without a release
+        file are recorded right away, and cells with a result are skipped
+        (unless we force or resume). Paths in the tasks are absolute, so the
+        queue and output directory need to be at the same path on each host.
+        Since SQLite is not safe over network storage, results are only saved
+        to a database if one is given, and it should then be a path on the
+        local disk of each host (the stores can be merged after by importing
+        the json results with 7.import_results.py).
+        """
+        tasks = self.get_tasks(
+            release_filter,
+            force=force,
+            prune=False,
+            resume=resume,
+            keep_images=keep_images,
+            wheelhouse=wheelhouse,
+            wheel_index=wheel_index,
+            test_mode=test_mode,
+            database=database or False,
+            capture_lines=capture_lines,
+        )
+        for name in [name for name, task in tasks.items() if not task[1]["exists"]]:
+            func, params = tasks.pop(name)
+            func(**params)
+
+        cells = {
+            name: params
+            for name, (func, params) in tasks.items()
+            if force or resume or not os.path.exists(params["outfile"])
+        }
+        queue = WorkQueue(queue, lease=lease)
+        count = queue.publish(cells)
+        logger.info("Published %s of %s cells to %s" % (count, len(tasks), queue))
+        return queue
+
+    def run_rounds(
+        self, tasks, rounds, nproc=None, parallel=False, budget=None, show_progress=True
+    ):
+        """Run rounds of cells (names of tasks), where the next round can depend
+        on the results of the last (e.g., for bisect). With a budget (in
+        seconds) we don't start a round that we expect to go over it.
+        """
+        results = {}
+        start = time.time()
+        seconds = 0
+        for names in rounds:
+            if budget and time.time() - start + seconds > budget:
+                logger.info(
+                    "Stopping at the time budget of %s seconds, after %s cells."
+                    % (budget, len(results))
+                )
+                break
+            round_start = time.time()
+            subset = {name: tasks[name] for name in names}
+            results.update(self.run_tasks(subset, nproc, parallel, show_progress) or {})
+            seconds = time.time() - round_start
+        return results
+
+    def run_priority(
+        self,
+        tasks,
+        scheduler,
+        nproc=None,
+        parallel=False,
+        budget=None,
+        show_progress=True,
+    ):
+        """Run the cells of a priority scheduler on one pool of nproc workers
+        (or in serial), where each worker that is free is given the cell with
+        the highest priority, as updated from each result when it comes in. A
+        slow cell only holds up its own worker. With a budget (in seconds) we
+        stop starting cells when the next is expected to go over it.
+        """
+        results = {}
+        start = time.time()
+        total = len(scheduler.pending)
+        workers = (nproc or multiprocessing.cpu_count()) if parallel else 1
+        pool = multiprocessing.Pool(workers, init_worker) if parallel else None
+        finished = Queue()
+        running = started = 0
+        try:
+            while True:
+                while running < workers:
+                    item = scheduler.pop()
+                    if not item:
+                        break
+
+                    # Don't start a cell that we expect to go over the budget
+                    name, seconds = item
+                    if budget and time.time() - start + seconds > budget:
+                        logger.info(
+                            "Stopping at the time budget of %s seconds, after %s"
+                            " cells." % (budget, started)
+                        )
+                        scheduler.pending.clear()
+                        break
+                    started += 1
+                    if show_progress:
+                        logger.info("[%s/%s]: %s" % (started, total, name))
+                    func, params = tasks[name]
+                    if not parallel:
+                        finished.put((name, func(**params)))
+                    else:
+                        pool.apply_async(
+                            func,
+                            kwds=params,
+                            callback=lambda x, name=name: finished.put((name, x)),
+                            error_callback=lambda e, name=name: finished.put((name, e)),
+                        )
+                    running += 1
+                if not running:
+                    break
+
+                # Wait for a cell to finish, its result updates priorities
+                name, result = finished.get()
+                running -= 1
+                scheduler.finish(name)
+                if isinstance(result, BaseException):
+                    logger.warning("%s failed with %s" % (name, result))
+                    continue
+                results[name] = result
+        except KeyboardInterrupt:
+            if pool:
+                pool.terminate()
+            raise
+        if pool:
+            pool.close()
+            pool.join()
+        return results
+
+    def run_tasks(self, tasks, nproc=None, parallel=False, show_progress=True):
+        """Run a set of tasks in serial, or in parallel with nproc workers"""
+        if parallel:
+            return self._run_parallel(tasks, nproc, show_progress)
+        return self._run_serial(tasks, show_progress)
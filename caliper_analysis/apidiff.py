@@ -0,0 +1,122 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from .similarity import SymbolTable
+from .utils import version_key
+
+import json
+import numpy
+
+
+def iter_api(lookup):
+    """Given the functiondb lookup for one version, yield ((module, name), args)
+    for each function, where the name of a class function is Class.function,
+    and args is a tuple of its arguments (in order, since a reordered argument
+    can break a caller).
+    """
+    for module, items in lookup.items():
+        for func, args in items.items():
+            if isinstance(args, list):
+                yield (module, func), tuple(args)
+            elif isinstance(args, dict):
+                for classfunc, classargs in args.items():
+                    if isinstance(classargs, list):
+                        yield (module, "%s.%s" % (func, classfunc)), tuple(classargs)
+
+
+class ApiTable:
+    """An API Table keeps the functions of each version as two arrays: the
+    sorted IDs of their names (module and function), and the ID of the
+    arguments for each. Adjacent versions can then be compared with sorted
+    set operations, and only the functions that differ are decoded.
+    """
+
+    def __init__(self):
+        self.names = SymbolTable()
+        self.args = SymbolTable()
+        self.versions = {}
+
+    def __str__(self):
+        return "[api:%s]" % len(self.versions)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def add(self, version, lookup):
+        """Add the functions of a version, given its functiondb lookup"""
+        pairs = {
+            self.names.ids.setdefault(name, len(self.names)): self.args.ids.setdefault(
+                args, len(self.args)
+            )
+            for name, args in iter_api(lookup)
+        }
+        names = numpy.array(sorted(pairs), dtype=numpy.int64)
+        args = numpy.array([pairs[x] for x in names.tolist()], dtype=numpy.int64)
+        self.versions[version] = (names, args)
+
+    def get_versions(self):
+        """Get the versions, sorted by release (and not by string)"""
+        return sorted(self.versions, key=version_key)
+
+    def diff(self, version1, version2, names=None, args=None):
+        """Get the functions added, removed, and with changed arguments going
+        from version1 to version2, by module. The decoded names and args (a
+        list indexed by ID) can be provided to not derive them again.
+        """
+        names = names or list(self.names.ids)
+        args = args or list(self.args.ids)
+        names1, args1 = self.versions[version1]
+        names2, args2 = self.versions[version2]
+
+        common, index1, index2 = numpy.intersect1d(
+            names1, names2, assume_unique=True, return_indices=True
+        )
+        changed = args1[index1] != args2[index2]
+
+        modules = {}
+        counts = {"added": 0, "removed": 0, "changed": 0}
+
+        def add(kind, i, value):
+            modules.setdefault(names[i][0], {}).setdefault(kind, []).append(value)
+            counts[kind] += 1
+
+        for i in numpy.setdiff1d(names2, names1, assume_unique=True).tolist():
+            add("added", i, names[i][1])
+        for i in numpy.setdiff1d(names1, names2, assume_unique=True).tolist():
+            add("removed", i, names[i][1])
+        for i, j, k in zip(
+            common[changed].tolist(),
+            args1[index1][changed].tolist(),
+            args2[index2][changed].tolist(),
+        ):
+            add(
+                "changed",
+                i,
+                {"name": names[i][1], "from": list(args[j]), "to": list(args[k])},
+            )
+
+        for changes in modules.values():
+            for kind in ["added", "removed"]:
+                changes.get(kind, []).sort()
+            changes.get("changed", []).sort(key=lambda x: x["name"])
+
+        result = {"from": version1, "to": version2}
+        result.update(counts)
+        result["modules"] = {x: modules[x] for x in sorted(modules)}
+        return result
+
+    def iter_diffs(self):
+        """Yield the diff between each pair of adjacent (sorted) versions"""
+        versions = self.get_versions()
+        names = list(self.names.ids)
+        args = list(self.args.ids)
+        for version1, version2 in zip(versions, versions[1:]):
+            yield self.diff(version1, version2, names, args)
+
+    def save(self, filename):
+        """Write the diffs to a json-lines file, one line for each step"""
+        with open(filename, "w") as fd:
+            for diff in self.iter_diffs():
+                fd.write(json.dumps(diff) + "\n")
+        return filename
@@ -0,0 +1,24 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from .testrunner import get_log_path, get_log_prefix
+
+import os
+
+
+def get_prefix(logs, script):
+    """Get the log prefix for a test, if we have a logs directory"""
+    return get_log_prefix(logs, script) if logs else None
+
+
+def add_logs(entry, prefix, start):
+    """Add the paths to the logs of a test to its entry, if they were written.
+    Paths are relative to start, e.g., <cell>/<test>.output.gz from the logs
+    directory.
+    """
+    for stream_name in ["output", "error"]:
+        filename = get_log_path(prefix, stream_name)
+        if os.path.exists(filename):
+            entry["%s_log" % stream_name] = os.path.relpath(filename, start)
+    return entry
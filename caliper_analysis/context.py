@@ -0,0 +1,70 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.file import mkdir_p
+from .fingerprint import hash_content, hash_file
+
+import json
+import os
+import shutil
+import tempfile
+
+
+def link_file(source, dest):
+    """Hard link a file into place, falling back to a copy (e.g., if the
+    source is on a different filesystem).
+    """
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+    return dest
+
+
+def prepare_context(context_dir, files, digests=None):
+    """Prepare a minimal build context with only the files needed, a lookup
+    of relative paths in the context to files on the host. The context is
+    addressed by the hash of its content, so an identical context that is
+    still around is reused and not prepared again, and the name can label
+    the image. Files are hard linked, so this is cheap when context_dir is on
+    the same filesystem as the wheelhouse. Another build can be using the
+    same context, so contexts are only removed (with sweep_contexts) once
+    no build is running.
+    Digests for files that are already known (e.g., from the wheelhouse)
+    can be provided to avoid hashing large files again.
+    """
+    digests = digests or {}
+    manifest = sorted(
+        [relpath, digests.get(relpath) or hash_file(filename)]
+        for relpath, filename in files.items()
+    )
+    context = os.path.join(context_dir, hash_content(json.dumps(manifest)))
+    if os.path.exists(context):
+        return context
+
+    # Prepare in a temporary directory, and move into place when complete
+    mkdir_p(context_dir)
+    tmpdir = tempfile.mkdtemp(dir=context_dir, prefix=".context-")
+    for relpath, filename in files.items():
+        dest = os.path.join(tmpdir, relpath)
+        mkdir_p(os.path.dirname(dest))
+        link_file(filename, dest)
+    try:
+        os.rename(tmpdir, context)
+
+    # Another worker finished the same context first
+    except OSError:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return context
+
+
+def sweep_contexts(context_dir):
+    """Remove all build contexts (and any left half prepared) when no build is
+    running, so contexts (which are copies of the release file when it can't
+    be linked) don't pile up between runs.
+    """
+    if not os.path.isdir(context_dir):
+        return
+    for name in os.listdir(context_dir):
+        shutil.rmtree(os.path.join(context_dir, name), ignore_errors=True)
@@ -0,0 +1,86 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import hashlib
+import json
+import os
+
+# Causes of a failed build that say nothing about the cell (e.g., a network
+# or apt error), so a resumed run builds it again
+transient_causes = ["base-image", "shared-layer", "fetch"]
+
+
+def hash_content(content):
+    """Return the sha256 hex digest of a string (or bytes)"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_file(filename, chunk_size=1024 * 1024):
+    """Return the sha256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as fd:
+        for chunk in iter(lambda: fd.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_fingerprint(version, python_version, dockerfile, tests, root, helpers=None):
+    """Fingerprint a grid cell. The build fingerprint is derived from the
+    dependency version, Python version, rendered Dockerfile and any helpers,
+    and each test fingerprint from the build fingerprint, the test path and
+    its content (relative to the root of the build). A test that does not
+    exist is fingerprinted by path alone.
+    """
+    helpers = [[x, hash_file(os.path.join(root, x))] for x in helpers or []]
+    build = hash_content(json.dumps([version, python_version, dockerfile]))
+    if helpers:
+        build = hash_content(json.dumps([build, helpers]))
+    fingerprint = {"build": build, "tests": {}}
+    for test in tests:
+        filename = os.path.join(root, test)
+        content = hash_file(filename) if os.path.isfile(filename) else ""
+        fingerprint["tests"][test] = hash_content(json.dumps([build, test, content]))
+    return fingerprint
+
+
+def get_stale_tests(previous, fingerprint):
+    """Given a previous result and the fingerprint for the cell now, return
+    the list of tests that need to be run again. If the build itself is stale
+    (or the previous result has no fingerprint, or the build failed for a
+    transient cause like pulling the base image) return None, meaning the
+    cell needs to be redone entirely.
+    """
+    old = previous.get("inputs", {}).get("fingerprint")
+    if not old or old.get("build") != fingerprint["build"]:
+        return None
+
+    # A failure of the infrastructure is not a result for the cell
+    if get_build_cause(previous) in transient_causes:
+        return None
+
+    # A failed build does not depend on the tests
+    if build_failed(previous):
+        return []
+
+    results = previous.get("tests", {})
+    return [
+        test
+        for test, digest in fingerprint["tests"].items()
+        if test not in results or old.get("tests", {}).get(test) != digest
+    ]
+
+
+def build_failed(result):
+    """Determine if a result records a failed (or impossible) build"""
+    if result.get("build_retval") not in [None, 0]:
+        return True
+    retval = result.get("tests", {}).get("build", {}).get("retval")
+    return retval not in [0, "0"]
+
+
+def get_build_cause(result):
+    """Get the cause of a failed build (None if it passed, or has no cause)"""
+    return result.get("tests", {}).get("build", {}).get("cause")
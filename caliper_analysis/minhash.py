@@ -0,0 +1,192 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import math
+import numpy
+
+# Constants for the splitmix64 finalizer, which scrambles 64 bit integers
+golden = numpy.uint64(0x9E3779B97F4A7C15)
+mix1 = numpy.uint64(0xBF58476D1CE4E5B9)
+mix2 = numpy.uint64(0x94D049BB133111EB)
+empty = numpy.iinfo(numpy.uint64).max
+
+
+def mix64(values):
+    """Scramble an array of 64 bit integers (splitmix64), so that the hash of
+    an item is close to uniform no matter how the items were numbered.
+    """
+    with numpy.errstate(over="ignore"):
+        z = values.astype(numpy.uint64) + golden
+        z = (z ^ (z >> numpy.uint64(30))) * mix1
+        z = (z ^ (z >> numpy.uint64(27))) * mix2
+        return z ^ (z >> numpy.uint64(31))
+
+
+def get_sketch_size(error):
+    """Get the number of bins for a sketch where the standard error of an
+    estimated Dice coefficient is at most error. A Jaccard estimate from k
+    bins has a variance of J(1 - J) / k, and Dice is 2J / (1 + J), so the
+    standard error of Dice is at most 0.556 / sqrt(k) (at J of about 0.2).
+    """
+    if error <= 0 or error >= 1:
+        raise ValueError("The error bound must be between 0 and 1.")
+    return int(math.ceil((0.556 / error) ** 2))
+
+
+class MinHash:
+    """A MinHash sketches a set of items as the minimum hash in each of a
+    number of bins (one permutation hashing, where each item is hashed once
+    into one bin), with each empty bin filled from a bin that is not empty,
+    the first in a sequence of bins chosen by hashing the empty bin (optimal
+    densification). Unlike taking the next bin that is not empty, the bins
+    that borrow a value don't all borrow it from the same bin, so the error
+    stays within the bound for sets with fewer items than bins. The fraction
+    of bins where the sketches of two sets agree estimates their Jaccard
+    similarity, from which we get
+    Dice, so a version is a fixed size array no matter how many signatures
+    it has. Items that are encoded (an array of integer IDs) are used as
+    their own hash, and others are hashed with hash(), so their sketches are
+    only comparable within one run.
+    """
+
+    def __init__(self, error=0.02, seed=0):
+        self.error = error
+        self.size = get_sketch_size(error)
+        self.seed = numpy.uint64(seed)
+
+    def __str__(self):
+        return "[minhash:%s]" % self.size
+
+    def __repr__(self):
+        return self.__str__()
+
+    def sketch(self, items):
+        """Sketch a set of items (or encoded IDs), returning an array of size bins"""
+        sketch = numpy.full(self.size, empty, dtype=numpy.uint64)
+        if len(items) == 0:
+            return sketch
+        if isinstance(items, numpy.ndarray):
+            hashes = items.astype(numpy.int64)
+        else:
+            hashes = numpy.fromiter(
+                (hash(item) for item in items), dtype=numpy.int64, count=len(items)
+            )
+        hashes = mix64(hashes.view(numpy.uint64) ^ self.seed)
+        bins = (hashes % numpy.uint64(self.size)).astype(numpy.int64)
+        values = mix64(hashes)
+
+        # The minimum value in each bin
+        order = numpy.lexsort((values, bins))
+        filled, first = numpy.unique(bins[order], return_index=True)
+        sketch[filled] = values[order][first]
+        return self.densify(sketch, filled)
+
+    def densify(self, sketch, filled, attempts=64):
+        """Fill each empty bin of a sketch with the value of the first filled
+        bin in a sequence of bins from hashing the empty bin with a count (the
+        same for every set). The sequence is tried a number of attempts at a
+        time, since a small set can have many more empty bins than filled.
+        """
+        is_filled = numpy.zeros(self.size, dtype=bool)
+        is_filled[filled] = True
+        missing = numpy.flatnonzero(~is_filled)
+        start = 0
+        while len(missing):
+            counts = numpy.arange(start, start + attempts, dtype=numpy.uint64)
+            keys = (missing.astype(numpy.uint64) << numpy.uint64(32))[:, None] | counts
+            choices = mix64(keys ^ self.seed) % numpy.uint64(self.size)
+            choices = choices.astype(numpy.int64)
+            found = is_filled[choices]
+            done = found.any(axis=1)
+            first = found[done].argmax(axis=1)
+            sketch[missing[done]] = sketch[choices[done, first]]
+            missing = missing[~done]
+            start += attempts
+        return sketch
+
+    def sketch_all(self, sets):
+        """Sketch a list of sets, returning a matrix with a row for each"""
+        sketches = numpy.empty((len(sets), self.size), dtype=numpy.uint64)
+        for i, items in enumerate(sets):
+            sketches[i] = self.sketch(items)
+        return sketches
+
+
+def estimate_dice(sketches, sizes=None, rows=None):
+    """Estimate the Dice coefficient for all pairs of rows of a matrix of
+    sketches. Given the size of each set, pairs with an empty set have zero
+    (as for the exact score). If rows (indices) are provided, only return
+    the estimates for them, against all rows.
+    """
+    count = len(sketches)
+    if rows is None:
+        jaccard = numpy.eye(count)
+        for i in range(count - 1):
+            jaccard[i, i + 1 :] = (sketches[i] == sketches[i + 1 :]).mean(axis=1)
+        jaccard = numpy.triu(jaccard) + numpy.triu(jaccard, 1).T
+    else:
+        jaccard = numpy.empty((len(rows), count))
+        for k, i in enumerate(rows):
+            jaccard[k] = (sketches[i] == sketches).mean(axis=1)
+    dice = 2.0 * jaccard / (1.0 + jaccard)
+    if sizes is not None:
+        sizes = numpy.asarray(sizes)
+        dice[(sizes == 0) if rows is None else (sizes[rows] == 0), :] = 0
+        dice[:, sizes == 0] = 0
+    return dice
+
+
+def get_bands(size, threshold, miss=0.01):
+    """Get the number of bands (and rows in each) for locality sensitive
+    hashing of sketches of a size, such that a pair with a Dice coefficient
+    of threshold shares a bucket with a chance of at least 1 - miss, so pairs
+    at or above it are candidates. Of those, we take the most rows in a band,
+    so pairs well below the threshold are unlikely to be candidates.
+    """
+    jaccard = threshold / (2.0 - threshold)
+    best = (size, 1)
+    for rows in range(1, size + 1):
+        bands = size // rows
+        if 1 - (1 - jaccard**rows) ** bands >= 1 - miss:
+            best = (bands, rows)
+    return best
+
+
+class LSHIndex:
+    """An LSH (locality sensitive hashing) index splits each sketch into
+    bands of rows, and puts each version into a bucket for each band. The
+    versions that share a bucket with a version are candidates to be
+    similar to it, found without comparing it to every other version.
+    """
+
+    def __init__(self, labels, sketches, threshold=0.8):
+        self.labels = list(labels)
+        self.sketches = sketches
+        self.bands, self.rows = get_bands(sketches.shape[1], threshold)
+        self.buckets = [{} for _ in range(self.bands)]
+        for i, sketch in enumerate(sketches):
+            for band, key in enumerate(self.get_keys(sketch)):
+                self.buckets[band].setdefault(key, []).append(i)
+
+    def __str__(self):
+        return "[lsh:%sx%s]" % (self.bands, self.rows)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def get_keys(self, sketch):
+        """Get the bucket key of a sketch for each band"""
+        return [
+            sketch[band * self.rows : (band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def candidates(self, label):
+        """Get the labels of versions that share a bucket with a version"""
+        i = self.labels.index(label)
+        found = set()
+        for band, key in enumerate(self.get_keys(self.sketches[i])):
+            found.update(self.buckets[band].get(key, []))
+        found.discard(i)
+        return [self.labels[j] for j in sorted(found)]
@@ -0,0 +1,109 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.command import CommandRunner
+from caliper.logger import logger
+
+import re
+import time
+
+# Each test gets a fresh scratch directory (as TMPDIR) with /tmp/data in it
+scratch = "/tmp/caliper-scratch"
+prepare = (
+    'rm -rf %s /tmp/data && mkdir -p %s/data && ln -s %s/data /tmp/data && exec "$@"'
+    % (scratch, scratch, scratch)
+)
+
+
+class ContainerPool:
+    """A Container Pool keeps one warm container for each image, and runs a
+    test in it with docker exec, so a test does not pay to create and remove
+    a container. Before each test, the scratch directory and /tmp/data are
+    made again so tests don't see what another left behind. A container is
+    recycled (removed, and started again for the next test) after a test
+    fails or crashes, since it might be left in a bad state. The seconds
+    spent starting containers are kept for the timing of a cell. Volumes
+    (host:container) are mounted in each container that is started.
+    """
+
+    def __init__(self, volumes=None):
+        self.containers = {}
+        self.seconds = 0
+        self.volumes = volumes or []
+
+    def __str__(self):
+        return "[pool:%s]" % len(self.containers)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def get_name(self, image):
+        """Get a container name for an image (which can't have a :)"""
+        return "caliper-%s" % re.sub("[^a-zA-Z0-9_.-]", "-", image)
+
+    def get(self, image):
+        """Get the warm container for an image, starting it if needed. The
+        container runs a command that waits forever, until it is removed.
+        """
+        if image in self.containers:
+            return self.containers[image]
+        name = self.get_name(image)
+        runner = CommandRunner()
+        runner.run_command(["docker", "rm", "--force", name])
+        start = time.time()
+        cmd = ["docker", "run", "-d", "--rm", "--name", name]
+        for volume in self.volumes:
+            cmd += ["-v", volume]
+        runner.run_command(cmd + ["--entrypoint", "tail", image, "-f", "/dev/null"])
+        self.seconds = round(self.seconds + time.time() - start, 2)
+        if runner.retval != 0:
+            logger.warning("Cannot start a container for %s" % image)
+            return
+        self.containers[image] = name
+        return name
+
+    def get_command(self, image, cmd, interactive=False):
+        """Get the docker exec command to run a command in the warm container
+        for an image (in a fresh scratch directory), or None if it can't be
+        started. With interactive, stdin is passed on to the command.
+        """
+        name = self.get(image)
+        if not name:
+            return
+        return (
+            ["docker", "exec"]
+            + (["-i"] if interactive else [])
+            + ["-e", "TMPDIR=%s" % scratch, name, "sh", "-c", prepare, "sh"]
+            + cmd
+        )
+
+    def run(self, image, cmd, runner=None, **kwargs):
+        """Run a command in the warm container for an image (in a fresh
+        scratch directory), recycling the container if the command fails.
+        Returns the runner, with the output, error and return value. Any
+        other arguments are passed on to the runner.
+        """
+        runner = runner or CommandRunner()
+        cmd = self.get_command(image, cmd)
+        if not cmd:
+            runner.reset()
+            runner.retval = 1
+            runner.error = ["Cannot start a container for %s\n" % image]
+            return runner
+
+        runner.run_command(cmd, **kwargs)
+        if runner.retval != 0:
+            self.recycle(image)
+        return runner
+
+    def recycle(self, image):
+        """Remove the container for an image, so the next test starts another"""
+        name = self.containers.pop(image, None)
+        if name:
+            CommandRunner().run_command(["docker", "rm", "--force", name])
+
+    def close(self):
+        """Remove all containers in the pool"""
+        for image in list(self.containers):
+            self.recycle(image)
@@ -0,0 +1,247 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.file import mkdir_p, read_json
+from caliper.logger import logger
+from .tasks import analysis_task, prune_images
+from .utils import write_json_atomic
+
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+
+class WorkQueue:
+    """A Work Queue is a directory (e.g., on shared storage) with a file for
+    each task in pending, claimed, done or failed. A worker claims a task by
+    renaming it from pending to claimed, which only one worker can do, and
+    holds a lease on it for as long as it keeps touching the claimed file. A
+    claimed task whose lease has expired (the worker died) is put back in
+    pending, up to a maximum number of attempts. All state is in the
+    directory, so workers can come and go on any host that can see it.
+    Leases are checked against the time of the storage (not of the host),
+    so clock skew between hosts doesn't matter.
+    """
+
+    states = ["pending", "claimed", "done", "failed"]
+
+    def __init__(self, root, lease=600, max_attempts=3):
+        self.root = os.path.abspath(root)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        for state in self.states:
+            mkdir_p(os.path.join(self.root, state))
+
+    def __str__(self):
+        return "[queue:%s]" % self.root
+
+    def __repr__(self):
+        return self.__str__()
+
+    def get_path(self, state, name):
+        return os.path.join(self.root, state, "%s.json" % name)
+
+    def list(self, state):
+        """List the names of tasks in a state, in the order they were added"""
+        return sorted(
+            x[: -len(".json")]
+            for x in os.listdir(os.path.join(self.root, state))
+            if x.endswith(".json") and not x.startswith(".")
+        )
+
+    def counts(self):
+        return {state: len(self.list(state)) for state in self.states}
+
+    def publish(self, tasks):
+        """Add tasks (params keyed by name) to pending, prefixed with their
+        index so they are claimed in order. Tasks that are already in the
+        queue (in any state) are skipped. Returns the number added.
+        """
+        known = {
+            name.split("-", 1)[-1] for state in self.states for name in self.list(state)
+        }
+        count = 0
+        for i, (name, params) in enumerate(tasks.items()):
+            if name in known:
+                continue
+            task = {"name": name, "params": params, "attempts": 0}
+            write_json_atomic(task, self.get_path("pending", "%06d-%s" % (i, name)))
+            count += 1
+        return count
+
+    def claim(self, worker):
+        """Claim the next pending task, returning its name and the task (or
+        None if there are none). Another worker can win the rename, in which
+        case we try the next.
+        """
+        for name in self.list("pending"):
+            pending = self.get_path("pending", name)
+            claimed = self.get_path("claimed", name)
+
+            # Touch first, so the lease starts when the claimed file appears
+            try:
+                os.utime(pending)
+                os.rename(pending, claimed)
+            except FileNotFoundError:
+                continue
+
+            # The claimed file records who has it
+            task = read_json(claimed)
+            task["worker"] = worker
+            write_json_atomic(task, claimed)
+            return name, task
+        return None, None
+
+    def renew(self, name):
+        """Renew the lease on a claimed task, returning False if it was lost"""
+        try:
+            os.utime(self.get_path("claimed", name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def get_time(self):
+        """Get the time on the storage of the queue, from the modified time of
+        a probe file that we touch (with the same clock as the claimed files).
+        """
+        probe = os.path.join(
+            self.root, ".clock.%s-%s" % (socket.gethostname(), os.getpid())
+        )
+        with open(probe, "a"):
+            pass
+        try:
+            os.utime(probe)
+            return os.stat(probe).st_mtime
+        finally:
+            os.remove(probe)
+
+    def complete(self, name):
+        """Move a claimed task to done"""
+        try:
+            os.rename(self.get_path("claimed", name), self.get_path("done", name))
+        except FileNotFoundError:
+            logger.warning("%s was requeued before it finished." % name)
+
+    def fail(self, name, error, retry=True):
+        """Move a claimed task that errored back to pending to try again (if
+        retry is True, and it has attempts left) or else to failed, with the
+        error. Returns the state it was moved to (None if it was already
+        moved by another worker).
+        """
+        return self._release(name, "Task failed: %s" % error, retry)
+
+    def requeue_expired(self):
+        """Put claimed tasks with an expired lease back in pending, or in
+        failed if they have had all their attempts. Returns the number.
+        """
+        names = self.list("claimed")
+        now = self.get_time() if names else None
+        count = 0
+        for name in names:
+            try:
+                if now - os.stat(self.get_path("claimed", name)).st_mtime < self.lease:
+                    continue
+            except FileNotFoundError:
+                continue
+            if self._release(name, "Lease expired"):
+                count += 1
+        return count
+
+    def _release(self, name, reason, retry=True):
+        """Move a claimed task to pending (with an attempt used) or failed"""
+        claimed = self.get_path("claimed", name)
+
+        # Only one worker can move the task aside to release it
+        tmpfile = os.path.join(
+            self.root,
+            "claimed",
+            ".%s.%s-%s" % (name, socket.gethostname(), os.getpid()),
+        )
+        try:
+            os.rename(claimed, tmpfile)
+        except FileNotFoundError:
+            return
+
+        task = read_json(tmpfile)
+        task["attempts"] = task.get("attempts", 0) + 1
+        task["error"] = reason
+        state = "failed"
+        if retry and task["attempts"] < self.max_attempts:
+            state = "pending"
+        logger.warning(
+            "%s for %s (%s), moving to %s." % (reason, name, task.get("worker"), state)
+        )
+        write_json_atomic(task, self.get_path(state, name))
+        os.remove(tmpfile)
+        return state
+
+
+def run_worker(root, lease=600, poll=10, worker=None):
+    """Run tasks from a work queue until there are none pending or claimed.
+    While a task runs, a thread renews its lease. When nothing is pending
+    but tasks are claimed (by other workers) we wait, since a lease that
+    expires puts its task back. Returns the number of tasks run.
+    """
+    queue = WorkQueue(root, lease=lease)
+    worker = worker or "%s:%s:%s" % (
+        socket.gethostname(),
+        os.getpid(),
+        multiprocessing.current_process().name,
+    )
+    count = 0
+    while True:
+        queue.requeue_expired()
+        name, task = queue.claim(worker)
+        if not name:
+            if not queue.list("claimed"):
+                return count
+            time.sleep(poll)
+            continue
+
+        # Renew the lease until the task is done
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=renew_lease, args=(queue, name, done, max(lease / 3, 1))
+        )
+        heartbeat.start()
+        logger.info("[%s] running %s" % (worker, task["name"]))
+
+        # If the task errors, it is put back to try again, and if it exits
+        # (e.g., logger.exit for a missing argument) it would do so again
+        try:
+            analysis_task(**task["params"])
+        except Exception as e:
+            queue.fail(name, e)
+            continue
+        except SystemExit as e:
+            queue.fail(name, "exit with %s" % e.code, retry=False)
+            continue
+        finally:
+            done.set()
+            heartbeat.join()
+        queue.complete(name)
+        count += 1
+
+
+def renew_lease(queue, name, done, interval):
+    """Renew the lease on a task every interval, until done is set"""
+    while not done.wait(interval):
+        if not queue.renew(name):
+            return
+
+
+def run_workers(root, nproc=1, lease=600, cleanup=False):
+    """Run nproc workers on a work queue, and prune images when all are done
+    (a task from the queue does not prune, since other workers might be
+    building on the same host).
+    """
+    if nproc > 1:
+        with multiprocessing.Pool(nproc) as pool:
+            counts = pool.starmap(run_worker, [(root, lease)] * nproc)
+    else:
+        counts = [run_worker(root, lease)]
+    prune_images(cleanup)
+    return sum(counts)
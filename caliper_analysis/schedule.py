@@ -0,0 +1,261 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.file import read_json
+from .fingerprint import build_failed, get_stale_tests
+from .utils import version_key
+
+import heapq
+import math
+import os
+
+
+def get_outcomes(result):
+    """Given a result, return a lookup of the outcome for the build and each
+    test: "pass" or "fail", or "build" if the container could not be built.
+    """
+    tests = result.get("inputs", {}).get("tests") or ""
+    tests = [x for x in tests.split("\n") if x]
+    if build_failed(result):
+        outcomes = {test: "build" for test in tests}
+        outcomes["build"] = "fail"
+        return outcomes
+
+    outcomes = {"build": "pass"}
+    for test in tests:
+        entry = result.get("tests", {}).get(test)
+        if entry is not None:
+            outcomes[test] = "pass" if str(entry.get("retval")) == "0" else "fail"
+    return outcomes
+
+
+class BisectScheduler:
+    """A Bisect Scheduler orders the grid to find where outcomes change,
+    instead of running every cell. For each Python version, the versions of
+    the dependency are sorted, and the first and last are run. Any interval
+    where some test has a different outcome at each end is split in half, and
+    the middle is run in the next round, until each transition is between
+    two adjacent versions. An interval with the same outcomes at both ends is
+    assumed to be stable and is not run, so the number of builds per test
+    goes from the number of versions to its log. Iterating over the scheduler
+    yields the names of the tasks to run in each round.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.outcomes = {}
+
+        # Group task names by Python version, sorted by dependency version
+        self.groups = {}
+        for name, task in tasks.items():
+            params = task[1]
+            self.groups.setdefault(params["python_version"], []).append(name)
+        for names in self.groups.values():
+            names.sort(key=lambda name: version_key(tasks[name][1]["version"]))
+
+    def __str__(self):
+        return "[bisect-scheduler:%s]" % len(self.tasks)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __iter__(self):
+        """Yield rounds of task names to run, starting with the endpoints"""
+        intervals = []
+        endpoints = []
+        for python_version, names in self.groups.items():
+            endpoints += [names[0]] if len(names) == 1 else [names[0], names[-1]]
+            intervals.append((python_version, 0, len(names) - 1))
+
+        # The caller runs each round before asking for the next
+        yield endpoints
+
+        while intervals:
+            todo = []
+            remaining = []
+            for python_version, lo, hi in intervals:
+                names = self.groups[python_version]
+                if hi - lo <= 1 or not self.differs(names[lo], names[hi]):
+                    continue
+                mid = (lo + hi) // 2
+                todo.append(names[mid])
+                remaining += [(python_version, lo, mid), (python_version, mid, hi)]
+            intervals = remaining
+            if todo:
+                yield todo
+
+    def get_outcome(self, name):
+        """Get (and cache) the outcomes for a task from its result file"""
+        if name not in self.outcomes:
+            outfile = self.tasks[name][1]["outfile"]
+            if not os.path.exists(outfile):
+                return {}
+            self.outcomes[name] = get_outcomes(read_json(outfile))
+        return self.outcomes[name]
+
+    def differs(self, name1, name2):
+        """Determine if any test has a different outcome between two tasks. A
+        missing result is considered different, so the interval is explored.
+        """
+        outcomes1 = self.get_outcome(name1)
+        outcomes2 = self.get_outcome(name2)
+        if not outcomes1 or not outcomes2:
+            return True
+        tests = set(outcomes1).union(outcomes2)
+        return any(outcomes1.get(test) != outcomes2.get(test) for test in tests)
+
+
+def will_run(params, force=False, resume=False):
+    """Determine if a cell will be run (and not kept as is) by analysis_task,
+    given if we force or resume the run
+    """
+    if force or not os.path.exists(params["outfile"]):
+        return True
+    if not resume:
+        return False
+    previous = read_json(params["outfile"])
+    stale = get_stale_tests(previous, params["fingerprint"])
+    if stale is None or stale:
+        return True
+    tests = [x for x in (params.get("tests") or "").split("\n") if x]
+    return bool(set(previous.get("tests", {})) - set(tests) - {"build"})
+
+
+def entropy(p):
+    """The binary entropy (in bits) of an outcome with probability p"""
+    if p <= 0 or p >= 1:
+        return 0
+    return -p * math.log2(p) - (1 - p) * math.log2(1 - p)
+
+
+class PriorityScheduler(BisectScheduler):
+    """A Priority Scheduler runs every cell of the grid, but in the order of
+    the information we expect to get from each, given the outcomes we know
+    (from earlier runs in the data directory, or earlier rounds of this one).
+    For each Python version, the first and last versions are run first. Then
+    a cell between two known versions is expected to give, for each test, the
+    entropy of its outcome if we assume the chance of having the outcome of
+    the upper version grows linearly between them. Tests with the same outcome
+    at both ends only count for a fraction (stable), so cells next to a known
+    change go first, and cells in the middle of a long stable range go last.
+    Ties go to the cell expected to be faster (from the timing of neighbors).
+    A worker that is free can pop the cell with the highest priority, and
+    priorities change as each result comes in (see finish). Iterating over
+    the scheduler instead yields rounds of the batch size cells.
+    """
+
+    # How much an interval with the same outcome at both ends counts for
+    stable = 0.05
+
+    def __init__(self, tasks, batch_size=1, force=False, resume=False):
+        super().__init__(tasks)
+        self.batch_size = max(batch_size, 1)
+        self.timing = {}
+
+        # Only cells that will run are pending: cells with a current result,
+        # without a release file, or with a failure recorded for a shared layer
+        # only provide outcomes. A cell to run again has its old outcomes
+        # until the new result replaces them.
+        self.pending = {
+            name
+            for name, task in tasks.items()
+            if task[1]["exists"]
+            and not task[1].get("failure")
+            and will_run(task[1], force, resume)
+        }
+
+    def __str__(self):
+        return "[priority-scheduler:%s]" % len(self.tasks)
+
+    def __iter__(self):
+        """Yield rounds of task names to run, in order of priority"""
+        while self.pending:
+            queue = [
+                (-score, seconds, name)
+                for name, (score, seconds) in self.get_priorities().items()
+            ]
+            heapq.heapify(queue)
+            todo = [
+                heapq.heappop(queue)[-1]
+                for _ in range(min(self.batch_size, len(queue)))
+            ]
+            self.pending -= set(todo)
+
+            # The caller runs each round before asking for the next
+            yield todo
+            for name in todo:
+                self.finish(name)
+
+    def pop(self):
+        """Get the name of the pending cell with the highest priority (and the
+        seconds we expect it to take), or None if there are none left
+        """
+        priorities = self.get_priorities()
+        if not priorities:
+            return
+        name = min(priorities, key=lambda x: (-priorities[x][0], priorities[x][1], x))
+        self.pending.remove(name)
+        return name, priorities[name][1]
+
+    def finish(self, name):
+        """Given a cell that is done, forget what we read for it, so its
+        outcomes and timing are read from the new result file.
+        """
+        self.outcomes.pop(name, None)
+        self.timing.pop(name, None)
+
+    def get_seconds(self, name):
+        """Get (and cache) the seconds a cell took from its result file"""
+        if name not in self.timing:
+            outfile = self.tasks[name][1]["outfile"]
+            seconds = None
+            if os.path.exists(outfile):
+                seconds = (read_json(outfile).get("timing") or {}).get("total")
+            self.timing[name] = seconds
+        return self.timing[name]
+
+    def get_priorities(self):
+        """Get the expected information (and seconds) for each pending cell"""
+        priorities = {}
+        for names in self.groups.values():
+            known = [i for i, name in enumerate(names) if self.get_outcome(name)]
+            for i, name in enumerate(names):
+                if name not in self.pending:
+                    continue
+                lo = max([x for x in known if x < i], default=None)
+                hi = min([x for x in known if x > i], default=None)
+                priorities[name] = self.get_priority(names, i, lo, hi)
+        return priorities
+
+    def get_priority(self, names, i, lo, hi):
+        """Get the expected information for running the cell at index i of
+        a group, between the known cells lo and hi (None if there are none),
+        and the seconds we expect it to take.
+        """
+        tests = self.tasks[names[i]][1].get("tests") or ""
+        tests = ["build"] + [x for x in tests.split("\n") if x]
+
+        # The ends of the group anchor every interval, so they go first (unless
+        # we know them from before), and until we know them, the middle of the
+        # group is the best guess
+        if lo is None or hi is None:
+            if i in [0, len(names) - 1] and not self.get_outcome(names[i]):
+                return len(tests) + 1, 0
+            return self.stable * entropy(i / (len(names) - 1)), 0
+
+        outcomes1 = self.get_outcome(names[lo])
+        outcomes2 = self.get_outcome(names[hi])
+        information = entropy((i - lo) / (hi - lo))
+        score = 0
+        for test in tests:
+            if outcomes1.get(test) != outcomes2.get(test):
+                score += information
+            else:
+                score += self.stable * information
+
+        known = [
+            x for x in [self.get_seconds(names[lo]), self.get_seconds(names[hi])] if x
+        ]
+        seconds = sum(known) / len(known) if known else 0
+        return round(score, 6), seconds
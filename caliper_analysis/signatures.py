@@ -0,0 +1,332 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.file import mkdir_p, read_json, write_json
+from .fingerprint import hash_content, hash_file
+from .similarity import SymbolTable, get_incidence
+
+import io
+import json
+import numpy
+import os
+import shutil
+import tempfile
+import zipfile
+
+# The levels of similarity, each a set of signatures for a version
+levels = ["module_sim", "func_args_sim", "func_sim"]
+
+# Bump when the encoding changes, so older caches are not used
+cache_version = 3
+
+
+class NameTable(SymbolTable):
+    """A Name Table interns module, function and argument names as IDs, and
+    a list of arguments as the ID of its sorted argument IDs (in arguments).
+    The same list of arguments is seen for most functions in every version,
+    so after the first time it only costs one lookup to encode.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.arguments = SymbolTable()
+        self.lists = {}
+
+    def intern_args(self, args):
+        """Get the ID of a list of arguments (ignoring their order)"""
+        key = tuple(args)
+        found = self.lists.get(key)
+        if found is None:
+            found = self.arguments.intern(tuple(sorted(map(self.intern, args))))
+            self.lists[key] = found
+        return found
+
+
+def encode_signatures(lookup, names, tables):
+    """Given the functiondb lookup for one version, encode its signatures for
+    each level of similarity (modules, functions with arguments, and
+    functions) as a sorted array of IDs in the symbol table for the level.
+    Names are interned as IDs in a name table, so a function with arguments
+    is a tuple of the module, the function (or the class, for a class
+    function) and the arguments, and a function is the same without the
+    arguments. No strings (or sets of signatures) are built for a version.
+    """
+    ids = names.ids
+    intern_args = names.intern_args
+    modules, funcs_args, funcs = [], [], []
+    module_ids = tables["module_sim"].ids
+    func_args_ids = tables["func_args_sim"].ids
+    func_ids = tables["func_sim"].ids
+    for module, items in lookup.items():
+        module = ids.setdefault(module, len(ids))
+        modules.append(module_ids.setdefault(module, len(module_ids)))
+        for func, args in items.items():
+            if isinstance(args, list):
+                groups = [args]
+            elif isinstance(args, dict):
+                groups = [x for x in args.values() if isinstance(x, list)]
+            else:
+                continue
+            if not groups:
+                continue
+            func = ids.setdefault(func, len(ids))
+            funcs.append(func_ids.setdefault((module, func), len(func_ids)))
+            for args in groups:
+                signature = (module, func, intern_args(args))
+                funcs_args.append(
+                    func_args_ids.setdefault(signature, len(func_args_ids))
+                )
+    encoded = {"module_sim": modules, "func_args_sim": funcs_args, "func_sim": funcs}
+    return {
+        level: numpy.unique(numpy.array(found, dtype=numpy.int64))
+        for level, found in encoded.items()
+    }
+
+
+class SignatureTable:
+    """A Signature Table has the versions of a functiondb, and for each level
+    the signatures of each version encoded as sorted integer IDs, stored as
+    one array of IDs (indices) with the offset of each version's row (indptr),
+    as for a sparse matrix. The symbols for a level (the signature for each
+    ID, as name IDs) and the names are only loaded when asked for. Each
+    version also has a digest of its lookup (which doesn't depend on the IDs)
+    to tell when it changed. A table can be saved as numpy arrays, and loaded
+    with them memory mapped.
+    """
+
+    def __init__(self, versions, rows, digests, symbols=None, names=None, dirname=None):
+        self.versions = list(versions)
+        self.rows = rows
+        self.digests = list(digests)
+        self.symbols = symbols or {}
+        self.names = names
+        self.dirname = dirname
+
+    def __str__(self):
+        return "[signatures:%s]" % len(self.versions)
+
+    def __repr__(self):
+        return self.__str__()
+
+    @classmethod
+    def from_lookups(cls, lookups):
+        """Encode the signature sets for each level, given (version, lookup)
+        one version at a time, so only the encoded sets are kept. All levels
+        share one table of names.
+        """
+        versions = []
+        digests = []
+        names = NameTable()
+        tables = {level: SymbolTable() for level in levels}
+        encoded = {level: [] for level in levels}
+        for version, lookup in lookups:
+            versions.append(version)
+            digests.append(get_digest(lookup))
+            for level, row in encode_signatures(lookup, names, tables).items():
+                encoded[level].append(row)
+
+        rows = {}
+        for level in levels:
+            lengths = numpy.array([len(x) for x in encoded[level]], dtype=numpy.int64)
+            rows[level] = (
+                numpy.concatenate([[0], numpy.cumsum(lengths)]).astype(numpy.int64),
+                numpy.concatenate(
+                    encoded[level] + [numpy.array([], dtype=numpy.int64)]
+                ),
+            )
+        symbols = {
+            level: numpy.array(list(tables[level].ids), dtype=numpy.int64)
+            for level in levels
+        }
+        names = {"names": list(names.ids), "arguments": list(names.arguments.ids)}
+        return cls(versions, rows, digests, symbols, names)
+
+    def get_rows(self, level):
+        """Get the encoded signatures (an array of IDs) for each version"""
+        indptr, indices = self.rows[level]
+        return [indices[indptr[i] : indptr[i + 1]] for i in range(len(self.versions))]
+
+    def get_sizes(self, level):
+        """Get the number of signatures for each version"""
+        return numpy.diff(self.rows[level][0])
+
+    def get_symbols(self, level):
+        """Get the signature for each ID of a level (an array of name IDs, with
+        a row for each signature, or just the module for modules), loading it
+        if needed
+        """
+        if level not in self.symbols and self.dirname:
+            self.symbols[level] = numpy.load(
+                os.path.join(self.dirname, "%s.symbols.npy" % level), mmap_mode="r"
+            )
+        return self.symbols[level]
+
+    def get_names(self):
+        """Get the module, function or argument name for each name ID (names)
+        and the name IDs of each list of arguments (arguments)
+        """
+        if self.names is None and self.dirname:
+            self.names = read_json(os.path.join(self.dirname, "names.json"))
+        return self.names
+
+    def get_incidence(self, level):
+        """Get the version by signature incidence matrix for a level"""
+        rows = self.get_rows(level)
+        columns = len(self.symbols[level]) if level in self.symbols else None
+        return get_incidence(rows, columns)
+
+    def save(self, dirname):
+        """Save the table to a directory (written to a temporary directory
+        first, and moved into place, so a reader never sees part of it).
+        """
+        parent = os.path.dirname(os.path.abspath(dirname))
+        mkdir_p(parent)
+        tmpdir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+        try:
+            write_json(self.versions, os.path.join(tmpdir, "versions.json"))
+            write_json(self.digests, os.path.join(tmpdir, "digests.json"))
+            write_json(self.get_names(), os.path.join(tmpdir, "names.json"))
+            for level in levels:
+                indptr, indices = self.rows[level]
+                numpy.save(os.path.join(tmpdir, "%s.indptr.npy" % level), indptr)
+                numpy.save(os.path.join(tmpdir, "%s.indices.npy" % level), indices)
+                numpy.save(
+                    os.path.join(tmpdir, "%s.symbols.npy" % level),
+                    self.get_symbols(level),
+                )
+            os.rename(tmpdir, dirname)
+        except OSError:
+            # Another process saved the same table first
+            if not os.path.exists(dirname):
+                raise
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        self.dirname = dirname
+        return dirname
+
+    @classmethod
+    def load(cls, dirname):
+        """Load a table from a directory, with the arrays memory mapped"""
+        versions = read_json(os.path.join(dirname, "versions.json"))
+        digests = read_json(os.path.join(dirname, "digests.json"))
+        rows = {}
+        for level in levels:
+            rows[level] = tuple(
+                numpy.load(
+                    os.path.join(dirname, "%s.%s.npy" % (level, part)), mmap_mode="r"
+                )
+                for part in ["indptr", "indices"]
+            )
+        return cls(versions, rows, digests, dirname=dirname)
+
+    def get_changed(self, digests):
+        """Given the digest for each version from before, return the indices
+        of versions that are new or have changed since.
+        """
+        return [
+            i
+            for i, version in enumerate(self.versions)
+            if digests.get(version) != self.digests[i]
+        ]
+
+
+def get_digest(lookup):
+    """Get a digest of the functiondb lookup of a version"""
+    return hash_content(json.dumps(lookup, sort_keys=True))
+
+
+def get_cache_dir(cache, filename):
+    """Get the cache directory for a functiondb file, keyed by its content"""
+    return os.path.join(
+        cache, "functiondb", "v%s-%s" % (cache_version, hash_file(filename))
+    )
+
+
+def load_signatures(filename, load, cache=None):
+    """Load the signature table for a functiondb file from the cache, or else
+    build it with load (a function that yields the lookup for each version)
+    and save it to the cache, if we have one.
+    """
+    if not cache:
+        return SignatureTable.from_lookups(load())
+    dirname = get_cache_dir(cache, filename)
+    if os.path.exists(dirname):
+        return SignatureTable.load(dirname)
+    table = SignatureTable.from_lookups(load())
+    table.save(dirname)
+    return table
+
+
+def iter_functiondb(filename, metric="functiondb"):
+    """Yield (version, lookup) for each version of a functiondb file (a zip
+    with a single functiondb-results.json, or the json itself) one at a
+    time, without loading the whole file.
+    """
+    if zipfile.is_zipfile(filename):
+        with zipfile.ZipFile(filename) as archive:
+            with archive.open("%s-results.json" % metric) as member:
+                yield from iter_json_object(io.TextIOWrapper(member, "utf-8"))
+        return
+    with open(filename, "r", encoding="utf-8") as fd:
+        yield from iter_json_object(fd)
+
+
+def iter_json_object(fd, chunk_size=1024 * 1024):
+    """Yield the (key, value) pairs of a json object from a stream, decoding
+    one value at a time. When the buffer doesn't have all of a value, we
+    read until it is twice the size and try again, so a large value is only
+    decoded a few times.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+
+    def read(size):
+        nonlocal buffer, eof
+        chunk = fd.read(size)
+        eof = not chunk
+        buffer += chunk
+        return not eof
+
+    def skip(pos):
+        """Skip whitespace, reading more if needed, and return the position"""
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or not read(chunk_size):
+                return pos
+
+    def decode(pos):
+        """Decode the value at pos, reading more until it is complete"""
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A value that ends the buffer might continue (e.g., a number)
+                if end < len(buffer) or eof:
+                    return value, end
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            read(max(chunk_size, len(buffer)))
+
+    pos = skip(0)
+    if buffer[pos : pos + 1] != "{":
+        raise ValueError("%s does not start with a json object" % fd)
+    pos += 1
+    while True:
+        pos = skip(pos)
+        if buffer[pos : pos + 1] == "}":
+            return
+        if buffer[pos : pos + 1] == ",":
+            pos = skip(pos + 1)
+        key, pos = decode(pos)
+        pos = skip(pos)
+        if buffer[pos : pos + 1] != ":":
+            raise ValueError("Expected : after %s" % key)
+        value, pos = decode(skip(pos + 1))
+        yield key, value
+
+        # Drop what we have decoded
+        buffer = buffer[pos:]
+        pos = 0
@@ -0,0 +1,127 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import numpy
+from scipy import sparse
+
+
+class SymbolTable:
+    """A Symbol Table gives each distinct item (e.g., a signature) an integer
+    ID, in the order they are first seen, so sets of items can be encoded as
+    sorted arrays of IDs and compared as rows of a matrix.
+    """
+
+    def __init__(self):
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __str__(self):
+        return "[symbols:%s]" % len(self.ids)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def intern(self, item):
+        """Get the ID of an item, giving it the next ID if it is new"""
+        return self.ids.setdefault(item, len(self.ids))
+
+    def encode(self, items):
+        """Encode items as a sorted array of their (unique) IDs"""
+        ids = self.ids
+        found = [ids.setdefault(item, len(ids)) for item in items]
+        return numpy.unique(numpy.array(found, dtype=numpy.int64))
+
+
+def get_incidence(rows, columns=None):
+    """Given encoded sets (arrays of IDs) return a sparse incidence matrix with
+    a row for each, and a column for each ID (columns defaults to the largest
+    ID plus one).
+    """
+    lengths = numpy.array([len(row) for row in rows], dtype=numpy.int64)
+    indptr = numpy.concatenate([[0], numpy.cumsum(lengths)])
+    indices = numpy.concatenate(rows) if rows else numpy.array([], dtype=numpy.int64)
+    if columns is None:
+        columns = int(indices.max()) + 1 if len(indices) else 0
+    data = numpy.ones(len(indices), dtype=numpy.int32)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), columns))
+
+
+def dice_matrix(incidence, rows=None):
+    """Calculate the Dice coefficient (the information coefficient) for all
+    pairs of rows of an incidence matrix, with a single sparse product for
+    the sizes of all intersections. Rows that are both empty have zero. If
+    rows (indices) are provided, only return the scores for them, against
+    all rows.
+    """
+    sizes = numpy.asarray(incidence.sum(axis=1), dtype=numpy.float64).ravel()
+    subset = incidence if rows is None else incidence[rows]
+    intersect = (subset @ incidence.T).toarray().astype(numpy.float64)
+    total = (sizes if rows is None else sizes[rows])[:, None] + sizes[None, :]
+    return numpy.divide(
+        2.0 * intersect, total, out=numpy.zeros_like(intersect), where=total > 0
+    )
+
+
+def get_sims(labels, matrices, diagonal=1):
+    """Given labels for the rows and a square matrix for each metric, return
+    similarity scores for each pair (with a key of the sorted labels joined
+    by ..) in the upper triangle, with the diagonal perfectly similar.
+    """
+    sims = {}
+    for i, label1 in enumerate(labels):
+        sims["..".join([label1, label1])] = {name: diagonal for name in matrices}
+        for j in range(i + 1, len(labels)):
+            key = "..".join(sorted([label1, labels[j]]))
+            sims[key] = {name: float(matrix[i, j]) for name, matrix in matrices.items()}
+    return sims
+
+
+def update_matrices(labels, matrices, rows, previous_labels, previous):
+    """Update the matrix for each metric from a previous run (as loaded from
+    its npz) given the scores of rows (indices into labels, for versions that
+    are new or changed) against all labels. Scores between other labels are
+    kept from before. Returns None if a score we need is not in the previous
+    matrices (e.g., a label is missing) or was saved with less precision than
+    a full run (float32), so the caller can score all pairs instead.
+    """
+    index = {label: i for i, label in enumerate(previous_labels)}
+    changed = set(rows)
+    kept = [i for i in range(len(labels)) if i not in changed]
+    if any(labels[i] not in index for i in kept) or set(matrices) - set(previous):
+        return None
+    if any(previous[name].dtype != numpy.float64 for name in matrices):
+        return None
+
+    old = [index[labels[i]] for i in kept]
+    updated = {}
+    for name, scores in matrices.items():
+        matrix = numpy.zeros((len(labels), len(labels)), dtype=numpy.float64)
+        matrix[numpy.ix_(kept, kept)] = previous[name][numpy.ix_(old, old)]
+        matrix[rows, :] = scores
+        matrix[:, rows] = scores.T
+        updated[name] = matrix
+    return updated
+
+
+def save_matrices(filename, labels, matrices, diagonal=1, dtype=numpy.float32):
+    """Save the labels and a matrix (float32 by default) for each metric to an
+    (uncompressed) npz file, which can be read without parsing, one matrix at
+    a time. As for get_sims, the diagonal is perfectly similar.
+    """
+    arrays = {}
+    for name, matrix in matrices.items():
+        arrays[name] = numpy.array(matrix, dtype=dtype)
+        numpy.fill_diagonal(arrays[name], diagonal)
+    numpy.savez(filename, labels=numpy.array(labels, dtype=str), **arrays)
+    return filename
+
+
+def load_matrices(filename):
+    """Load the labels and a matrix for each metric from an npz file"""
+    with numpy.load(filename, allow_pickle=False) as data:
+        labels = data["labels"].tolist()
+        matrices = {name: data[name] for name in data.files if name != "labels"}
+    return labels, matrices
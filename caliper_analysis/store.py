@@ -0,0 +1,239 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.file import mkdir_p
+from .utils import version_key
+
+import json
+import os
+import re
+import sqlite3
+import time
+
+schema = """
+CREATE TABLE IF NOT EXISTS builds (
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    python TEXT NOT NULL,
+    name TEXT,
+    retval INTEGER,
+    status TEXT,
+    cause TEXT,
+    error TEXT,
+    fingerprint TEXT,
+    timing TEXT,
+    updated REAL,
+    PRIMARY KEY (package, version, python)
+);
+CREATE TABLE IF NOT EXISTS tests (
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    python TEXT NOT NULL,
+    test TEXT NOT NULL,
+    retval INTEGER,
+    status TEXT,
+    cause TEXT,
+    seconds REAL,
+    cpu_seconds REAL,
+    max_rss_kb INTEGER,
+    output TEXT,
+    error TEXT,
+    PRIMARY KEY (package, version, python, test)
+);
+CREATE INDEX IF NOT EXISTS tests_by_test ON tests (package, test, python, retval);
+CREATE TABLE IF NOT EXISTS requirements (
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    python TEXT NOT NULL,
+    requirement TEXT NOT NULL,
+    name TEXT,
+    pin TEXT,
+    PRIMARY KEY (package, version, python, requirement)
+);
+CREATE INDEX IF NOT EXISTS requirements_by_name ON requirements (package, name);
+"""
+
+# Result files are named for the package, version and Python version
+result_regex = (
+    "pypi-(?P<package>.+)-(?P<version>[^-]+)-python-(?P<python>cp[0-9]+)[.]json$"
+)
+
+
+def to_int(value):
+    """Return a return value as an integer (some are saved as strings)"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_status(entry, retval):
+    """Get the status of a build or test, for results from before they had one"""
+    if entry.get("status"):
+        return entry["status"]
+    return "passed" if to_int(retval) == 0 else "failed"
+
+
+# A requirement is a name, optional extras, a specifier or url, and a marker
+requirement_regex = (
+    r"^\s*(?P<name>[A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[(?P<extras>[^\]]*)\])?"
+    r"\s*(?P<spec>[^;]*?)\s*(;(?P<marker>.*))?$"
+)
+
+
+def parse_requirement(requirement):
+    """Split a line of pip freeze into a name and pin. The pin is the version
+    for ==, the url for @, and otherwise the specifier (e.g., >=1.0,<2), or
+    None. Extras and markers are not part of either. A line that is not a
+    requirement (e.g., -e or a comment) is returned whole as the name.
+    """
+    match = re.match(requirement_regex, requirement)
+    if not match:
+        return requirement.strip().lower(), None
+    spec = match["spec"]
+    if spec.startswith("@"):
+        return match["name"].lower(), spec[1:].strip() or None
+    version = re.match(r"^===?\s*([^,\s]+)$", spec)
+    pin = version.group(1) if version else re.sub(r"\s+", "", spec)
+    return match["name"].lower(), pin or None
+
+
+class ResultStore:
+    """A Result Store is a SQLite database with the results for each cell of
+    the grid, with a table each for builds, tests and requirements, indexed
+    on (package, version, python, test). The json result files remain the
+    record of a run, and the store makes queries across them (e.g., the
+    versions that pass a test for a Python version) an index lookup instead
+    of a read of every file. Concurrent workers can write to the same store.
+    """
+
+    def __init__(self, filename, timeout=60):
+        self.filename = os.path.abspath(filename)
+        mkdir_p(os.path.dirname(self.filename))
+        self.db = sqlite3.connect(self.filename, timeout=timeout)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(schema)
+
+    def __str__(self):
+        return "[store:%s]" % self.filename
+
+    def __repr__(self):
+        return self.__str__()
+
+    def close(self):
+        self.db.close()
+
+    def add_result(self, result, filename=None):
+        """Add (or replace) a result for a cell. The package, version and
+        Python version are taken from the inputs, or else the filename.
+        """
+        inputs = result.get("inputs") or {}
+        package = inputs.get("dependency")
+        version = inputs.get("version")
+        python = inputs.get("python_version")
+        name = inputs.get("name")
+        if not (package and version and python) and filename:
+            match = re.search(result_regex, os.path.basename(filename))
+            if match:
+                package, version, python = match.groups()
+        if not (package and version and python):
+            raise ValueError("Cannot tell the grid cell for %s" % (filename or result))
+        if not name:
+            name = "pypi-%s-%s-python-%s" % (package, version, python)
+
+        tests = result.get("tests") or {}
+        build = tests.get("build") or {}
+        retval = build.get("retval", result.get("build_retval"))
+        fingerprint = (inputs.get("fingerprint") or {}).get("build")
+        cell = (package, version, python)
+
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            for table in ["builds", "tests", "requirements"]:
+                self.db.execute(
+                    "DELETE FROM %s WHERE package=? AND version=? AND python=?" % table,
+                    cell,
+                )
+            self.db.execute(
+                "INSERT INTO builds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                cell
+                + (
+                    name,
+                    to_int(retval),
+                    get_status(build, retval),
+                    build.get("cause"),
+                    json.dumps(build["error"]) if "error" in build else None,
+                    fingerprint,
+                    json.dumps(result["timing"]) if "timing" in result else None,
+                    time.time(),
+                ),
+            )
+            self.db.executemany(
+                "INSERT INTO tests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    cell
+                    + (
+                        test,
+                        to_int(entry.get("retval")),
+                        get_status(entry, entry.get("retval")),
+                        entry.get("cause"),
+                        entry.get("seconds"),
+                        entry.get("cpu_seconds"),
+                        entry.get("max_rss_kb"),
+                        json.dumps(entry.get("output") or []),
+                        json.dumps(entry.get("error") or []),
+                    )
+                    for test, entry in tests.items()
+                    if test != "build"
+                ],
+            )
+            requirements = {
+                x.strip(): parse_requirement(x)
+                for x in result.get("requirements.txt") or []
+                if x.strip()
+            }
+            self.db.executemany(
+                "INSERT INTO requirements VALUES (?, ?, ?, ?, ?, ?)",
+                [cell + (x,) + parsed for x, parsed in requirements.items()],
+            )
+
+    def get_tests(self, package, version=None, python=None, test=None, retval=None):
+        """Get test results (without output and error) as a list of dicts,
+        optionally for a version, Python version, test, or return value.
+        """
+        columns = [
+            "version",
+            "python",
+            "test",
+            "retval",
+            "status",
+            "cause",
+            "seconds",
+            "cpu_seconds",
+            "max_rss_kb",
+        ]
+        query = "SELECT %s FROM tests WHERE package=?" % ", ".join(columns)
+        params = [package]
+        for column, value in [
+            ("version", version),
+            ("python", python),
+            ("test", test),
+            ("retval", retval),
+        ]:
+            if value is not None:
+                query += " AND %s=?" % column
+                params.append(value)
+
+        rows = [dict(zip(columns, row)) for row in self.db.execute(query, params)]
+        return sorted(rows, key=lambda x: (version_key(x["version"]), x["python"]))
+
+    def get_versions(self, package, python, test, retval=0):
+        """Get the sorted versions of a package where a test had a return
+        value (defaults to passing) for a Python version.
+        """
+        rows = self.db.execute(
+            "SELECT version FROM tests WHERE package=? AND test=? AND python=? AND retval=?",
+            [package, test, python, retval],
+        )
+        return sorted([row[0] for row in rows], key=version_key)
@@ -0,0 +1,675 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.file import mkdir_p, write_file, read_json
+from caliper.utils.command import CommandRunner
+from caliper.logger import logger
+from .capture import add_logs, get_prefix
+from .context import prepare_context
+from .fingerprint import get_stale_tests, hash_content
+from .pool import ContainerPool
+from .store import ResultStore
+from .testrunner import MARKER
+from .timing import TimedCommandRunner, get_build_steps, get_step_seconds
+from .utils import write_json_atomic
+from .wheels import Wheelhouse
+
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# The test runner is piped into the container to run the tests
+testrunner = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testrunner.py")
+
+# And the logs directory for a cell is mounted here for it
+container_logs = "/tmp/caliper-logs"
+
+# The tests are not in the image, the directory they are in is mounted here
+container_tests = "/tmp/caliper-tests"
+
+
+def analysis_task(**kwargs):
+    """A shared analysis task for the serial or parallel workers. This mirrors
+    caliper.analysis.tasks.analysis_task, but is safe to run concurrently:
+    result files are written atomically, and pruning of dangling layers
+    (which can remove layers of a build running in another worker) is only
+    done when prune is True. With resume, an existing result with a matching
+    fingerprint is kept, and only tests with a stale fingerprint are run.
+    The time taken by each phase (pulling the base image, the build and the
+    pip install within it, starting the container and the tests) is saved
+    under timing. If a database is provided, results are also saved to it.
+    Each build and test entry has a status (passed, failed or skipped) and
+    a cause for a failed build or skipped test. If the task is given a
+    failure (e.g., a shared layer for all cells of a Python version could not
+    be built) the cell is recorded as failed with that cause, without a build.
+    The seconds to pull the base image and build the shared layers (split
+    across the cells that share them) are given as shared_timing, and saved
+    with the timing of the cell.
+    Only capture_lines lines from the start and end of the output and error
+    of a test are kept in the result, and the full logs are written (gzipped)
+    under logs_dir. The tests are not built into the image, but mounted from
+    outdir when they are run, so an edited test can reuse the image.
+    """
+    # Ensure all arguments are provided
+    for key in [
+        "name",
+        "outdir",
+        "dependency",
+        "outfile",
+        "dockerfile",
+        "exists",
+    ]:
+        if key not in kwargs or kwargs.get(key) == None:
+            logger.exit("%s is missing or undefined for analysis task." % key)
+
+    outfile = kwargs.get("outfile")
+    cleanup = kwargs.get("cleanup", False)
+    prune = kwargs.get("prune", True)
+    dependency = kwargs.get("dependency")
+    force = kwargs.get("force", False)
+    resume = kwargs.get("resume", False)
+    keep_image = kwargs.get("keep_image", False)
+    exists = kwargs.get("exists")
+    name = kwargs.get("name")
+    test_mode = kwargs.get("test_mode", "batch")
+    database = kwargs.get("database")
+    lines = kwargs.get("capture_lines")
+    logs = os.path.join(kwargs["logs_dir"], name) if kwargs.get("logs_dir") else None
+    tests_dir = kwargs["outdir"]
+    result = {"inputs": kwargs}
+    tests = kwargs.get("tests")
+    tests = [] if not tests else tests.split("\n")
+    container_name = "%s-container:%s" % (dependency, name)
+    runner = TimedCommandRunner()
+    timing = dict(kwargs.get("shared_timing") or {})
+    start = time.time()
+
+    # If the output file already exists and force is true, overwrite
+    if os.path.exists(outfile) and not force:
+        if not resume:
+            return
+
+        # With resume, we only redo the part of the cell that is stale
+        previous = read_json(outfile)
+        stale = get_stale_tests(previous, kwargs["fingerprint"])
+        if stale is not None:
+            removed = set(previous.get("tests", {})) - set(tests) - {"build"}
+            if not stale and not removed:
+                return
+
+            # Keep results for tests that are still current
+            result["tests"] = {
+                test: entry
+                for test, entry in previous.get("tests", {}).items()
+                if test not in removed
+            }
+            if "requirements.txt" in previous:
+                result["requirements.txt"] = previous["requirements.txt"]
+
+            if "timing" in previous:
+                result["timing"] = previous["timing"]
+
+            if not stale:
+                save_result(result, outfile, database)
+                return
+
+            # The image might still be around if it was kept
+            build_container(
+                kwargs, container_name, len(stale), runner, reuse=True, timing=timing
+            )
+            result["tests"]["build"] = get_build_result(runner)
+            if runner.retval == 0:
+                result["tests"].update(
+                    run_tests(
+                        container_name, stale, test_mode, timing, lines, logs, tests_dir
+                    )
+                )
+            else:
+                result["tests"].update(skip_tests(tests, runner.cause))
+            result["timing"] = finish_timing(timing, result["tests"], start)
+            save_result(result, outfile, database)
+            if runner.retval == 0:
+                remove_container(container_name, keep_image, prune, cleanup)
+            return
+
+    # If there is no release file to install (or a shared layer failed) we
+    # record a failed build, and skip the tests
+    failure = kwargs.get("failure")
+    if not exists:
+        failure = {"cause": "no-wheel", "error": kwargs.get("reasons") or []}
+    if failure:
+        result["build_retval"] = 1
+        result["tests"] = {
+            "build": {
+                "retval": 1,
+                "status": "failed",
+                "cause": failure["cause"],
+                "error": failure.get("error") or [],
+            }
+        }
+        result["tests"].update(skip_tests(tests, failure["cause"]))
+        if timing:
+            result["timing"] = finish_timing(timing, result["tests"], start)
+        save_result(result, outfile, database)
+        return
+
+    # Keep a result for each script
+    build_container(kwargs, container_name, len(tests), runner, timing=timing)
+    result["tests"] = {"build": get_build_result(runner)}
+    if runner.retval != 0:
+        result["tests"].update(skip_tests(tests, runner.cause))
+        result["timing"] = finish_timing(timing, result["tests"], start)
+        save_result(result, outfile, database)
+        return
+
+    # Get packages installed for each container, and run all tests
+    if test_mode == "batch":
+        test_results, requirements = run_tests_batch(
+            container_name, tests, True, timing, lines, logs, tests_dir
+        )
+    elif test_mode == "exec":
+        test_results, requirements = run_tests_exec(
+            container_name, tests, True, timing, lines, logs, tests_dir
+        )
+    else:
+        freeze_start = time.time()
+        runner.run_command(["docker", "run", "--rm", container_name, "pip", "freeze"])
+        timing["freeze"] = round(time.time() - freeze_start, 2)
+        requirements = runner.output
+        test_results = run_tests(
+            container_name, tests, test_mode, timing, lines, logs, tests_dir
+        )
+    if requirements is not None:
+        result["requirements.txt"] = requirements
+
+    # Update results with all tests
+    result["tests"].update(test_results)
+    result["timing"] = finish_timing(timing, result["tests"], start)
+
+    # Save the result to file, clean up
+    save_result(result, outfile, database)
+    remove_container(container_name, keep_image, prune, cleanup)
+
+
+def save_result(result, outfile, database=None):
+    """Save a result to its file, and to the result store if we have one"""
+    write_json_atomic(result, outfile)
+    if database:
+        store = ResultStore(database)
+        try:
+            store.add_result(result, outfile)
+        finally:
+            store.close()
+    return outfile
+
+
+def build_container(
+    params, container_name, total, runner=None, reuse=False, timing=None
+):
+    """Write the rendered Dockerfile to a temporary file and build the
+    container, returning the return value of the build. The build context
+    only has the helpers and the release file from the wheelhouse (fetched if
+    needed), and is shared by builds with the same files (it is removed when
+    the run is done, see sweep_contexts). The tests are mounted when they
+    are run, so the image is labelled with a hash of the build inputs alone
+    (the Dockerfile and context), and if reuse is True, an existing image with
+    the same label is used instead of building again (e.g., a test changed).
+    If a timing lookup is provided, we save the time to fetch the release,
+    pull the base image and build (with the time for each step of the
+    build). On a failure, the cause on the runner says what failed (fetch or
+    install).
+    """
+    runner = runner or TimedCommandRunner()
+    timing = {} if timing is None else timing
+    worker_id = multiprocessing.current_process().name
+
+    # The build context has the helpers that exist
+    files = {}
+    for relpath in params.get("helpers") or []:
+        filename = os.path.join(params["outdir"], relpath)
+        if os.path.isfile(filename):
+            files[relpath] = filename
+
+    # And the release file from the wheelhouse
+    digests = {}
+    wheel = params.get("wheel")
+    if wheel:
+        fetch_start = time.time()
+        try:
+            wheelhouse = Wheelhouse(params["wheelhouse"], params.get("wheel_index"))
+            filename = wheelhouse.get(
+                wheel["url"], wheel["filename"], wheel.get("sha256")
+            )
+        except Exception as e:
+            runner.reset()
+            runner.retval = 1
+            runner.error = ["Cannot fetch %s: %s\n" % (wheel["url"], e)]
+            runner.cause = "fetch"
+            return runner.retval
+        files[wheel["filename"]] = filename
+        digests[wheel["filename"]] = wheelhouse.get_digest(filename)
+        timing["fetch"] = round(time.time() - fetch_start, 2)
+    context = prepare_context(params["context_dir"], files, digests)
+    label = hash_content(params["dockerfile"] + os.path.basename(context))
+    if reuse and get_image_label(container_name) == label:
+        runner.reset()
+        runner.retval = 0
+        timing["build"] = 0
+        return runner.retval
+
+    # Pull the base image first, so the build time doesn't include it
+    if params.get("base"):
+        timing["pull"] = pull_image(params["base"])
+
+    # Build temporary Dockerfile
+    dockerfile_name = "Dockerfile.caliper.%s" % params["name"]
+    dockerfile_fullpath = os.path.join(tempfile.gettempdir(), dockerfile_name)
+
+    # Write and build temporary Dockerfile, and build the container
+    runner.cause = "install"
+    write_file(dockerfile_fullpath, params["dockerfile"])
+    sys.stdout.write(
+        "[%s] 0 of %s - building container %s\n" % (worker_id, total, container_name)
+    )
+    runner.run_command(
+        [
+            "docker",
+            "build",
+            "-f",
+            dockerfile_fullpath,
+            "-t",
+            container_name,
+            "--label",
+            "caliper.build=%s" % label,
+            ".",
+        ],
+        cwd=context,
+    )
+
+    # Clean up Dockerfile
+    if os.path.exists(dockerfile_fullpath):
+        os.remove(dockerfile_fullpath)
+
+    # A runner without times (e.g., provided by the caller) gives us the total
+    if isinstance(runner, TimedCommandRunner):
+        timing["build"] = runner.seconds
+        timing["steps"] = get_build_steps(runner)
+        timing["pip_install"] = get_step_seconds(timing["steps"], "pip install")
+    return runner.retval
+
+
+def pull_image(base, runner=None):
+    """Pull a base image if we don't have it, and return the seconds it took
+    (zero if it is already present). If the pull fails, the build will try
+    again and report the error (the runner has the return value).
+    """
+    runner = runner or CommandRunner()
+    runner.run_command(["docker", "image", "inspect", base])
+    if runner.retval == 0:
+        return 0
+    start = time.time()
+    runner.run_command(["docker", "pull", base])
+    return round(time.time() - start, 2)
+
+
+def finish_timing(timing, tests, start):
+    """Finish timing for a cell with the totals for the tests and the cell"""
+    timing["tests"] = round(
+        sum(
+            entry.get("seconds") or 0
+            for name, entry in tests.items()
+            if name != "build"
+        ),
+        2,
+    )
+    timing["total"] = round(time.time() - start, 2)
+    return timing
+
+
+def get_build_result(runner):
+    """Given a runner used to build, return the build entry for the tests"""
+    entry = {"retval": runner.retval, "status": "passed"}
+    if runner.retval != 0:
+        entry["status"] = "failed"
+        entry["cause"] = getattr(runner, "cause", "install")
+        entry["error"] = runner.error
+    return entry
+
+
+def set_status(entry):
+    """Set the status of a test that was run from its return value"""
+    entry["status"] = "passed" if entry.get("retval") == 0 else "failed"
+    return entry
+
+
+def skip_tests(tests, cause):
+    """Get entries for tests that were not run, because of a cause"""
+    return {test: {"status": "skipped", "cause": cause} for test in tests}
+
+
+def get_shared_layers(dockerfiles):
+    """Given the rendered Dockerfiles for the cells of a Python version, return
+    the lines that all of them start with, up to the first line that needs
+    the build context (COPY or ADD).
+    """
+    lines = []
+    for group in zip(*[x.split("\n") for x in dockerfiles]):
+        if len(set(group)) > 1 or re.match("(COPY|ADD) ", group[0].strip(), re.I):
+            break
+        lines.append(group[0])
+    return "\n".join(lines)
+
+
+def build_shared_layers(base, dockerfile, container_name, timing=None):
+    """Pull the base image for a Python version, and build the layers that
+    all cells for it share (e.g., apt-get install) into an image, so a
+    failure is found once and not for each cell. The layers are then in the
+    cache for the build of each cell. Returns None on success, and otherwise
+    a failure with the cause (base-image or shared-layer) and error. If a
+    timing lookup is provided, we save the seconds to pull (shared_pull) and
+    build (shared_build).
+    """
+    timing = {} if timing is None else timing
+    runner = CommandRunner()
+    timing["shared_pull"] = pull_image(base, runner)
+    if runner.retval != 0:
+        return {"cause": "base-image", "base": base, "error": runner.error}
+
+    # The base image alone has nothing more to build
+    if len([x for x in dockerfile.split("\n") if x.strip()]) <= 1:
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix="caliper-shared-")
+    dockerfile_fullpath = os.path.join(tmpdir, "Dockerfile")
+    write_file(dockerfile_fullpath, dockerfile)
+    sys.stdout.write("Building shared layers %s\n" % container_name)
+    start = time.time()
+    runner.run_command(
+        ["docker", "build", "-f", dockerfile_fullpath, "-t", container_name, tmpdir]
+    )
+    timing["shared_build"] = round(time.time() - start, 2)
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    if runner.retval != 0:
+        return {"cause": "shared-layer", "base": base, "error": runner.error}
+
+
+def get_image_label(container_name):
+    """Get the build label of an image, if it is present locally"""
+    runner = CommandRunner()
+    runner.run_command(
+        [
+            "docker",
+            "image",
+            "inspect",
+            "-f",
+            '{{ index .Config.Labels "caliper.build" }}',
+            container_name,
+        ]
+    )
+    if runner.retval == 0 and runner.output:
+        return runner.output[0].strip()
+
+
+def run_tests(
+    container_name,
+    tests,
+    test_mode="container",
+    timing=None,
+    lines=None,
+    logs=None,
+    tests_dir=None,
+):
+    """Run each test in its own container (or all of them in one container,
+    for the batch test mode, or with exec in a warm container for the exec
+    test mode) and return results keyed by test. In every mode a test is run
+    by the test runner, which records its cpu seconds and peak memory. The
+    output and error of a test are capped to lines from the start and end,
+    and if a logs directory is provided, the full output and error are
+    written there. The tests are copied in from tests_dir (mounted in the
+    container) if it is provided. If a timing lookup is provided, we save
+    the time spent starting containers.
+    """
+    if test_mode == "batch":
+        return run_tests_batch(
+            container_name, tests, False, timing, lines, logs, tests_dir
+        )[0]
+    if test_mode == "exec":
+        return run_tests_exec(
+            container_name, tests, False, timing, lines, logs, tests_dir
+        )[0]
+
+    timing = {} if timing is None else timing
+    timing["container_start"] = 0
+    test_results = {}
+    for i, script in enumerate(tests):
+        step = {}
+        test_results.update(
+            run_tests_batch(
+                container_name,
+                [script],
+                False,
+                step,
+                lines,
+                logs,
+                tests_dir,
+                i,
+                len(tests),
+            )[0]
+        )
+        timing["container_start"] = round(
+            timing["container_start"] + (step.get("container_start") or 0), 2
+        )
+    return test_results
+
+
+def get_runner_command(freeze=False, lines=None, logs=None, tests_dir=None):
+    """Get the command (in the container) to run the test runner, given on
+    stdin, with the arguments for freeze, lines, logs (mounted at
+    container_logs) and tests_dir (mounted at container_tests). The tests to
+    run are added to the end.
+    """
+    cmd = ["python", "-"]
+    if freeze:
+        cmd.append("--freeze")
+    if lines:
+        cmd += ["--lines", str(lines)]
+    if logs:
+        cmd += ["--logs", container_logs]
+    if tests_dir:
+        cmd += ["--tests", container_tests]
+    return cmd
+
+
+def get_volumes(logs=None, tests_dir=None):
+    """Get the volumes to mount in a test container (the logs directory, and
+    the directory with the tests, read only)
+    """
+    volumes = []
+    if logs:
+        mkdir_p(logs)
+        volumes.append("%s:%s" % (logs, container_logs))
+    if tests_dir:
+        volumes.append("%s:%s:ro" % (os.path.abspath(tests_dir), container_tests))
+    return volumes
+
+
+def run_tests_batch(
+    container_name,
+    tests,
+    freeze=False,
+    timing=None,
+    lines=None,
+    logs=None,
+    tests_dir=None,
+    count=0,
+    total=None,
+):
+    """Run all tests in one container, where the test runner runs each in a
+    fresh interpreter and streams back a result as soon as it is done. If
+    freeze is True, we also get the packages installed. Returns the results
+    keyed by test, and the output of pip freeze (or None). If a timing lookup
+    is provided, we save the time for the container to start, and for pip
+    freeze. The runner caps output and error to lines from the start and
+    end, and writes the full logs to the logs directory (mounted in the
+    container) if one is provided. The tests are copied in from tests_dir
+    (also mounted) if it is provided. The count of tests already run (of
+    total) is only for progress.
+    """
+    cmd = ["docker", "run", "-i", "--rm"]
+    for volume in get_volumes(logs, tests_dir):
+        cmd += ["-v", volume]
+    cmd += [container_name] + get_runner_command(freeze, lines, logs, tests_dir)
+    return stream_results(cmd + tests, tests, timing, logs, count, total)
+
+
+def stream_results(cmd, tests, timing=None, logs=None, count=0, total=None):
+    """Run a command (docker run or exec) that runs the test runner given on
+    stdin, and read the result for each test as it is streamed back. Returns
+    the results keyed by test, and the output of pip freeze (or None). A
+    test without a result (the runner or container died) failed with it.
+    """
+    timing = {} if timing is None else timing
+    total = total or len(tests)
+    worker_id = multiprocessing.current_process().name
+
+    # The runner is given to python on stdin, and error is read in a thread
+    start = time.time()
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    runner = CommandRunner()
+    reader = threading.Thread(target=runner.reader, args=(process.stderr, "stderr"))
+    reader.start()
+    with open(testrunner, "rb") as fd:
+        process.stdin.write(fd.read())
+    process.stdin.close()
+
+    test_results = {}
+    requirements = None
+    for line in process.stdout:
+        line = line.decode("utf-8", "replace")
+        if not line.startswith(MARKER):
+            continue
+        record = json.loads(line[len(MARKER) :])
+        name = record.pop("name")
+        if name == "start":
+            timing["container_start"] = round(time.time() - start, 2)
+            continue
+        if name == "requirements.txt":
+            requirements = record["output"]
+            timing["freeze"] = record.get("seconds")
+            continue
+        test_results[name] = set_status(record)
+        if logs:
+            add_logs(record, get_prefix(logs, name), os.path.dirname(logs))
+        sys.stdout.write(
+            "[%s] %s of %s - %s total time: %s seconds \n"
+            % (worker_id, count + len(test_results), total, name, record["seconds"])
+        )
+        sys.stdout.flush()
+    process.stdout.close()
+    retval = process.wait()
+    reader.join()
+
+    # If the runner (or container) died, tests without a result failed with it
+    for script in tests:
+        if script not in test_results:
+            test_results[script] = {
+                "error": runner.error,
+                "output": [],
+                "retval": retval or 1,
+                "seconds": 0,
+                "cpu_seconds": None,
+                "max_rss_kb": None,
+                "status": "failed",
+                "cause": "runner",
+            }
+    return test_results, requirements
+
+
+def run_tests_exec(
+    container_name,
+    tests,
+    freeze=False,
+    timing=None,
+    lines=None,
+    logs=None,
+    tests_dir=None,
+):
+    """Run each test with exec in a warm container from a pool, where it gets
+    a fresh scratch directory and /tmp/data, and the container is recycled
+    after a test fails. Each test is run by the test runner (given on stdin
+    to exec) so we have its cpu seconds and peak memory. If freeze is True,
+    we also get the packages installed. Returns the results keyed by test,
+    and the output of pip freeze (or None). If a timing lookup is provided,
+    we save the time spent starting containers, and for pip freeze. Output
+    and error are capped to lines from the start and end, with the full logs
+    in the logs directory (mounted in the container), and the tests are
+    copied in from tests_dir (also mounted) if it is provided.
+    """
+    timing = {} if timing is None else timing
+    pool = ContainerPool(get_volumes(logs, tests_dir))
+    test_results = {}
+    requirements = None
+
+    try:
+        if freeze:
+            start = time.time()
+            requirements = pool.run(container_name, ["pip", "freeze"]).output
+            timing["freeze"] = round(time.time() - start - pool.seconds, 2)
+
+        command = get_runner_command(False, lines, logs, tests_dir)
+        for i, script in enumerate(tests):
+            cmd = pool.get_command(container_name, command, interactive=True)
+            if not cmd:
+                test_results[script] = {
+                    "error": ["Cannot start a container for %s\n" % container_name],
+                    "output": [],
+                    "retval": 1,
+                    "seconds": 0,
+                    "cpu_seconds": None,
+                    "max_rss_kb": None,
+                    "status": "failed",
+                    "cause": "runner",
+                }
+                continue
+            results = stream_results(cmd + [script], [script], {}, logs, i, len(tests))
+            test_results.update(results[0])
+            if test_results[script]["retval"] != 0:
+                pool.recycle(container_name)
+    finally:
+        pool.close()
+    timing["container_start"] = pool.seconds
+    return test_results, requirements
+
+
+def remove_container(container_name, keep_image=False, prune=True, cleanup=False):
+    """Remove the image for a cell (unless we are asked to keep it) and prune"""
+    if not keep_image:
+        runner = CommandRunner()
+        runner.run_command(["docker", "rmi", container_name, "--force"])
+    if prune:
+        prune_images(cleanup)
+
+
+def prune_images(cleanup=False):
+    """Remove dangling image layers, and optionally prune the docker system.
+    In parallel mode this is only done once after all workers finish.
+    """
+    runner = CommandRunner()
+    runner.run_command(["docker", "images", "-f", "dangling=true", "-q"])
+    for layer in runner.output:
+        runner.run_command(["docker", "rmi", layer.strip("\n"), "--force"])
+    if cleanup:
+        runner.run_command(["docker", "system", "prune", "--all", "--force"])
@@ -0,0 +1,208 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+# This script is piped into "python -" inside of a grid container, so it must
+# run on any Python from 2.7 up, using only the standard library.
+#
+#   python - [--freeze] [--lines N] [--logs DIR] [--tests DIR] test1.py ...
+#
+# Each test is run in a fresh interpreter, and a result (retval, output,
+# error, seconds, cpu seconds and peak memory) is written to stdout as soon
+# as it finishes, as a line of json that starts with the marker below. A first
+# record is written on start, so the host can tell when the container is up.
+# With --lines, only that many lines from the start and end of the output and
+# error are kept in the result, and with --logs, the full output and error of
+# each test are written (gzipped) to that directory. With --tests, each test is
+# first copied from that directory (mounted from the host) to the same path
+# under the working directory, so the image doesn't need to have the tests.
+
+import collections
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+MARKER = "CALIPER-RESULT "
+
+
+class LogCapture(object):
+    """A Log Capture takes the lines of a stream of output as they come, and
+    keeps only a number of lines from the start (head) and end (tail), with
+    a count and sha256 of all of them. If a filename is given, the full log is
+    written to it, gzipped. With no number of lines, all of them are kept.
+    """
+
+    def __init__(self, filename=None, lines=None):
+        self.lines = lines or None
+        self.head = []
+        self.tail = collections.deque(maxlen=self.lines)
+        self.count = 0
+        self.sha256 = hashlib.sha256()
+        self.fd = None
+        if filename:
+            dirname = os.path.dirname(filename)
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+            self.fd = gzip.open(filename, "wb")
+
+    def write(self, line):
+        """Add a line (bytes) of output"""
+        self.count += 1
+        self.sha256.update(line)
+        if self.fd:
+            self.fd.write(line)
+        line = line.decode("utf-8", "replace")
+        if self.lines is None or len(self.head) < self.lines:
+            self.head.append(line)
+        else:
+            self.tail.append(line)
+
+    def read(self, stream):
+        """Add all lines from a binary stream, one at a time"""
+        for line in iter(stream.readline, b""):
+            self.write(line)
+        self.close()
+        return self
+
+    def close(self):
+        if self.fd:
+            self.fd.close()
+            self.fd = None
+
+    def get_lines(self):
+        """Get the lines kept, with a line to say how many were left out"""
+        omitted = self.count - len(self.head) - len(self.tail)
+        if not omitted:
+            return self.head + list(self.tail)
+        return self.head + ["... %s lines omitted ...\n" % omitted] + list(self.tail)
+
+
+def get_log_prefix(logs, script):
+    """Get the prefix for the logs of a test, which stays under the logs
+    directory even for an absolute path (or one with ..)
+    """
+    parts = [x for x in os.path.normpath(script).split(os.sep) if x not in ["", ".."]]
+    return os.path.join(logs, *parts)
+
+
+def get_log_path(prefix, stream):
+    """Get the path to the gzipped log for a stream (output or error) of a test"""
+    return "%s.%s.gz" % (prefix, stream)
+
+
+def copy_test(tests, script):
+    """Copy a test from the tests directory to the same (relative) path under
+    the working directory, next to the helpers in the image
+    """
+    source = os.path.join(tests, script)
+    if os.path.isabs(script) or not os.path.isfile(source):
+        return
+    dirname = os.path.dirname(script)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    shutil.copyfile(source, script)
+
+
+def read_lines(fd, lines=None, filename=None):
+    """Read lines from a binary temporary file into a log capture"""
+    fd.seek(0)
+    return LogCapture(filename, lines).read(fd)
+
+
+def get_retval(status):
+    """Get a return value from a wait status, negative for a signal"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def run(cmd, lines=None, prefix=None):
+    """Run a command with output and error going to temporary files (so a
+    large output can't block a pipe) and return a result. We wait with wait4
+    to get the resource usage of the command, including the cpu seconds (user
+    and system) and the peak resident memory (in KB on Linux). The output and
+    error are capped to lines from the start and end, and with a log prefix,
+    the full output and error are written to files that start with it.
+    """
+    devnull = open(os.devnull, "r")
+    output = tempfile.TemporaryFile()
+    error = tempfile.TemporaryFile()
+    start = time.time()
+    cpu_seconds = max_rss_kb = None
+    try:
+        process = subprocess.Popen(cmd, stdin=devnull, stdout=output, stderr=error)
+        _, status, usage = os.wait4(process.pid, 0)
+        retval = process.returncode = get_retval(status)
+        cpu_seconds = round(usage.ru_utime + usage.ru_stime, 2)
+        max_rss_kb = usage.ru_maxrss
+    except OSError as e:
+        retval = 127
+        error.write(("%s\n" % e).encode("utf-8"))
+    end = time.time()
+    devnull.close()
+    result = {
+        "retval": retval,
+        "seconds": round(end - start, 2),
+        "cpu_seconds": cpu_seconds,
+        "max_rss_kb": max_rss_kb,
+    }
+    for stream, fd in [("output", output), ("error", error)]:
+        filename = get_log_path(prefix, stream) if prefix else None
+        capture = read_lines(fd, lines, filename)
+        result[stream] = capture.get_lines()
+        result["%s_lines" % stream] = capture.count
+        result["%s_sha256" % stream] = capture.sha256.hexdigest()
+        fd.close()
+    return result
+
+
+def emit(record):
+    """Write a result record to stdout, so the host can stream it back"""
+    sys.stdout.write(MARKER + json.dumps(record) + "\n")
+    sys.stdout.flush()
+
+
+def main(args):
+    emit({"name": "start"})
+    freeze = lines = logs = tests = None
+    while args and args[0].startswith("--"):
+        flag = args.pop(0)
+        if flag == "--freeze":
+            freeze = True
+        elif flag == "--lines":
+            lines = int(args.pop(0))
+        elif flag == "--logs":
+            logs = args.pop(0)
+        elif flag == "--tests":
+            tests = args.pop(0)
+
+    if freeze:
+        result = run(["pip", "freeze"])
+        emit(
+            {
+                "name": "requirements.txt",
+                "output": result["output"],
+                "seconds": result["seconds"],
+            }
+        )
+
+    for script in args:
+        if tests:
+            copy_test(tests, script)
+        result = run(
+            [sys.executable, script],
+            lines,
+            get_log_prefix(logs, script) if logs else None,
+        )
+        result["name"] = script
+        emit(result)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,90 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.command import CommandRunner
+
+import re
+import time
+
+
+class TimedCommandRunner(CommandRunner):
+    """A Timed Command Runner also records the time that each line of output
+    or error was seen, and how long the command took, so we can derive the
+    time taken by each step of a docker build.
+    """
+
+    def reset(self):
+        super().reset()
+        self.times = []
+        self.seconds = None
+
+    def reader(self, stream, context):
+        """Get output and error lines and save to command runner, with times"""
+        lines = self.error
+        if context == "stdout":
+            lines = self.output
+
+        while True:
+            s = stream.readline()
+            if not s:
+                break
+            line = s.decode("utf-8")
+            lines.append(line)
+            self.times.append((time.time(), line))
+        stream.close()
+
+    def run_command(self, cmd, env=None, **kwargs):
+        start = time.time()
+        output = super().run_command(cmd, env=env, **kwargs)
+        self.end = time.time()
+        self.start = start
+        self.seconds = round(self.end - start, 2)
+        return output
+
+
+# A step in the output of the classic builder, or BuildKit (plain progress)
+step_regex = re.compile(r"^Step [0-9]+/[0-9]+ : (?P<step>.+)$")
+buildkit_regex = re.compile(r"^#(?P<id>[0-9]+) \[[^]]+\] (?P<step>.+)$")
+buildkit_done_regex = re.compile(
+    r"^#(?P<id>[0-9]+) (DONE|CACHED) ?(?P<seconds>[0-9.]+)?s?"
+)
+
+
+def get_build_steps(runner):
+    """Given a timed runner used for a docker build, return a list of steps,
+    each a dict with the step (the Dockerfile line) and seconds. For the
+    classic builder a step ends when the next starts, and BuildKit reports the
+    time it took for each (a cached step takes no time).
+    """
+    steps = []
+    buildkit = {}
+    for timestamp, line in runner.times:
+        line = line.strip()
+        match = step_regex.search(line)
+        if match:
+            steps.append({"step": match["step"], "start": timestamp})
+            continue
+        match = buildkit_regex.search(line)
+        if match and match["id"] not in buildkit:
+            buildkit[match["id"]] = {"step": match["step"], "seconds": 0}
+            steps.append(buildkit[match["id"]])
+            continue
+        match = buildkit_done_regex.search(line)
+        if match and match["id"] in buildkit:
+            buildkit[match["id"]]["seconds"] = float(match["seconds"] or 0)
+
+    # Steps from the classic builder end at the start of the next step
+    for i, step in enumerate(steps):
+        if "start" not in step:
+            continue
+        end = runner.end
+        if i + 1 < len(steps) and "start" in steps[i + 1]:
+            end = steps[i + 1]["start"]
+        step["seconds"] = round(end - step.pop("start"), 2)
+    return steps
+
+
+def get_step_seconds(steps, pattern):
+    """Sum the seconds for build steps that match a pattern (e.g., pip install)"""
+    return round(sum(x["seconds"] for x in steps if re.search(pattern, x["step"])), 2)
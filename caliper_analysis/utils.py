@@ -0,0 +1,51 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import json
+import os
+import re
+import tempfile
+
+
+def write_json_atomic(json_obj, filename, pretty=True):
+    """Write json to a temporary file in the same directory and then rename
+    it into place, so a reader (or a crashed worker) never sees a partial
+    result file. The temporary file is hidden so glob("*") skips it.
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmpfile = tempfile.mkstemp(dir=dirname, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as filey:
+            if pretty:
+                filey.writelines(json.dumps(json_obj, indent=4, separators=(",", ": ")))
+            else:
+                filey.writelines(json.dumps(json_obj))
+            filey.flush()
+            os.fsync(filey.fileno())
+        os.replace(tmpfile, filename)
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+    return filename
+
+
+def version_key(version):
+    """A sort key for release versions, where a pre-release (a, b, rc) sorts
+    before its release (StrictVersion does not understand rc, and sorting by
+    string puts 1.10 before 1.2). Anything that doesn't parse sorts last.
+    """
+    match = re.match(r"^v?(?P<release>[0-9]+(?:[.][0-9]+)*)(?P<rest>.*)$", version)
+    if not match:
+        return ((float("inf"),), 1, "", 0, version)
+    release = tuple(int(x) for x in match["release"].split("."))
+
+    # Drop trailing zeros so 1.0 and 1.0.0 compare equal
+    while len(release) > 1 and release[-1] == 0:
+        release = release[:-1]
+    pre = re.match(
+        r"^[.-]?(?P<kind>a|b|c|rc|alpha|beta)[.-]?(?P<num>[0-9]*)", match["rest"]
+    )
+    if pre:
+        return (release, 0, pre["kind"], int(pre["num"] or 0), version)
+    return (release, 1, "", 0, version)
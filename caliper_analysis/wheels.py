@@ -0,0 +1,193 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.command import wget
+from caliper.utils.file import mkdir_p
+from caliper.logger import logger
+from .fingerprint import hash_content, hash_file
+
+import fcntl
+import os
+import shutil
+import tempfile
+
+
+class Wheelhouse:
+    """A Wheelhouse is a content addressed cache of release files (wheels or
+    source archives). Files are stored under sha256/<digest>/<filename>, and a
+    small index maps each url to the digest of its content, so each url is
+    fetched once across the whole grid (and across runs). An index directory
+    can stand in for the remote, in which case files are looked up by name.
+    """
+
+    def __init__(self, root, index=None):
+        self.root = os.path.abspath(root)
+        self.index = os.path.abspath(index) if index else None
+        for dirname in ["sha256", "urls"]:
+            mkdir_p(os.path.join(self.root, dirname))
+
+    def __str__(self):
+        return "[wheelhouse:%s]" % self.root
+
+    def __repr__(self):
+        return self.__str__()
+
+    def get_path(self, digest, filename):
+        """Get the path to a file in the wheelhouse, given its digest"""
+        return os.path.join(self.root, "sha256", digest, filename)
+
+    def get_digest(self, path):
+        """Get the digest of a file in the wheelhouse from its path"""
+        return os.path.basename(os.path.dirname(path))
+
+    def get(self, url, filename, sha256=None):
+        """Get a release file, fetching it only if we don't have it. The
+        expected sha256 (from pypi) is checked for a file fetched from the
+        remote or the index. A lock per url ensures concurrent workers fetch
+        it once.
+        """
+        urlfile = os.path.join(self.root, "urls", hash_content(url))
+        with open("%s.lock" % urlfile, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                path = self._lookup(urlfile, filename)
+                if not path:
+                    path = self._fetch(url, filename, sha256)
+                    with open(urlfile, "w") as fd:
+                        fd.write(self.get_digest(path))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return path
+
+    def _lookup(self, urlfile, filename):
+        """Look up a url in the index, returning the path if we have it"""
+        if not os.path.exists(urlfile):
+            return
+        with open(urlfile, "r") as fd:
+            path = self.get_path(fd.read().strip(), filename)
+        if os.path.exists(path):
+            return path
+
+    def _fetch(self, url, filename, sha256=None):
+        """Fetch a file into a temporary location, and move it to its address"""
+        fd, tmpfile = tempfile.mkstemp(dir=self.root, prefix=".", suffix=".tmp")
+        os.close(fd)
+        try:
+            if self.index:
+                source = os.path.join(self.index, filename)
+                if not os.path.exists(source):
+                    raise FileNotFoundError("%s is not in %s" % (filename, self.index))
+                shutil.copyfile(source, tmpfile)
+            else:
+                logger.info("Downloading %s" % url)
+                wget(url, tmpfile, chunk_size=1024 * 1024)
+
+            digest = hash_file(tmpfile)
+            if sha256 and digest != sha256:
+                raise ValueError(
+                    "%s has sha256 %s, expected %s" % (filename, digest, sha256)
+                )
+
+            path = self.get_path(digest, filename)
+            mkdir_p(os.path.dirname(path))
+            os.replace(tmpfile, path)
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+        return path
+
+
+def parse_wheel_tags(filename):
+    """Parse the python, abi and platform tags from a wheel filename
+    (name-version[-build]-python-abi-platform.whl), where each tag can be a
+    compressed set separated by a period. Returns None if not a wheel.
+    """
+    if not filename.endswith(".whl"):
+        return
+    parts = filename[: -len(".whl")].split("-")
+    if len(parts) not in [5, 6]:
+        return
+    python, abi, platform = parts[-3:]
+    return {
+        "python": set(python.split(".")),
+        "abi": set(abi.split(".")),
+        "platform": set(platform.split(".")),
+    }
+
+
+def get_supported_tags(python_version):
+    """Given a Python version tag for a grid cell (e.g., cp36) return the
+    python and abi tags that the python:X.Y base image can install. The images are built with wide unicode for 2.7
+    (cp27mu) and pymalloc before 3.8 (cp36m).
+    """
+    digits = python_version.lower().lstrip("cp")
+    major, minor = digits[0], digits[1:]
+    python = {python_version, "py%s" % major, "py%s%s" % (major, minor)}
+
+    if major == "2":
+        abi = {"cp%s%smu" % (major, minor)}
+    elif int(minor or 0) < 8:
+        abi = {"cp%s%sm" % (major, minor)}
+    else:
+        abi = {"cp%s%s" % (major, minor)}
+    abi.add("none")
+    if major == "3":
+        abi.add("abi3")
+    return {"python": python, "abi": abi}
+
+
+def is_supported_platform(platform):
+    """Determine if a platform tag can be installed on linux x86_64"""
+    return platform == "any" or (
+        platform.endswith("x86_64")
+        and (platform.startswith("manylinux") or platform == "linux_x86_64")
+    )
+
+
+def check_release(release, python_version):
+    """Check that a release file can be installed for a grid cell, returning
+    None if it can, and otherwise a reason that it cannot. Source archives
+    are assumed to be installable.
+    """
+    tags = parse_wheel_tags(release["filename"])
+    if tags is None:
+        return
+
+    supported = get_supported_tags(python_version)
+    if not tags["python"] & supported["python"]:
+        return "python tag %s is not %s" % (
+            ".".join(sorted(tags["python"])),
+            python_version,
+        )
+    if not tags["abi"] & supported["abi"]:
+        return "abi tag %s is not one of %s" % (
+            ".".join(sorted(tags["abi"])),
+            ", ".join(sorted(supported["abi"])),
+        )
+    if not any(is_supported_platform(x) for x in tags["platform"]):
+        return "platform tag %s is not linux x86_64" % ".".join(
+            sorted(tags["platform"])
+        )
+
+
+def find_release(releases, python_version):
+    """Given the releases (filtered by platform) for a version, find one that
+    can be installed for a Python version. Releases for the Python version
+    are preferred, and then any other wheel with compatible tags (e.g., py3).
+    Returns the release (or None) and a list of reasons releases were skipped.
+    """
+    candidates = [x for x in releases if x["python_version"] == python_version]
+    candidates += [
+        x
+        for x in releases
+        if x["python_version"] != python_version and parse_wheel_tags(x["filename"])
+    ]
+
+    reasons = []
+    for release in candidates:
+        reason = check_release(release, python_version)
+        if not reason:
+            return release, reasons
+        reasons.append("%s: %s" % (release["filename"], reason))
+    return None, reasons
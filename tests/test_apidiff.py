@@ -0,0 +1,147 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.file import write_json
+from caliper_analysis.apidiff import ApiTable, iter_api
+
+import importlib.util
+import json
+import os
+import pytest
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+
+# A small functiondb, with versions out of order (1.10.0 sorts after 1.9.0)
+db = {
+    "1.10.0": {
+        "pkg": {"add": ["x", "y", "name"], "Session": {"run": ["self", "fetches"]}},
+        "pkg.nn": {"relu": ["features"], "gelu": ["features"]},
+    },
+    "1.2.0": {
+        "pkg": {
+            "add": ["x", "y"],
+            "sub": ["x", "y"],
+            "Session": {"__init__": ["self"], "run": ["self", "fetches"]},
+            "version": "1.2.0",
+        },
+        "pkg.nn": {"relu": ["features"], "dropout": ["x", "rate"]},
+    },
+    "1.9.0": {
+        "pkg": {
+            "add": ["x", "y"],
+            "Session": {"__init__": ["self"], "run": ["self", "fetches"]},
+        },
+        "pkg.nn": {"relu": ["features"], "dropout": ["rate", "x"]},
+        "pkg.contrib": {"layers": ["inputs"]},
+    },
+}
+
+
+@pytest.fixture
+def table():
+    table = ApiTable()
+    for version, lookup in db.items():
+        table.add(version, lookup)
+    return table
+
+
+def test_iter_api():
+    api = dict(iter_api(db["1.2.0"]))
+    assert api[("pkg", "add")] == ("x", "y")
+    assert api[("pkg", "Session.run")] == ("self", "fetches")
+    assert api[("pkg.nn", "dropout")] == ("x", "rate")
+
+    # Values that are not functions are skipped
+    assert ("pkg", "version") not in api
+    assert len(api) == 6
+
+
+def test_versions_sorted_by_release(table):
+    assert table.get_versions() == ["1.2.0", "1.9.0", "1.10.0"]
+
+
+def test_diff_added_removed_changed(table):
+    diff = table.diff("1.2.0", "1.9.0")
+    assert diff == {
+        "from": "1.2.0",
+        "to": "1.9.0",
+        "added": 1,
+        "removed": 1,
+        "changed": 1,
+        "modules": {
+            "pkg": {"removed": ["sub"]},
+            "pkg.contrib": {"added": ["layers"]},
+            "pkg.nn": {
+                "changed": [
+                    {"name": "dropout", "from": ["x", "rate"], "to": ["rate", "x"]}
+                ]
+            },
+        },
+    }
+
+    # Going back, added and removed swap, and the change is reversed
+    diff = table.diff("1.9.0", "1.2.0")
+    assert diff["modules"]["pkg"] == {"added": ["sub"]}
+    assert diff["modules"]["pkg.contrib"] == {"removed": ["layers"]}
+    assert diff["modules"]["pkg.nn"]["changed"][0]["to"] == ["x", "rate"]
+
+
+def test_diff_class_functions(table):
+    diff = table.diff("1.9.0", "1.10.0")
+    assert diff["added"] == 1
+    assert diff["removed"] == 3
+    assert diff["changed"] == 1
+    assert diff["modules"]["pkg"] == {
+        "removed": ["Session.__init__"],
+        "changed": [{"name": "add", "from": ["x", "y"], "to": ["x", "y", "name"]}],
+    }
+    assert diff["modules"]["pkg.nn"] == {"added": ["gelu"], "removed": ["dropout"]}
+    assert diff["modules"]["pkg.contrib"] == {"removed": ["layers"]}
+
+
+def test_diff_same_version(table):
+    diff = table.diff("1.9.0", "1.9.0")
+    assert (diff["added"], diff["removed"], diff["changed"]) == (0, 0, 0)
+    assert diff["modules"] == {}
+
+
+def test_iter_diffs_adjacent_versions(table):
+    diffs = list(table.iter_diffs())
+    assert [(x["from"], x["to"]) for x in diffs] == [
+        ("1.2.0", "1.9.0"),
+        ("1.9.0", "1.10.0"),
+    ]
+    assert diffs[0] == table.diff("1.2.0", "1.9.0")
+    assert diffs[1] == table.diff("1.9.0", "1.10.0")
+
+    # The first version has no predecessor, so it is never compared to
+    assert "1.2.0" not in [x["to"] for x in diffs]
+
+
+def test_iter_diffs_single_version():
+    table = ApiTable()
+    table.add("1.0.0", db["1.2.0"])
+    assert list(table.iter_diffs()) == []
+    assert list(ApiTable().iter_diffs()) == []
+
+
+def test_extract_api_changes(tmp_path):
+    """The --diff option of 2.assess_change.py writes a line for each step"""
+    filename = os.path.join(root, "2.assess_change.py")
+    spec = importlib.util.spec_from_file_location("assess_change", filename)
+    assess = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(assess)
+
+    funcdb = str(tmp_path / "functiondb-results.json")
+    write_json(db, funcdb)
+    outfile = assess.extract_api_changes(str(tmp_path), funcdb, "package")
+    assert os.path.basename(outfile) == "pypi-package-api-diff.jsonl"
+    with open(outfile) as fd:
+        lines = [json.loads(line) for line in fd]
+
+    table = ApiTable()
+    for version, lookup in db.items():
+        table.add(version, lookup)
+    assert lines == list(table.iter_diffs())
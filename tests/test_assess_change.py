@@ -0,0 +1,310 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+# The scores from 2.assess_change.py are checked against the pairwise loops it
+# used before the signatures were encoded and scored with a sparse product
+
+from caliper.utils.file import read_json, write_json
+from caliper_analysis.similarity import load_matrices
+
+import importlib.util
+import numpy
+import os
+import pytest
+import random
+import re
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+
+
+@pytest.fixture(scope="module")
+def assess():
+    """Load 2.assess_change.py as a module"""
+    filename = os.path.join(root, "2.assess_change.py")
+    spec = importlib.util.spec_from_file_location("assess_change", filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def information_coefficient(total1, total2, intersect):
+    return 2.0 * intersect / (total1 + total2)
+
+
+def get_functions(lookup, include_args=False):
+    """Flatten a functiondb lookup into signatures, as before"""
+    funcs = []
+    for name, items in lookup.items():
+        for func, args in items.items():
+            if isinstance(args, list) and include_args:
+                funcs.append("%s.%s:%s" % (name, func, "-".join(sorted(args))))
+            elif isinstance(args, list) and not include_args:
+                funcs.append("%s.%s" % (name, func))
+            elif isinstance(args, dict):
+                for classfunc, classargs in args.items():
+                    if isinstance(classargs, list) and include_args:
+                        funcs.append(
+                            "%s.%s:%s" % (name, func, "-".join(sorted(classargs)))
+                        )
+                    elif isinstance(classargs, list) and not include_args:
+                        funcs.append("%s.%s.%s" % (name, func, classfunc))
+    return funcs
+
+
+def get_function_sims(db):
+    """Score each pair of versions of a functiondb, as before"""
+    sims = {}
+    for version1, db1 in db.items():
+        for version2, db2 in db.items():
+            key = "..".join(sorted([version1, version2]))
+            if key in sims:
+                continue
+            if version1 == version2:
+                sims[key] = {"module_sim": 1, "func_args_sim": 1, "func_sim": 1}
+                continue
+            scores = {}
+            modules1 = set(db1.keys())
+            modules2 = set(db2.keys())
+            scores["module_sim"] = information_coefficient(
+                len(modules1), len(modules2), len(modules1.intersection(modules2))
+            )
+            funcs1 = set(get_functions(db1, include_args=True))
+            funcs2 = set(get_functions(db2, include_args=True))
+            scores["func_args_sim"] = information_coefficient(
+                len(funcs1), len(funcs2), len(funcs1.intersection(funcs2))
+            )
+            funcs1 = set(x.split(":")[0] for x in funcs1)
+            funcs2 = set(x.split(":")[0] for x in funcs2)
+            scores["func_sim"] = information_coefficient(
+                len(funcs1), len(funcs2), len(funcs1.intersection(funcs2))
+            )
+            sims[key] = scores
+    return sims
+
+
+def get_requirements_sims(requirements):
+    """Score each pair of requirements (keyed by result file), as before"""
+    sims = {}
+    for filename1, modules1 in requirements.items():
+        for filename2, modules2 in requirements.items():
+            uid1 = os.path.basename(filename1).rstrip(".json")
+            uid2 = os.path.basename(filename2).rstrip(".json")
+            key = "..".join(sorted([uid1, uid2]))
+            if key in sims:
+                continue
+            if uid1 == uid2:
+                sims[key] = {"module_sim": 1, "module_version_sim": 1}
+                continue
+            scores = {}
+            modules1 = set(modules1)
+            modules2 = set(modules2)
+            scores["module_version_sim"] = information_coefficient(
+                len(modules1), len(modules2), len(modules1.intersection(modules2))
+            )
+            funcs1 = set(re.split("(==|@)", x)[0].strip().lower() for x in modules1)
+            funcs2 = set(re.split("(==|@)", x)[0].strip().lower() for x in modules2)
+            scores["module_sim"] = information_coefficient(
+                len(funcs1), len(funcs2), len(funcs1.intersection(funcs2))
+            )
+            sims[key] = scores
+    return sims
+
+
+def read_requirements(assess, datadir, package):
+    """Read the requirements of each result file, as before"""
+    requirements = {}
+    for filename in assess.iter_files(datadir, package):
+        if re.search("(rc|b|a)", os.path.basename(filename)):
+            continue
+        result = read_json(filename)
+        if "requirements.txt" in result:
+            requirements[filename] = [
+                x.strip().lower() for x in result["requirements.txt"]
+            ]
+    return requirements
+
+
+def assert_same(sims, expected):
+    assert set(sims) == set(expected)
+    for key, scores in expected.items():
+        assert set(sims[key]) == set(scores)
+        for name, score in scores.items():
+            assert sims[key][name] == score, (key, name)
+
+
+def get_lookup(rng):
+    """A random functiondb lookup for a version, with edge cases: classes with
+    no methods, non-list values, arguments in any order, and overloaded
+    class methods that collapse to the same function.
+    """
+    lookup = {}
+    for module in rng.sample(["pkg", "pkg.a", "pkg.b", "pkg.c.d", "pkg.e"], 3):
+        items = {"main": rng.sample(["x", "y", "z"], rng.randint(0, 3))}
+        for func in rng.sample(["f", "g", "h", "Klass", "Empty", "value"], 4):
+            if func == "Klass":
+                items[func] = {
+                    "__init__": ["self"],
+                    "run": rng.sample(["self", "a", "b"], rng.randint(1, 3)),
+                    "attr": 3,
+                }
+            elif func == "Empty":
+                items[func] = {}
+            elif func == "value":
+                items[func] = "constant"
+            else:
+                items[func] = rng.sample(["a", "b", "c", "d"], rng.randint(0, 3))
+        lookup[module] = items
+    lookup["pkg.empty"] = {}
+    return lookup
+
+
+@pytest.fixture(scope="module")
+def functiondb(tmp_path_factory):
+    """A synthetic functiondb with 25 versions, some of them identical"""
+    rng = random.Random(0)
+    db = {}
+    for i in range(25):
+        version = "1.%s.0" % i
+        db[version] = db["1.%s.0" % (i - 1)] if i % 6 == 5 else get_lookup(rng)
+    filename = str(tmp_path_factory.mktemp("funcdb") / "functiondb-results.json")
+    write_json(db, filename)
+    return filename, db
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_function_sims(assess, functiondb, tmp_path, cache):
+    filename, db = functiondb
+    cache = str(tmp_path / "cache") if cache else None
+
+    # With a cache, the second run loads the encoded signatures from it
+    for _ in range(2 if cache else 1):
+        outfile = assess.extract_function_changes(
+            str(tmp_path), filename, "package", cache=cache
+        )
+        assert_same(read_json(outfile), get_function_sims(db))
+
+
+def test_function_sims_incremental(assess, functiondb, tmp_path):
+    filename, db = functiondb
+    versions = list(db)
+    first = str(tmp_path / "first.json")
+    write_json({v: db[v] for v in versions[:20] + versions[21:]}, first)
+    assess.extract_function_changes(str(tmp_path), first, "package", incremental=True)
+
+    # One version is new, one changed, and one removed
+    changed = dict(db)
+    changed[versions[3]] = changed[versions[4]]
+    del changed[versions[10]]
+    second = str(tmp_path / "second.json")
+    write_json(changed, second)
+    outfile = assess.extract_function_changes(
+        str(tmp_path), second, "package", incremental=True
+    )
+    assert_same(read_json(outfile), get_function_sims(changed))
+
+    # The matrices for plotting are float32, and the state is at full precision
+    labels, matrices = load_matrices(outfile.replace(".json", ".npz"))
+    assert labels == list(changed)
+    assert all(matrix.dtype == numpy.float32 for matrix in matrices.values())
+    state = outfile.replace(".json", "-state.npz")
+    assert all(x.dtype == numpy.float64 for x in load_matrices(state)[1].values())
+
+    # A full run removes the state, which would not match its digests
+    assess.extract_function_changes(str(tmp_path), first, "package")
+    assert not os.path.exists(state)
+    outfile = assess.extract_function_changes(
+        str(tmp_path), second, "package", incremental=True
+    )
+    assert_same(read_json(outfile), get_function_sims(changed))
+
+
+@pytest.mark.parametrize("error", [0.05, 0.1])
+def test_function_sims_approximate(assess, functiondb, tmp_path, error):
+    filename, db = functiondb
+    outfile = assess.extract_function_changes(
+        str(tmp_path), filename, "package", approximate=True, error=error
+    )
+    assert outfile.endswith("-approximate-sims.json")
+    sims = read_json(outfile)
+    expected = get_function_sims(db)
+    assert set(sims) == set(expected)
+
+    # Estimates are within the error of the exact scores
+    diff = numpy.array(
+        [
+            sims[key][name] - score
+            for key, scores in expected.items()
+            for name, score in scores.items()
+        ]
+    )
+    assert numpy.sqrt(numpy.mean(diff**2)) <= 1.1 * error
+    assert numpy.abs(diff).max() <= 5 * error
+
+
+def test_find_similar(assess, functiondb, capsys):
+    filename, db = functiondb
+    versions = list(db)
+    expected = get_function_sims(db)
+    for version in [versions[4], versions[10]]:
+        rows = assess.find_similar(filename, "package", version, 0.8, 0.05)
+        found = dict(rows)
+        assert version not in found
+        assert all(scores["func_sim"] >= 0.8 for scores in found.values())
+
+        # A version with the same functions (every sixth is a copy of the
+        # one before it) is always found, with the same estimate
+        for other in versions:
+            if other != version and db[other] == db[version]:
+                assert found[other]["func_sim"] == 1
+
+        # And so is every version well above the threshold
+        for other in versions:
+            key = "..".join(sorted([version, other]))
+            if other != version and expected[key]["func_sim"] >= 0.95:
+                assert other in found
+        assert "func_sim" in capsys.readouterr().out
+
+    with pytest.raises(SystemExit):
+        assess.find_similar(filename, "package", "0.0.0")
+
+
+def test_requirements_sims(assess, tmp_path):
+    rng = random.Random(0)
+    datadir = tmp_path / "data"
+    datadir.mkdir()
+    names = ["numpy", "six", "Protobuf", "wheel", "mock", "grpcio", "termcolor"]
+    for i in range(12):
+        for python in ["cp36", "cp37"]:
+            result = {"tests": {}}
+            if i != 7:
+                result["requirements.txt"] = [
+                    "%s==1.%s.0\n" % (name, rng.randint(0, 2))
+                    for name in rng.sample(names, rng.randint(1, len(names)))
+                ]
+                result["requirements.txt"].append("tensorflow @ file:///tmp/tf.whl\n")
+                result["requirements.txt"].append("SIX==1.0.0\n")
+            filename = "pypi-tensorflow-1.%s.0-python-%s.json" % (i, python)
+            write_json(result, str(datadir / filename))
+
+    # Release candidates are skipped
+    write_json(
+        {"requirements.txt": ["six==1\n"]},
+        str(datadir / "pypi-tensorflow-2.0.0rc1-python-cp36.json"),
+    )
+
+    outfile = assess.extract_requirements(str(datadir), str(tmp_path), "tensorflow")
+    expected = get_requirements_sims(
+        read_requirements(assess, str(datadir), "tensorflow")
+    )
+    assert_same(read_json(outfile), expected)
+
+
+def test_requirements_sims_results(assess, tmp_path):
+    datadir = os.path.join(root, ".caliper", "data")
+    requirements = read_requirements(assess, datadir, "tensorflow")
+    if not requirements:
+        pytest.skip("There are no tensorflow results in .caliper/data")
+    outfile = assess.extract_requirements(datadir, str(tmp_path), "tensorflow")
+    assert_same(read_json(outfile), get_requirements_sims(requirements))
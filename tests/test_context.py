@@ -0,0 +1,53 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper_analysis.context import prepare_context, sweep_contexts
+
+import os
+import pytest
+
+
+@pytest.fixture
+def files(tmp_path):
+    """A helper and a release file to put in a context"""
+    (tmp_path / "helpers").mkdir()
+    (tmp_path / "helpers" / "input_data.py").write_text("data = 1\n")
+    (tmp_path / "six-1.0-py2.py3-none-any.whl").write_bytes(b"wheel")
+    return {
+        "helpers/input_data.py": str(tmp_path / "helpers" / "input_data.py"),
+        "six-1.0-py2.py3-none-any.whl": str(tmp_path / "six-1.0-py2.py3-none-any.whl"),
+    }
+
+
+def test_prepare_context(tmp_path, files):
+    context = prepare_context(str(tmp_path / "contexts"), files)
+    assert sorted(os.listdir(context)) == ["helpers", "six-1.0-py2.py3-none-any.whl"]
+    with open(os.path.join(context, "helpers", "input_data.py")) as fd:
+        assert fd.read() == "data = 1\n"
+
+
+def test_identical_contexts_are_shared(tmp_path, files):
+    context_dir = str(tmp_path / "contexts")
+    context = prepare_context(context_dir, files)
+    mtime = os.stat(context).st_mtime_ns
+    assert prepare_context(context_dir, dict(files)) == context
+    assert os.stat(context).st_mtime_ns == mtime
+    assert os.listdir(context_dir) == [os.path.basename(context)]
+
+    # A different file is a different context
+    with open(files["helpers/input_data.py"], "a") as fd:
+        fd.write("data = 2\n")
+    assert prepare_context(context_dir, files) != context
+
+
+def test_sweep_contexts(tmp_path, files):
+    context_dir = str(tmp_path / "contexts")
+    prepare_context(context_dir, files)
+    os.mkdir(os.path.join(context_dir, ".context-partial"))
+    sweep_contexts(context_dir)
+    assert os.listdir(context_dir) == []
+
+    # The files the contexts were linked from are still there
+    assert all(os.path.exists(filename) for filename in files.values())
+    sweep_contexts(str(tmp_path / "missing"))
@@ -0,0 +1,72 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper_analysis.fingerprint import get_fingerprint, get_stale_tests
+
+import os
+import pytest
+
+
+@pytest.fixture
+def root(tmp_path):
+    """A build root with two tests"""
+    for name in ["one.py", "two.py"]:
+        (tmp_path / name).write_text("print('%s')\n" % name)
+    return str(tmp_path)
+
+
+def get_result(fingerprint, tests=None, build=None):
+    """A previous result for a fingerprint, with a passing build by default"""
+    tests = tests or {}
+    tests["build"] = build or {"retval": 0, "status": "passed"}
+    return {"inputs": {"fingerprint": fingerprint}, "tests": tests}
+
+
+def test_current_result_is_not_stale(root):
+    fingerprint = get_fingerprint("1.0", "cp36", "FROM python", ["one.py"], root)
+    previous = get_result(fingerprint, {"one.py": {"retval": 0}})
+    assert get_stale_tests(previous, fingerprint) == []
+
+
+def test_changed_test_is_stale(root):
+    tests = ["one.py", "two.py"]
+    before = get_fingerprint("1.0", "cp36", "FROM python", tests, root)
+    previous = get_result(before, {"one.py": {"retval": 0}, "two.py": {"retval": 0}})
+    with open(os.path.join(root, "two.py"), "a") as fd:
+        fd.write("print('changed')\n")
+    after = get_fingerprint("1.0", "cp36", "FROM python", tests, root)
+    assert get_stale_tests(previous, after) == ["two.py"]
+
+
+def test_missing_test_result_is_stale(root):
+    fingerprint = get_fingerprint("1.0", "cp36", "FROM python", ["one.py"], root)
+    previous = get_result(fingerprint)
+    assert get_stale_tests(previous, fingerprint) == ["one.py"]
+
+
+def test_changed_build_redoes_cell(root):
+    before = get_fingerprint("1.0", "cp36", "FROM python", ["one.py"], root)
+    previous = get_result(before, {"one.py": {"retval": 0}})
+    after = get_fingerprint("1.0", "cp36", "FROM python:slim", ["one.py"], root)
+    assert get_stale_tests(previous, after) is None
+
+
+def test_result_without_fingerprint_redoes_cell(root):
+    fingerprint = get_fingerprint("1.0", "cp36", "FROM python", ["one.py"], root)
+    assert get_stale_tests({"tests": {}}, fingerprint) is None
+
+
+def test_failed_install_is_kept(root):
+    fingerprint = get_fingerprint("1.0", "cp36", "FROM python", ["one.py"], root)
+    build = {"retval": 1, "status": "failed", "cause": "install"}
+    previous = get_result(fingerprint, build=build)
+    assert get_stale_tests(previous, fingerprint) == []
+
+
+@pytest.mark.parametrize("cause", ["base-image", "shared-layer", "fetch"])
+def test_transient_failure_redoes_cell(root, cause):
+    fingerprint = get_fingerprint("1.0", "cp36", "FROM python", ["one.py"], root)
+    previous = get_result(fingerprint, build={"retval": 1, "cause": cause})
+    previous["build_retval"] = 1
+    assert get_stale_tests(previous, fingerprint) is None
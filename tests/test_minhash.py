@@ -0,0 +1,165 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper_analysis.minhash import (
+    LSHIndex,
+    MinHash,
+    empty,
+    estimate_dice,
+    get_bands,
+    get_sketch_size,
+)
+from caliper_analysis.similarity import dice_matrix, get_incidence
+
+import numpy
+import pytest
+
+
+def get_sets(seed=0, count=60, size=300):
+    """Random sets of IDs, each drawn from a pool that overlaps with the
+    others by a random amount, so the pairs cover a range of similarity
+    """
+    rng = numpy.random.default_rng(seed)
+    sets = []
+    for _ in range(count):
+        start = rng.integers(0, 2 * size)
+        pool = numpy.arange(start, start + 2 * size)
+        sets.append(numpy.unique(rng.choice(pool, size, replace=False)))
+    return sets
+
+
+def get_variant(items, dice, offset):
+    """Get a set with the same size as items, and a Dice coefficient of dice
+    with it, by replacing some of its items with new ones (from offset)
+    """
+    replace = int(round(len(items) * (1 - dice)))
+    new = numpy.arange(offset, offset + replace)
+    return numpy.unique(numpy.concatenate([items[replace:], new]))
+
+
+def test_sketch_size():
+    assert get_sketch_size(0.02) == 773
+    assert get_sketch_size(0.1) == 31
+    for error in [0, 1, -0.1]:
+        with pytest.raises(ValueError):
+            get_sketch_size(error)
+
+
+@pytest.mark.parametrize("error", [0.02, 0.05, 0.1])
+def test_estimate_within_error(error):
+    sets = get_sets()
+    exact = dice_matrix(get_incidence(sets))
+    estimate = estimate_dice(MinHash(error).sketch_all(sets))
+
+    # The error is a bound on the standard error, which is about reached for
+    # these pairs (a Jaccard near 0.2), with sets smaller than the sketch for
+    # the smallest error. So the root mean square error is about the bound,
+    # most estimates are within twice it, and none are far from it
+    upper = numpy.triu_indices(len(sets), 1)
+    diff = (estimate - exact)[upper]
+    assert numpy.sqrt(numpy.mean(diff**2)) <= 1.1 * error
+    assert numpy.mean(numpy.abs(diff) <= 2 * error) >= 0.93
+    assert numpy.abs(diff).max() <= 5 * error
+    assert numpy.allclose(numpy.diag(estimate), 1)
+
+
+def test_estimate_rows():
+    sets = get_sets(count=10)
+    sketches = MinHash(0.05).sketch_all(sets)
+    full = estimate_dice(sketches)
+    assert numpy.array_equal(estimate_dice(sketches, rows=[3, 7]), full[[3, 7]])
+
+
+def test_sketch_items_or_ids():
+    minhash = MinHash(0.1)
+    names = ["tensorflow.add", "tensorflow.nn.relu", "tensorflow.Session"]
+    assert minhash.sketch(names).shape == (minhash.size,)
+    assert numpy.array_equal(minhash.sketch(names), minhash.sketch(list(names)))
+    ids = numpy.array([4, 8, 15])
+    assert numpy.array_equal(minhash.sketch(ids), minhash.sketch(ids[::-1]))
+
+
+def test_densify_empty_bins():
+    minhash = MinHash(0.02)
+
+    # A single item fills one bin, and every other bin takes its value
+    sketch = minhash.sketch(numpy.array([42]))
+    assert not (sketch == empty).any()
+    assert len(numpy.unique(sketch)) == 1
+
+    # With a few items, each filled bin keeps its own value
+    items = numpy.arange(20)
+    sketch = minhash.sketch(items)
+    assert not (sketch == empty).any()
+    assert 1 < len(numpy.unique(sketch)) <= len(items)
+
+    # So small sets that are the same are estimated to be the same, and
+    # small sets that are disjoint to be different
+    small = [numpy.array([1, 2, 3]), numpy.array([1, 2, 3]), numpy.array([7, 9])]
+    estimate = estimate_dice(minhash.sketch_all(small))
+    assert estimate[0, 1] == 1
+    assert estimate[0, 2] <= minhash.error
+    assert estimate[1, 2] <= minhash.error
+
+
+def test_empty_sets():
+    minhash = MinHash(0.05)
+    assert (minhash.sketch([]) == empty).all()
+    assert (minhash.sketch(numpy.array([], dtype=numpy.int64)) == empty).all()
+
+    # Two empty sketches agree in every bin, so given the sizes, pairs with an
+    # empty set have zero, as for the exact score
+    sets = [numpy.array([], dtype=numpy.int64)] * 2 + [numpy.array([1, 2])]
+    sizes = [len(x) for x in sets]
+    sketches = minhash.sketch_all(sets)
+    assert estimate_dice(sketches)[0, 1] == 1
+    estimate = estimate_dice(sketches, sizes)
+    exact = dice_matrix(get_incidence(sets, columns=3))
+    assert numpy.array_equal(estimate[:2], exact[:2])
+    assert numpy.array_equal(estimate[:, :2], exact[:, :2])
+    assert numpy.array_equal(estimate_dice(sketches, sizes, rows=[0]), exact[[0]])
+
+
+@pytest.mark.parametrize("size", [31, 124, 773])
+@pytest.mark.parametrize("threshold", [0.5, 0.8, 0.9])
+def test_bands(size, threshold):
+    bands, rows = get_bands(size, threshold)
+    assert bands * rows <= size
+    jaccard = threshold / (2 - threshold)
+    assert 1 - (1 - jaccard**rows) ** bands >= 0.99
+
+    # One more row in each band would miss more pairs at the threshold
+    more = size // (rows + 1)
+    assert rows == size or 1 - (1 - jaccard ** (rows + 1)) ** more < 0.99
+
+
+@pytest.mark.parametrize("error", [0.02, 0.05, 0.1])
+@pytest.mark.parametrize("threshold", [0.5, 0.8, 0.9])
+def test_lsh_candidates_above_threshold(error, threshold):
+    rng = numpy.random.default_rng(1)
+    base = numpy.unique(rng.choice(10**6, 400, replace=False))
+    levels = [1.0, 0.99, 0.97, 0.95, 0.92, 0.9, 0.85, 0.8, 0.7, 0.6, 0.5, 0.3, 0.1]
+    sets = [base] + [
+        get_variant(base, dice, 10**7 * (i + 1)) for i, dice in enumerate(levels)
+    ]
+    labels = ["v%s" % i for i in range(len(sets))]
+    exact = dice_matrix(get_incidence(sets))
+    lsh = LSHIndex(labels, MinHash(error).sketch_all(sets), threshold)
+
+    # Every version at or above the threshold is a candidate
+    candidates = lsh.candidates("v0")
+    for i, label in enumerate(labels[1:], 1):
+        if exact[0, i] >= threshold:
+            assert label in candidates, (label, exact[0, i])
+    assert "v0" not in candidates
+
+
+def test_lsh_far_below_threshold():
+    sets = get_sets(seed=3, count=30)
+    labels = ["v%s" % i for i in range(len(sets))]
+    exact = dice_matrix(get_incidence(sets))
+    lsh = LSHIndex(labels, MinHash(0.02).sketch_all(sets), 0.9)
+    for i, label in enumerate(labels):
+        for candidate in lsh.candidates(label):
+            assert exact[i, labels.index(candidate)] > 0.5
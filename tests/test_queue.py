@@ -0,0 +1,92 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper_analysis.queue import WorkQueue
+
+import os
+import pytest
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue"), lease=60, max_attempts=2)
+    queue.publish({"first": {"index": 1}, "second": {"index": 2}})
+    return queue
+
+
+def expire(queue, name):
+    """Make the lease of a claimed task look like it expired"""
+    claimed = queue.get_path("claimed", name)
+    mtime = os.stat(claimed).st_mtime - queue.lease - 1
+    os.utime(claimed, (mtime, mtime))
+
+
+def test_publish_skips_known_tasks(queue):
+    assert queue.publish({"first": {}, "third": {}}) == 1
+    assert queue.counts()["pending"] == 3
+
+
+def test_claim_in_order(queue):
+    name, task = queue.claim("worker")
+    assert task["name"] == "first"
+    assert task["params"] == {"index": 1}
+    assert task["worker"] == "worker"
+    assert queue.list("claimed") == [name]
+
+    name, task = queue.claim("worker")
+    assert task["name"] == "second"
+    assert queue.claim("worker") == (None, None)
+
+
+def test_complete(queue):
+    name, task = queue.claim("worker")
+    queue.complete(name)
+    assert queue.list("done") == [name]
+    assert queue.counts()["claimed"] == 0
+
+
+def test_live_lease_is_kept(queue):
+    name, task = queue.claim("worker")
+    assert queue.renew(name)
+    assert queue.requeue_expired() == 0
+    assert queue.list("claimed") == [name]
+
+
+def test_expired_lease_is_requeued(queue):
+    name, task = queue.claim("worker")
+    expire(queue, name)
+    assert queue.requeue_expired() == 1
+    assert name in queue.list("pending")
+    assert not queue.renew(name)
+
+    # And the next claim gets it again, with an attempt used
+    name, task = queue.claim("other")
+    assert task["name"] == "first"
+    assert task["attempts"] == 1
+
+
+def test_expired_lease_fails_after_attempts(queue):
+    for _ in range(queue.max_attempts):
+        name, task = queue.claim("worker")
+        expire(queue, name)
+        queue.requeue_expired()
+    assert queue.list("failed") == [name]
+
+
+def test_fail_with_retry(queue):
+    name, task = queue.claim("worker")
+    assert queue.fail(name, "error") == "pending"
+    assert name in queue.list("pending")
+
+
+def test_fail_without_retry(queue):
+    name, task = queue.claim("worker")
+    assert queue.fail(name, "exit", retry=False) == "failed"
+    assert queue.list("failed") == [name]
+    assert queue.fail(name, "exit") is None
+
+
+def test_storage_time(queue):
+    assert abs(queue.get_time() - os.stat(queue.root).st_mtime) < 3600
+    assert not [x for x in os.listdir(queue.root) if x.startswith(".clock")]
@@ -0,0 +1,188 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper_analysis.schedule import BisectScheduler, PriorityScheduler
+from caliper_analysis.utils import write_json_atomic
+from caliper.utils.file import read_json
+
+import os
+
+
+def get_tasks(dirname, versions, pythons=("cp36",), tests="test.py"):
+    """Get tasks (as from get_tasks) for a grid of versions and pythons"""
+    tasks = {}
+    for python in pythons:
+        for version in versions:
+            name = "pypi-package-%s-python-%s" % (version, python)
+            params = {
+                "version": version,
+                "python_version": python,
+                "outfile": os.path.join(dirname, "%s.json" % name),
+                "exists": True,
+                "tests": tests,
+            }
+            tasks[name] = (None, params)
+    return tasks
+
+
+def write_result(params, passed, seconds=1):
+    """Write a result for a task where the test passed (or failed)"""
+    result = {
+        "inputs": {"tests": params["tests"]},
+        "tests": {
+            "build": {"retval": 0},
+            params["tests"]: {"retval": 0 if passed else 1},
+        },
+        "timing": {"total": seconds},
+    }
+    write_json_atomic(result, params["outfile"])
+
+
+def run(scheduler, tasks, passes):
+    """Run each round of a scheduler, where passes says if a version passes"""
+    rounds = []
+    for names in scheduler:
+        rounds.append(names)
+        for name in names:
+            params = tasks[name][1]
+            write_result(params, passes(params["version"]))
+    return rounds
+
+
+def test_bisect_finds_transition(tmp_path):
+    versions = ["1.%s" % i for i in range(10)]
+    tasks = get_tasks(str(tmp_path), versions)
+    rounds = run(BisectScheduler(tasks), tasks, lambda v: int(v.split(".")[1]) < 6)
+    ran = [tasks[name][1]["version"] for names in rounds for name in names]
+
+    # The endpoints go first, and the change is found between 1.5 and 1.6
+    assert sorted(ran[:2]) == ["1.0", "1.9"]
+    assert {"1.5", "1.6"} <= set(ran)
+    assert len(ran) < len(versions)
+
+
+def test_bisect_stable_interval_is_not_run(tmp_path):
+    tasks = get_tasks(str(tmp_path), ["1.%s" % i for i in range(10)])
+    rounds = run(BisectScheduler(tasks), tasks, lambda v: True)
+    assert len(rounds) == 1
+    assert len(rounds[0]) == 2
+
+
+def test_bisect_sorts_versions(tmp_path):
+    tasks = get_tasks(str(tmp_path), ["1.10", "1.2", "1.9", "1.2rc1"])
+    scheduler = BisectScheduler(tasks)
+    versions = [tasks[name][1]["version"] for name in scheduler.groups["cp36"]]
+    assert versions == ["1.2rc1", "1.2", "1.9", "1.10"]
+
+
+def test_bisect_groups_by_python(tmp_path):
+    tasks = get_tasks(str(tmp_path), ["1.0", "1.1", "1.2"], ("cp36", "cp37"))
+    first = next(iter(BisectScheduler(tasks)))
+    assert len(first) == 4
+
+
+def test_priority_runs_every_cell_ends_first(tmp_path):
+    versions = ["1.%s" % i for i in range(8)]
+    tasks = get_tasks(str(tmp_path), versions)
+    rounds = run(PriorityScheduler(tasks), tasks, lambda v: True)
+    ran = [tasks[name][1]["version"] for names in rounds for name in names]
+    assert sorted(ran[:2]) == ["1.0", "1.7"]
+    assert sorted(ran) == versions
+
+
+def test_priority_runs_near_a_change_first(tmp_path):
+    versions = ["1.%s" % i for i in range(20)]
+    tasks = get_tasks(str(tmp_path), versions)
+
+    # Results from an earlier run: a change between 1.0 and 1.4, and none
+    # between 1.4 and 1.19
+    for version, passed in [("1.0", False), ("1.4", True), ("1.19", True)]:
+        write_result(tasks["pypi-package-%s-python-cp36" % version][1], passed)
+    scheduler = PriorityScheduler(tasks)
+    first = next(iter(scheduler))
+    assert tasks[first[0]][1]["version"] in ["1.1", "1.2", "1.3"]
+
+
+def test_priority_batch_size(tmp_path):
+    tasks = get_tasks(str(tmp_path), ["1.%s" % i for i in range(10)])
+    rounds = run(PriorityScheduler(tasks, batch_size=4), tasks, lambda v: True)
+    assert [len(names) for names in rounds] == [4, 4, 2]
+
+
+def test_priority_skips_results_unless_rerun(tmp_path):
+    tasks = get_tasks(str(tmp_path), ["1.0", "1.1", "1.2"])
+    write_result(tasks["pypi-package-1.1-python-cp36"][1], True)
+    assert "pypi-package-1.1-python-cp36" not in PriorityScheduler(tasks).pending
+    assert (
+        "pypi-package-1.1-python-cp36" in PriorityScheduler(tasks, force=True).pending
+    )
+
+
+def test_priority_skips_cells_that_cannot_run(tmp_path):
+    tasks = get_tasks(str(tmp_path), ["1.0", "1.1", "1.2"])
+    tasks["pypi-package-1.0-python-cp36"][1]["exists"] = False
+    tasks["pypi-package-1.1-python-cp36"][1]["failure"] = {"cause": "shared-layer"}
+    scheduler = PriorityScheduler(tasks, force=True)
+    assert scheduler.pending == {"pypi-package-1.2-python-cp36"}
+
+
+def test_priority_resume_only_runs_stale_cells(tmp_path):
+    tasks = get_tasks(str(tmp_path), ["1.0", "1.1", "1.2", "1.3"])
+    for name, (_, params) in tasks.items():
+        params["fingerprint"] = {"build": name, "tests": {"test.py": "current"}}
+        write_result(params, True)
+        result = read_json(params["outfile"])
+        result["inputs"]["fingerprint"] = params["fingerprint"]
+        write_json_atomic(result, params["outfile"])
+
+    # A changed build, a changed test, and one without a result
+    tasks["pypi-package-1.0-python-cp36"][1]["fingerprint"]["build"] = "changed"
+    tasks["pypi-package-1.1-python-cp36"][1]["fingerprint"]["tests"]["test.py"] = "x"
+    os.remove(tasks["pypi-package-1.2-python-cp36"][1]["outfile"])
+    scheduler = PriorityScheduler(tasks, resume=True)
+    assert scheduler.pending == {
+        "pypi-package-1.0-python-cp36",
+        "pypi-package-1.1-python-cp36",
+        "pypi-package-1.2-python-cp36",
+    }
+
+
+def test_priority_rerun_uses_known_outcomes(tmp_path):
+    versions = ["1.%s" % i for i in range(20)]
+    tasks = get_tasks(str(tmp_path), versions)
+
+    # Every cell runs again, but the results from before say where the
+    # change is, so the cells next to it go first (and not the ends)
+    for name, (_, params) in tasks.items():
+        write_result(params, int(params["version"].split(".")[1]) < 13)
+    scheduler = PriorityScheduler(tasks, force=True)
+    assert len(scheduler.pending) == len(versions)
+    name, _ = scheduler.pop()
+    assert tasks[name][1]["version"] in ["1.12", "1.13"]
+
+
+def test_priority_pop_and_finish(tmp_path):
+    versions = ["1.%s" % i for i in range(10)]
+    tasks = get_tasks(str(tmp_path), versions)
+    scheduler = PriorityScheduler(tasks)
+    first = [scheduler.pop()[0], scheduler.pop()[0]]
+    assert sorted(tasks[name][1]["version"] for name in first) == ["1.0", "1.9"]
+
+    # While the ends run, a free worker gets a cell in the middle
+    name, _ = scheduler.pop()
+    assert tasks[name][1]["version"] not in ["1.0", "1.9"]
+
+    # When the ends finish with a change, the next cell is between them
+    for done in first:
+        write_result(tasks[done][1], done.endswith("1.0-python-cp36"))
+        scheduler.finish(done)
+    write_result(tasks[name][1], False)
+    scheduler.finish(name)
+    middle = int(tasks[name][1]["version"].split(".")[1])
+    next_name, _ = scheduler.pop()
+    assert 0 < int(tasks[next_name][1]["version"].split(".")[1]) < middle
+
+    while scheduler.pop():
+        pass
+    assert scheduler.pop() is None
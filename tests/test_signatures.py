@@ -0,0 +1,50 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper_analysis.signatures import iter_functiondb, iter_json_object
+
+import io
+import json
+import pytest
+import zipfile
+
+lookups = {
+    "1.0": {"package": {"func": ["a", "b"], "Class": {"method": ["self"]}}},
+    "1.1": {"package.sub": {"func": []}, "pkg": {"x": ["é", '"}\\']}},
+    "2.0": {},
+    "3.0": 12345,
+    "4.0": [1.5, None, True, "{}"],
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1024 * 1024])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_iter_json_object(chunk_size, indent):
+    content = json.dumps(lookups, indent=indent, ensure_ascii=False)
+    pairs = list(iter_json_object(io.StringIO(content), chunk_size))
+    assert [key for key, _ in pairs] == list(lookups)
+    assert dict(pairs) == lookups
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5])
+def test_iter_json_object_empty(chunk_size):
+    assert list(iter_json_object(io.StringIO(" { } "), chunk_size)) == []
+
+
+@pytest.mark.parametrize("content", ["[1, 2]", "", '{"a" 1}', '{"a": [1, 2}'])
+def test_iter_json_object_invalid(content):
+    with pytest.raises(ValueError):
+        list(iter_json_object(io.StringIO(content), 2))
+
+
+def test_iter_functiondb_zip(tmp_path):
+    filename = str(tmp_path / "functiondb.zip")
+    with zipfile.ZipFile(filename, "w") as archive:
+        archive.writestr("functiondb-results.json", json.dumps(lookups))
+    assert dict(iter_functiondb(filename)) == lookups
+
+    filename = str(tmp_path / "functiondb-results.json")
+    with open(filename, "w") as fd:
+        json.dump(lookups, fd)
+    assert dict(iter_functiondb(filename)) == lookups
@@ -0,0 +1,112 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper_analysis.similarity import (
+    SymbolTable,
+    dice_matrix,
+    get_incidence,
+    get_sims,
+    load_matrices,
+    save_matrices,
+    update_matrices,
+)
+
+import numpy
+import pytest
+
+sets = {
+    "1.0": {"a", "b", "c"},
+    "1.1": {"a", "b", "d"},
+    "2.0": {"x"},
+    "3.0": set(),
+}
+
+
+def dice(set1, set2):
+    """The Dice coefficient of two sets, zero if both are empty"""
+    total = len(set1) + len(set2)
+    return 2.0 * len(set1 & set2) / total if total else 0
+
+
+def get_matrix(sets):
+    table = SymbolTable()
+    return dice_matrix(get_incidence([table.encode(x) for x in sets.values()]))
+
+
+def test_symbol_table_encode():
+    table = SymbolTable()
+    assert table.encode(["b", "a", "b"]).tolist() == [0, 1]
+    assert table.encode(["c", "a"]).tolist() == [1, 2]
+    assert table.intern("a") == 1
+    assert len(table) == 3
+
+
+def test_dice_matrix():
+    matrix = get_matrix(sets)
+    labels = list(sets)
+    for i, label1 in enumerate(labels):
+        for j, label2 in enumerate(labels):
+            if i != j:
+                assert matrix[i, j] == pytest.approx(dice(sets[label1], sets[label2]))
+    assert matrix[0, 1] == pytest.approx(2 / 3)
+    assert (matrix == matrix.T).all()
+
+
+def test_dice_matrix_rows():
+    table = SymbolTable()
+    incidence = get_incidence([table.encode(x) for x in sets.values()])
+    full = dice_matrix(incidence)
+    assert numpy.array_equal(dice_matrix(incidence, [1, 3]), full[[1, 3]])
+
+
+def test_get_sims():
+    labels = list(sets)
+    sims = get_sims(labels, {"sim": get_matrix(sets)})
+    assert len(sims) == len(labels) * (len(labels) + 1) // 2
+    assert sims["1.0..1.0"] == {"sim": 1}
+    assert sims["3.0..3.0"] == {"sim": 1}
+    assert sims["1.0..1.1"]["sim"] == pytest.approx(2 / 3)
+    assert sims["1.0..2.0"] == {"sim": 0}
+
+    # Keys are the sorted labels
+    sims = get_sims(["b", "a"], {"sim": numpy.array([[1, 0.5], [0.5, 1]])})
+    assert set(sims) == {"b..b", "a..b", "a..a"}
+
+
+def test_update_matrices(tmp_path):
+    before = {"1.0": sets["1.0"], "1.1": {"a"}, "2.0": sets["2.0"], "4.0": {"y"}}
+    filename = str(tmp_path / "sims.npz")
+    save_matrices(filename, list(before), {"sim": get_matrix(before)}, dtype=float)
+
+    # 1.1 changed, 3.0 is new, and 4.0 was removed
+    table = SymbolTable()
+    incidence = get_incidence([table.encode(x) for x in sets.values()])
+    labels = list(sets)
+    rows = [1, 3]
+    updated = update_matrices(
+        labels, {"sim": dice_matrix(incidence, rows)}, rows, *load_matrices(filename)
+    )
+
+    # The diagonal is set when the scores are saved (or written as json)
+    full = dice_matrix(incidence)
+    numpy.fill_diagonal(full, 1)
+    numpy.fill_diagonal(updated["sim"], 1)
+    assert numpy.array_equal(updated["sim"], full)
+
+
+def test_update_matrices_missing_label(tmp_path):
+    filename = str(tmp_path / "sims.npz")
+    before = {"1.0": sets["1.0"], "1.1": sets["1.1"]}
+    save_matrices(filename, list(before), {"sim": get_matrix(before)}, dtype=float)
+
+    # 2.0 is not new (so is not scored) but the last run doesn't have it
+    matrices = {"sim": numpy.zeros((0, len(sets)))}
+    assert update_matrices(list(sets), matrices, [], *load_matrices(filename)) is None
+
+
+def test_update_matrices_float32(tmp_path):
+    filename = str(tmp_path / "sims.npz")
+    save_matrices(filename, list(sets), {"sim": get_matrix(sets)})
+    matrices = {"sim": numpy.zeros((0, len(sets)))}
+    assert update_matrices(list(sets), matrices, [], *load_matrices(filename)) is None
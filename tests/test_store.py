@@ -0,0 +1,260 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper.utils.file import write_json
+from caliper_analysis.store import ResultStore, parse_requirement
+
+import importlib.util
+import json
+import os
+import pytest
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+
+
+def get_result(version, python="cp36"):
+    """A result for a cell, as saved by the analysis task"""
+    return {
+        "inputs": {
+            "dependency": "tensorflow",
+            "version": version,
+            "python_version": python,
+            "name": "pypi-tensorflow-%s-python-%s" % (version, python),
+            "fingerprint": {"build": "abc123"},
+        },
+        "tests": {
+            "build": {"retval": 0, "status": "passed"},
+            "helloworld.py": {
+                "retval": 0,
+                "status": "passed",
+                "seconds": 1.5,
+                "cpu_seconds": 1.2,
+                "max_rss_kb": 2048,
+                "output": ["Hello, TensorFlow!"],
+                "error": [],
+            },
+            "linear_regression.py": {
+                "retval": 1,
+                "status": "failed",
+                "cause": "test",
+                "seconds": 0.5,
+                "error": ["ImportError"],
+            },
+        },
+        "requirements.txt": [
+            "numpy==1.19.5\n",
+            "Six==1.15.0\n",
+            "tensorflow @ file:///tmp/tensorflow.whl\n",
+            "\n",
+        ],
+        "timing": {"build": 10.0, "tests": 2.0, "total": 12.5},
+    }
+
+
+@pytest.fixture
+def datadir(tmp_path):
+    """A caliper data directory with results for two versions"""
+    datadir = tmp_path / ".caliper" / "data"
+    datadir.mkdir(parents=True)
+    for version in ["1.15.0", "1.2.0"]:
+        filename = "pypi-tensorflow-%s-python-cp36.json" % version
+        write_json(get_result(version), str(datadir / filename))
+
+    # A result from before there were inputs, statuses or a build test
+    write_json(
+        {
+            "build_retval": "1",
+            "tests": {"helloworld.py": {"retval": "1", "error": ["No module"]}},
+        },
+        str(datadir / "pypi-tensorflow-0.12.0-python-cp27.json"),
+    )
+
+    # And a file that is not a result
+    write_json({}, str(datadir / "notes.json"))
+    return datadir
+
+
+@pytest.fixture
+def import_results():
+    """Load 7.import_results.py as a module"""
+    filename = os.path.join(root, "7.import_results.py")
+    spec = importlib.util.spec_from_file_location("import_results", filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_import(import_results, monkeypatch, *args):
+    monkeypatch.setattr("sys.argv", ["7.import_results.py"] + list(args))
+    import_results.main()
+
+
+def count_rows(store):
+    return {
+        table: store.db.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+        for table in ["builds", "tests", "requirements"]
+    }
+
+
+def test_add_result(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    store.add_result(get_result("1.15.0"))
+
+    build = store.db.execute(
+        "SELECT name, retval, status, cause, error, fingerprint, timing FROM builds"
+    ).fetchall()
+    assert build == [
+        (
+            "pypi-tensorflow-1.15.0-python-cp36",
+            0,
+            "passed",
+            None,
+            None,
+            "abc123",
+            json.dumps({"build": 10.0, "tests": 2.0, "total": 12.5}),
+        )
+    ]
+
+    tests = store.get_tests("tensorflow")
+    assert [x["test"] for x in tests] == ["helloworld.py", "linear_regression.py"]
+    assert tests[0] == {
+        "version": "1.15.0",
+        "python": "cp36",
+        "test": "helloworld.py",
+        "retval": 0,
+        "status": "passed",
+        "cause": None,
+        "seconds": 1.5,
+        "cpu_seconds": 1.2,
+        "max_rss_kb": 2048,
+    }
+    assert tests[1]["cause"] == "test"
+    assert tests[1]["max_rss_kb"] is None
+    output, error = store.db.execute(
+        "SELECT output, error FROM tests WHERE test='linear_regression.py'"
+    ).fetchone()
+    assert json.loads(output) == []
+    assert json.loads(error) == ["ImportError"]
+
+    requirements = store.db.execute(
+        "SELECT requirement, name, pin FROM requirements ORDER BY name"
+    ).fetchall()
+    assert requirements == [
+        ("numpy==1.19.5", "numpy", "1.19.5"),
+        ("Six==1.15.0", "six", "1.15.0"),
+        (
+            "tensorflow @ file:///tmp/tensorflow.whl",
+            "tensorflow",
+            "file:///tmp/tensorflow.whl",
+        ),
+    ]
+    store.close()
+
+
+def test_add_result_from_filename(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    result = {"build_retval": 1, "tests": {"helloworld.py": {"retval": "0"}}}
+    store.add_result(result, "/data/pypi-tensorflow-1.0.0rc1-python-cp35.json")
+    assert store.db.execute("SELECT * FROM builds").fetchone()[:6] == (
+        "tensorflow",
+        "1.0.0rc1",
+        "cp35",
+        "pypi-tensorflow-1.0.0rc1-python-cp35",
+        1,
+        "failed",
+    )
+    assert store.get_versions("tensorflow", "cp35", "helloworld.py") == ["1.0.0rc1"]
+
+    with pytest.raises(ValueError):
+        store.add_result(result, "/data/notes.json")
+    store.close()
+
+
+def test_import_results(tmp_path, datadir, import_results, monkeypatch, capsys):
+    caliper = str(tmp_path / ".caliper")
+    run_import(import_results, monkeypatch, "--dir", caliper)
+    assert "Imported 3 results" in capsys.readouterr().out
+
+    store = ResultStore(os.path.join(caliper, "results.db"))
+    assert count_rows(store) == {"builds": 3, "tests": 5, "requirements": 6}
+    assert store.get_versions("tensorflow", "cp36", "helloworld.py") == [
+        "1.2.0",
+        "1.15.0",
+    ]
+    assert store.get_versions("tensorflow", "cp27", "helloworld.py", retval=1) == [
+        "0.12.0"
+    ]
+    legacy = store.get_tests("tensorflow", python="cp27")
+    assert [(x["test"], x["retval"], x["status"]) for x in legacy] == [
+        ("helloworld.py", 1, "failed")
+    ]
+    build = store.db.execute(
+        "SELECT retval, status FROM builds WHERE python='cp27'"
+    ).fetchone()
+    assert build == (1, "failed")
+    store.close()
+
+
+def test_reimport_results(tmp_path, datadir, import_results, monkeypatch):
+    caliper = str(tmp_path / ".caliper")
+    database = str(tmp_path / "other" / "results.db")
+    run_import(import_results, monkeypatch, "--dir", caliper, "--database", database)
+    store = ResultStore(database)
+    counts = count_rows(store)
+
+    # Importing again replaces each cell, instead of adding to it
+    run_import(import_results, monkeypatch, "--dir", caliper, "--database", database)
+    assert count_rows(store) == counts
+
+    # And a cell that is run again only has its new tests and requirements
+    result = get_result("1.15.0")
+    del result["tests"]["linear_regression.py"]
+    result["requirements.txt"] = ["numpy==1.20.0\n"]
+    write_json(result, str(datadir / "pypi-tensorflow-1.15.0-python-cp36.json"))
+    run_import(import_results, monkeypatch, "--dir", caliper, "--database", database)
+    assert count_rows(store) == {"builds": 3, "tests": 4, "requirements": 4}
+    pins = store.db.execute(
+        "SELECT name, pin FROM requirements WHERE version='1.15.0'"
+    ).fetchall()
+    assert pins == [("numpy", "1.20.0")]
+    store.close()
+
+
+def test_import_results_package(tmp_path, datadir, import_results, monkeypatch):
+    caliper = str(tmp_path / ".caliper")
+    run_import(import_results, monkeypatch, "--dir", caliper, "--package", "six")
+    store = ResultStore(os.path.join(caliper, "results.db"))
+    assert count_rows(store) == {"builds": 0, "tests": 0, "requirements": 0}
+    store.close()
+
+
+@pytest.mark.parametrize(
+    "requirement,parsed",
+    [
+        ("numpy==1.19.5", ("numpy", "1.19.5")),
+        ("Six == 1.15.0\n", ("six", "1.15.0")),
+        ("pkg===1.0", ("pkg", "1.0")),
+        ("tensorflow @ file:///tmp/tf.whl", ("tensorflow", "file:///tmp/tf.whl")),
+        ("numpy", ("numpy", None)),
+        ("requests>=2.0,<3", ("requests", ">=2.0,<3")),
+        ("requests >= 2.0, < 3", ("requests", ">=2.0,<3")),
+        ("Keras~=2.4", ("keras", "~=2.4")),
+        ("tensorflow[gpu]==1.15.0", ("tensorflow", "1.15.0")),
+        ("requests[security, socks]>=2.0", ("requests", ">=2.0")),
+        ('dataclasses==0.8; python_version < "3.7"', ("dataclasses", "0.8")),
+        ("enum34 ; python_version<'3.4'", ("enum34", None)),
+        (
+            "pkg[extra] @ https://host/pkg.whl ; sys_platform == 'linux'",
+            ("pkg", "https://host/pkg.whl"),
+        ),
+        ("zope.interface==5.2.0", ("zope.interface", "5.2.0")),
+        (
+            "-e git+https://host/repo.git#egg=repo",
+            ("-e git+https://host/repo.git#egg=repo", None),
+        ),
+    ],
+)
+def test_parse_requirement(requirement, parsed):
+    assert parse_requirement(requirement) == parsed
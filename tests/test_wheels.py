@@ -0,0 +1,80 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from caliper_analysis.wheels import check_release, find_release, parse_wheel_tags
+
+import pytest
+
+
+def release(filename, python_version="cp36"):
+    return {"filename": filename, "python_version": python_version}
+
+
+def test_parse_wheel_tags():
+    tags = parse_wheel_tags("numpy-1.19.5-cp36-cp36m-manylinux2010_x86_64.whl")
+    assert tags == {
+        "python": {"cp36"},
+        "abi": {"cp36m"},
+        "platform": {"manylinux2010_x86_64"},
+    }
+
+
+def test_parse_wheel_tags_compressed_and_build():
+    tags = parse_wheel_tags("six-1.0-1-py2.py3-none-any.whl")
+    assert tags["python"] == {"py2", "py3"}
+    assert tags["abi"] == {"none"}
+    assert tags["platform"] == {"any"}
+
+
+@pytest.mark.parametrize(
+    "filename", ["numpy-1.19.5.tar.gz", "bad-cp36-cp36m.whl", "numpy-1.19.5.zip"]
+)
+def test_parse_wheel_tags_not_a_wheel(filename):
+    assert parse_wheel_tags(filename) is None
+
+
+@pytest.mark.parametrize(
+    "filename,python_version",
+    [
+        ("tf-1.0-cp36-cp36m-manylinux1_x86_64.whl", "cp36"),
+        ("tf-1.0-cp27-cp27mu-manylinux1_x86_64.whl", "cp27"),
+        ("tf-1.0-cp38-cp38-manylinux2010_x86_64.whl", "cp38"),
+        ("tf-1.0-cp36-abi3-manylinux2014_x86_64.whl", "cp36"),
+        ("six-1.0-py2.py3-none-any.whl", "cp37"),
+        ("tf-1.0.tar.gz", "cp39"),
+    ],
+)
+def test_check_release_supported(filename, python_version):
+    assert check_release(release(filename), python_version) is None
+
+
+@pytest.mark.parametrize(
+    "filename,python_version,reason",
+    [
+        ("tf-1.0-cp36-cp36m-manylinux1_x86_64.whl", "cp37", "python tag"),
+        ("tf-1.0-cp27-cp27m-manylinux1_x86_64.whl", "cp27", "abi tag"),
+        ("tf-1.0-cp38-cp38m-manylinux1_x86_64.whl", "cp38", "abi tag"),
+        ("tf-1.0-cp36-cp36m-macosx_10_9_x86_64.whl", "cp36", "platform tag"),
+        ("tf-1.0-cp36-cp36m-manylinux2014_aarch64.whl", "cp36", "platform tag"),
+    ],
+)
+def test_check_release_unsupported(filename, python_version, reason):
+    assert check_release(release(filename), python_version).startswith(reason)
+
+
+def test_find_release_prefers_python_version():
+    releases = [
+        release("tf-1.0-py3-none-any.whl", "py3"),
+        release("tf-1.0-cp36-cp36m-manylinux1_x86_64.whl", "cp36"),
+    ]
+    found, reasons = find_release(releases, "cp36")
+    assert found["filename"] == "tf-1.0-cp36-cp36m-manylinux1_x86_64.whl"
+    assert reasons == []
+
+
+def test_find_release_without_compatible_wheel():
+    releases = [release("tf-1.0-cp36-cp36m-macosx_10_9_x86_64.whl", "cp36")]
+    found, reasons = find_release(releases, "cp36")
+    assert found is None
+    assert len(reasons) == 1